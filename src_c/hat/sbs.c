@@ -1,3 +1,4 @@
+#include <stdlib.h>
 #include <string.h>
 #include "sbs.h"
 
@@ -19,6 +20,35 @@ static void swap_endians(uint8_t *data, size_t data_len) {
 }
 
 
+int hat_sbs_buff_reserve(hat_buff_t *buff, size_t size) {
+    if (buff->size - buff->pos >= size)
+        return HAT_SBS_SUCCESS;
+
+    if (SIZE_MAX - buff->pos < size)
+        return HAT_SBS_ERROR;
+
+    size_t new_size = (buff->size ? buff->size : HAT_SBS_BUFF_MIN_SIZE);
+    while (new_size - buff->pos < size)
+        new_size = (new_size > SIZE_MAX / 2 ? buff->pos + size : new_size * 2);
+
+    uint8_t *data = realloc(buff->data, new_size);
+    if (!data)
+        return HAT_SBS_ERROR;
+
+    buff->data = data;
+    buff->size = new_size;
+    return HAT_SBS_SUCCESS;
+}
+
+
+void hat_sbs_buff_free(hat_buff_t *buff) {
+    free(buff->data);
+    buff->data = NULL;
+    buff->size = 0;
+    buff->pos = 0;
+}
+
+
 size_t hat_sbs_encode_boolean(hat_buff_t *buff, bool value) {
     if (!hat_buff_available(buff))
         return 1;
@@ -49,6 +79,48 @@ size_t hat_sbs_encode_integer(hat_buff_t *buff, int64_t value) {
 }
 
 
+size_t hat_sbs_encode_bigint(hat_buff_t *buff, const uint8_t *value,
+                             size_t value_len) {
+    // value is little endian two's complement
+    bool sign = value_len && (value[value_len - 1] & 0x80);
+    uint8_t sign_byte = (sign ? 0xFF : 0x00);
+
+    // number of significant bits (without sign bit)
+    size_t bits = value_len;
+    while (bits && value[bits - 1] == sign_byte)
+        bits -= 1;
+    if (bits) {
+        uint8_t last = value[bits - 1] ^ sign_byte;
+        bits = (bits - 1) * 8;
+        for (; last; last >>= 1)
+            bits += 1;
+    }
+
+    size_t size = bits / 7 + 1;
+    if (hat_buff_available(buff) < size)
+        return size;
+
+    uint32_t acc = 0;
+    size_t acc_bits = 0;
+    size_t i = 0;
+    for (size_t j = 0; j < size; ++j) {
+        while (acc_bits < 7) {
+            acc |= (uint32_t)(i < value_len ? value[i] : sign_byte)
+                   << acc_bits;
+            acc_bits += 8;
+            i += 1;
+        }
+        buff->data[buff->pos + size - j - 1] =
+            (j == 0 ? 0x80 : 0x00) | (acc & 0x7F);
+        acc >>= 7;
+        acc_bits -= 7;
+    }
+
+    buff->pos += size;
+    return HAT_SBS_SUCCESS;
+}
+
+
 size_t hat_sbs_encode_float(hat_buff_t *buff, double value) {
     if (hat_buff_available(buff) < 8)
         return 8;
@@ -97,16 +169,58 @@ int hat_sbs_decode_boolean(hat_buff_t *buff, bool *value) {
 
 int hat_sbs_decode_integer(hat_buff_t *buff, int64_t *value) {
     size_t available = hat_buff_available(buff);
+    if (!available)
+        return HAT_SBS_ERROR;
+
+    uint8_t first = buff->data[buff->pos] & 0x7F;
+    uint64_t v = ((first & 0x40) ? UINT64_MAX : 0);
     size_t size = 1;
-    *value = ((available && (buff->data[buff->pos] & 0x40)) ? -1 : 0);
     for (;;) {
-        if (size > available)
+        if (size > available || size > HAT_SBS_INTEGER_MAX_SIZE)
             return HAT_SBS_ERROR;
-        *value = (*value << 7) | (buff->data[buff->pos + size - 1] & 0x7F);
+        v = (v << 7) | (buff->data[buff->pos + size - 1] & 0x7F);
         if (buff->data[buff->pos + size - 1] & 0x80)
             break;
         size += 1;
     }
+
+    // values which don't fit into int64_t
+    if (size == HAT_SBS_INTEGER_MAX_SIZE && first != 0x00 && first != 0x7F)
+        return HAT_SBS_ERROR;
+
+    *value = (int64_t)v;
+    buff->pos += size;
+    return HAT_SBS_SUCCESS;
+}
+
+
+int hat_sbs_decode_bigint(hat_buff_t *buff, uint8_t *value, size_t value_len) {
+    // value is little endian two's complement
+    size_t size = hat_sbs_get_integer_size(buff);
+    if (!size)
+        return HAT_SBS_ERROR;
+
+    bool sign = buff->data[buff->pos] & 0x40;
+    uint32_t acc = 0;
+    size_t acc_bits = 0;
+    size_t i = 0;
+    for (size_t j = size; j > 0 && i < value_len; --j) {
+        acc |= (uint32_t)(buff->data[buff->pos + j - 1] & 0x7F) << acc_bits;
+        acc_bits += 7;
+        while (acc_bits >= 8 && i < value_len) {
+            value[i++] = acc & 0xFF;
+            acc >>= 8;
+            acc_bits -= 8;
+        }
+    }
+
+    if (sign)
+        acc |= ~(uint32_t)0 << acc_bits;
+    for (; i < value_len; ++i) {
+        value[i] = acc & 0xFF;
+        acc = (sign ? 0xFF : 0x00);
+    }
+
     buff->pos += size;
     return HAT_SBS_SUCCESS;
 }
@@ -160,3 +274,32 @@ int hat_sbs_decode_choice_header(hat_buff_t *buff, size_t *id) {
     *id = temp_id;
     return HAT_SBS_SUCCESS;
 }
+
+
+int hat_sbs_skip_integer(hat_buff_t *buff) {
+    size_t available = hat_buff_available(buff);
+    for (size_t size = 1; size <= available; ++size) {
+        if (buff->data[buff->pos + size - 1] & 0x80) {
+            buff->pos += size;
+            return HAT_SBS_SUCCESS;
+        }
+    }
+    return HAT_SBS_ERROR;
+}
+
+
+size_t hat_sbs_get_integer_size(hat_buff_t *buff) {
+    size_t pos = buff->pos;
+    if (hat_sbs_skip_integer(buff))
+        return 0;
+    size_t size = buff->pos - pos;
+    buff->pos = pos;
+    return size;
+}
+
+
+int hat_sbs_skip_bytes(hat_buff_t *buff) {
+    uint8_t *value;
+    size_t value_len;
+    return hat_sbs_decode_bytes(buff, &value, &value_len);
+}
@@ -8,13 +8,24 @@
 #define HAT_SBS_SUCCESS 0
 #define HAT_SBS_ERROR (-1)
 
+#define HAT_SBS_BUFF_MIN_SIZE 64
+
+// maximum encoded integer size which can be decoded as int64_t (first
+// group of maximum size integer can contain only sign bits)
+#define HAT_SBS_INTEGER_MAX_SIZE 10
+
 
 #ifdef __cplusplus
 extern "C" {
 #endif
 
+int hat_sbs_buff_reserve(hat_buff_t *buff, size_t size);
+void hat_sbs_buff_free(hat_buff_t *buff);
+
 size_t hat_sbs_encode_boolean(hat_buff_t *buff, bool value);
 size_t hat_sbs_encode_integer(hat_buff_t *buff, int64_t value);
+size_t hat_sbs_encode_bigint(hat_buff_t *buff, const uint8_t *value,
+                             size_t value_len);
 size_t hat_sbs_encode_float(hat_buff_t *buff, double value);
 size_t hat_sbs_encode_string(hat_buff_t *buff, uint8_t *value,
                              size_t value_len);
@@ -24,12 +35,17 @@ size_t hat_sbs_encode_choice_header(hat_buff_t *buff, size_t id);
 
 int hat_sbs_decode_boolean(hat_buff_t *buff, bool *value);
 int hat_sbs_decode_integer(hat_buff_t *buff, int64_t *value);
+int hat_sbs_decode_bigint(hat_buff_t *buff, uint8_t *value, size_t value_len);
 int hat_sbs_decode_float(hat_buff_t *buff, double *value);
 int hat_sbs_decode_string(hat_buff_t *buff, uint8_t **value, size_t *value_len);
 int hat_sbs_decode_bytes(hat_buff_t *buff, uint8_t **value, size_t *value_len);
 int hat_sbs_decode_array_header(hat_buff_t *buff, size_t *len);
 int hat_sbs_decode_choice_header(hat_buff_t *buff, size_t *id);
 
+int hat_sbs_skip_integer(hat_buff_t *buff);
+size_t hat_sbs_get_integer_size(hat_buff_t *buff);
+int hat_sbs_skip_bytes(hat_buff_t *buff);
+
 #ifdef __cplusplus
 }
 #endif
@@ -13,136 +13,259 @@ typedef struct {
     PyObject *common_ArrayType;
     PyObject *common_RecordType;
     PyObject *common_ChoiceType;
+    PyObject *Program;
+    PyObject *Projection;
+    PyObject *Codec;
 } module_state_t;
 
 
-static ssize_t encode_generic(hat_buff_t *buff, module_state_t *module_state,
-                              PyObject *refs, PyObject *t, PyObject *value);
-static PyObject *decode_generic(hat_buff_t *buff, module_state_t *module_state,
-                                PyObject *refs, PyObject *t);
+typedef enum {
+    OP_NONE = 0,
+    OP_BOOLEAN,
+    OP_INTEGER,
+    OP_FLOAT,
+    OP_STRING,
+    OP_BYTES,
+    OP_ARRAY,
+    OP_RECORD,
+    OP_CHOICE,
+    OP_REF,
+    OP_UNRESOLVED
+} op_t;
 
+#define SIMPLE_NODES_LEN (OP_BYTES + 1)
 
-static inline bool is_type(PyObject *inst, PyObject *cls) {
-    return Py_TYPE(inst) == (PyTypeObject *)cls;
-}
 
-// HACK replace with PyObject_GetBuffer (stable abi 3.11)
-int PyObject_AsReadBuffer(PyObject *obj, const void **buffer,
-                          Py_ssize_t *buffer_len);
+typedef struct node_t node_t;
 
-static inline int get_legacy_buffer(PyObject *obj, void **buffer,
-                                    Py_ssize_t *buffer_len) {
-#pragma GCC diagnostic push
-#pragma GCC diagnostic ignored "-Wdeprecated-declarations"
-    return PyObject_AsReadBuffer(obj, (const void **)buffer, buffer_len);
-#pragma GCC diagnostic pop
-}
+typedef struct {
+    // borrowed - owned by program's refs or type
+    PyObject *name;
+    node_t *type;
+    size_t type_index;
+} entry_t;
 
+struct node_t {
+    op_t op;
 
-static PyObject *resolve_ref(module_state_t *module_state, PyObject *refs,
-                             PyObject *t) {
-    while (is_type(t, module_state->common_Ref)) {
-        t = PyObject_GetItem(refs, t);
-        if (!t)
-            return NULL;
-        Py_DECREF(t);
-    }
-    return t;
-}
+    // OP_ARRAY item type or OP_REF target
+    node_t *t;
+    size_t t_index;
 
+    // OP_RECORD and OP_CHOICE entries
+    entry_t *entries;
+    size_t entries_index;
+    size_t entries_len;
 
-static ssize_t encode_none() { return 0; }
+    // OP_CHOICE dict[str, int] mapping entry names to entry ids (NULL if
+    // choice has less than CHOICE_IDS_MIN_LEN entries)
+    PyObject *entry_ids;
 
+    // OP_RECORD tuple subclass used for decoded values (NULL if records
+    // are decoded as dicts)
+    PyObject *record_class;
 
-static ssize_t encode_boolean(hat_buff_t *buff, PyObject *value) {
-    int v = PyObject_IsTrue(value);
-    return hat_sbs_encode_boolean(buff, v);
-}
+    // OP_ARRAY array.array type used for decoded values of Boolean, Integer
+    // and Float items (NULL if arrays are decoded as lists) - borrowed,
+    // owned by program
+    PyObject *array_type;
 
+    // OP_UNRESOLVED ref
+    PyObject *ref;
 
-static ssize_t encode_integer(hat_buff_t *buff, PyObject *value) {
-    long long v = PyLong_AsLongLong(value);
-    if (v == -1 && PyErr_Occurred())
-        return -1;
-    return hat_sbs_encode_integer(buff, v);
-}
+    // encoded size if all values have same encoded size, otherwise -1
+    ssize_t fixed_size;
+};
 
+#define FIXED_SIZE_VARIABLE (-1)
+#define FIXED_SIZE_UNKNOWN (-2)
 
-static ssize_t encode_float(hat_buff_t *buff, PyObject *value) {
-    double v = PyFloat_AsDouble(value);
-    if (v == -1.0 && PyErr_Occurred())
-        return -1;
-    return hat_sbs_encode_float(buff, v);
-}
+// minimal number of choice entries searched by entry name lookup instead
+// of linear entry name comparison
+#define CHOICE_IDS_MIN_LEN 8
 
+typedef struct {
+    PyObject_HEAD
 
-static ssize_t encode_string(hat_buff_t *buff, PyObject *value) {
-    Py_ssize_t v_len;
-    const char *v = PyUnicode_AsUTF8AndSize(value, &v_len);
-    if (!v)
-        return -1;
+    // compiled refs and type (for single type programs)
+    PyObject *refs;
+    PyObject *type;
 
-    return hat_sbs_encode_string(buff, (uint8_t *)v, v_len);
-}
+    // dict[int, type] mapping ids of record types to record classes (NULL
+    // if records are decoded as dicts)
+    PyObject *record_classes;
 
+    // array.array type (NULL if arrays are decoded as lists)
+    PyObject *array_type;
 
-static ssize_t encode_bytes(hat_buff_t *buff, PyObject *value) {
-    char *v;
-    Py_ssize_t v_len;
-    if (PyBytes_AsStringAndSize(value, &v, &v_len) == -1)
-        return -1;
-    return hat_sbs_encode_bytes(buff, (uint8_t *)v, v_len);
-}
+    // dict[Ref, int] mapping refs to node indexes
+    PyObject *ref_nodes;
 
+    // dict[int, int] mapping ids of compiled array, record and choice types
+    // to node indexes
+    PyObject *type_nodes;
 
-static ssize_t encode_array(hat_buff_t *buff, module_state_t *module_state,
-                            PyObject *refs, PyObject *t, PyObject *value) {
-    size_t init_buff_pos = (buff ? buff->pos : 0);
+    node_t *root;
 
-    Py_ssize_t len = PyList_Size(value);
-    if (len < 0)
-        return -1;
+    node_t *nodes;
+    size_t nodes_len;
+    size_t nodes_size;
 
-    PyObject *item_type = PyObject_GetAttrString(t, "t");
-    if (!item_type)
-        return -1;
-    Py_DECREF(item_type);
+    entry_t *entries;
+    size_t entries_len;
+    size_t entries_size;
+} program_t;
 
-    size_t result = hat_sbs_encode_array_header(buff, len);
 
-    for (size_t i = 0; i < len; ++i) {
-        PyObject *item = PyList_GetItem(value, i);
-        if (!item) {
-            if (buff)
-                buff->pos = init_buff_pos;
+typedef struct projection_node_t projection_node_t;
+
+struct projection_node_t {
+    node_t *node;
+
+    // NULL if node is decoded entirely, otherwise OP_ARRAY item projection
+    // or OP_RECORD and OP_CHOICE entry projections (NULL if entry is skipped)
+    projection_node_t **children;
+    size_t children_len;
+};
+
+typedef struct {
+    PyObject_HEAD
+
+    program_t *program;
+    projection_node_t *root;
+} projection_t;
+
+typedef struct {
+    PyObject_HEAD
+
+    program_t *program;
+    node_t *root;
+} codec_t;
+
+// maximum size of frame length header (62 bit length)
+#define FRAME_HEADER_MAX_SIZE 9
+
+// minimal size of Bytes and String payloads copied without holding GIL
+#define RELEASE_GIL_MIN_SIZE 0x10000
+
+#define ENCODER_INITIAL_SIZE 256
+
+typedef struct {
+    // growable buffer - data is initial_data or allocated with
+    // hat_sbs_buff_reserve (if not fixed)
+    hat_buff_t buff;
+    uint8_t initial_data[ENCODER_INITIAL_SIZE];
+
+    // fixed size buffer provided by caller
+    bool fixed;
+    bool overflow;
+
+    // list of encoded segments (NULL if value is encoded into single
+    // buffer) - Bytes payloads of at least min_ref_size bytes are added to
+    // segments by reference
+    PyObject *segments;
+    size_t min_ref_size;
+} encoder_t;
+
+
+typedef struct {
+    hat_buff_t buff;
+
+    // decoded data memoryview (only in zero copy mode)
+    PyObject *data;
+} decoder_t;
+
+
+static int encode_node(encoder_t *encoder, node_t *node, PyObject *value);
+static PyObject *decode_node(decoder_t *decoder, node_t *node);
+static ssize_t compile_type(module_state_t *module_state, program_t *program,
+                            PyObject *t);
+
+
+static inline bool is_type(PyObject *inst, PyObject *cls) {
+    return Py_TYPE(inst) == (PyTypeObject *)cls;
+}
+
+static ssize_t add_node(program_t *program, op_t op) {
+    if (program->nodes_len >= program->nodes_size) {
+        size_t size = (program->nodes_size ? program->nodes_size * 2 : 16);
+        node_t *nodes = PyMem_Realloc(program->nodes, size * sizeof(node_t));
+        if (!nodes) {
+            PyErr_NoMemory();
             return -1;
         }
+        program->nodes = nodes;
+        program->nodes_size = size;
+    }
+
+    program->nodes[program->nodes_len] = (node_t){.op = op};
+    return program->nodes_len++;
+}
+
 
-        hat_buff_t *item_buff = (result ? NULL : buff);
-        ssize_t item_result =
-            encode_generic(item_buff, module_state, refs, item_type, item);
-        if (item_result < 0) {
-            if (buff)
-                buff->pos = init_buff_pos;
+static ssize_t add_entries(program_t *program, size_t len) {
+    if (program->entries_len + len > program->entries_size) {
+        size_t size = (program->entries_size ? program->entries_size : 16);
+        while (size < program->entries_len + len)
+            size *= 2;
+        entry_t *entries =
+            PyMem_Realloc(program->entries, size * sizeof(entry_t));
+        if (!entries) {
+            PyErr_NoMemory();
             return -1;
         }
-
-        result += item_result;
+        program->entries = entries;
+        program->entries_size = size;
     }
 
-    if (buff && result) {
-        result += buff->pos - init_buff_pos;
-        buff->pos = init_buff_pos;
+    size_t index = program->entries_len;
+    program->entries_len += len;
+    return index;
+}
+
+
+static ssize_t compile_ref(module_state_t *module_state, program_t *program,
+                           PyObject *ref) {
+    PyObject *index_obj = PyDict_GetItemWithError(program->ref_nodes, ref);
+    if (index_obj)
+        return PyLong_AsSsize_t(index_obj);
+    if (PyErr_Occurred())
+        return -1;
+
+    ssize_t index = add_node(program, OP_REF);
+    if (index < 0)
+        return -1;
+
+    index_obj = PyLong_FromSsize_t(index);
+    if (!index_obj)
+        return -1;
+    int err = PyDict_SetItem(program->ref_nodes, ref, index_obj);
+    Py_DECREF(index_obj);
+    if (err)
+        return -1;
+
+    PyObject *t = PyDict_GetItemWithError(program->refs, ref);
+    if (!t) {
+        if (PyErr_Occurred())
+            return -1;
+        Py_INCREF(ref);
+        program->nodes[index].op = OP_UNRESOLVED;
+        program->nodes[index].ref = ref;
+        return index;
     }
 
-    return result;
-}
+    ssize_t t_index = compile_type(module_state, program, t);
+    if (t_index < 0)
+        return -1;
 
+    program->nodes[index].t_index = t_index;
+    return index;
+}
 
-static ssize_t encode_record(hat_buff_t *buff, module_state_t *module_state,
-                             PyObject *refs, PyObject *t, PyObject *value) {
-    size_t init_buff_pos = (buff ? buff->pos : 0);
 
+static ssize_t compile_entries(module_state_t *module_state,
+                               program_t *program, ssize_t index,
+                               PyObject *t) {
     PyObject *t_entries = PyObject_GetAttrString(t, "entries");
     if (!t_entries)
         return -1;
@@ -152,449 +275,3346 @@ static ssize_t encode_record(hat_buff_t *buff, module_state_t *module_state,
     if (size < 0)
         return -1;
 
-    size_t result = 0;
+    ssize_t entries_index = add_entries(program, size);
+    if (entries_index < 0)
+        return -1;
+
+    program->nodes[index].entries_index = entries_index;
+    program->nodes[index].entries_len = size;
 
     for (size_t i = 0; i < size; ++i) {
         PyObject *entry_name_type = PyList_GetItem(t_entries, i);
-        if (!entry_name_type) {
-            if (buff)
-                buff->pos = init_buff_pos;
+        if (!entry_name_type)
             return -1;
-        }
 
         PyObject *entry_name = PyTuple_GetItem(entry_name_type, 0);
         PyObject *entry_type = PyTuple_GetItem(entry_name_type, 1);
-        if (!entry_name || !entry_type) {
-            if (buff)
-                buff->pos = init_buff_pos;
+        if (!entry_name || !entry_type)
             return -1;
-        }
 
-        PyObject *entry = PyDict_GetItem(value, entry_name);
-        if (!entry) {
-            if (buff)
-                buff->pos = init_buff_pos;
+        if (!PyUnicode_Check(entry_name)) {
+            PyErr_SetString(PyExc_ValueError, "invalid entry name");
             return -1;
         }
 
-        hat_buff_t *entry_buff = (result ? NULL : buff);
-        ssize_t entry_result =
-            encode_generic(entry_buff, module_state, refs, entry_type, entry);
-        if (entry_result < 0) {
-            if (buff)
-                buff->pos = init_buff_pos;
+        ssize_t type_index = compile_type(module_state, program, entry_type);
+        if (type_index < 0)
             return -1;
-        }
 
-        result += entry_result;
+        program->entries[entries_index + i] =
+            (entry_t){.name = entry_name, .type_index = type_index};
     }
 
-    if (buff && result) {
-        result += buff->pos - init_buff_pos;
-        buff->pos = init_buff_pos;
+    if (program->nodes[index].op != OP_CHOICE || size < CHOICE_IDS_MIN_LEN)
+        return index;
+
+    PyObject *entry_ids = PyDict_New();
+    if (!entry_ids)
+        return -1;
+
+    // nodes can be reallocated during entry types compilation
+    program->nodes[index].entry_ids = entry_ids;
+
+    // reverse order - first of duplicate entry names is used
+    for (size_t i = size; i > 0; --i) {
+        PyObject *entry_id = PyLong_FromSize_t(i - 1);
+        if (!entry_id)
+            return -1;
+
+        int err = PyDict_SetItem(
+            entry_ids, program->entries[entries_index + i - 1].name,
+            entry_id);
+        Py_DECREF(entry_id);
+        if (err)
+            return -1;
     }
 
-    return result;
+    return index;
 }
 
 
-static ssize_t encode_choice(hat_buff_t *buff, module_state_t *module_state,
-                             PyObject *refs, PyObject *t, PyObject *value) {
-    PyObject *t_entries = PyObject_GetAttrString(t, "entries");
-    if (!t_entries)
+static ssize_t compile_type(module_state_t *module_state, program_t *program,
+                            PyObject *t) {
+    if (is_type(t, module_state->common_Ref))
+        return compile_ref(module_state, program, t);
+
+    if (is_type(t, module_state->common_NoneType))
+        return OP_NONE;
+
+    if (is_type(t, module_state->common_BooleanType))
+        return OP_BOOLEAN;
+
+    if (is_type(t, module_state->common_IntegerType))
+        return OP_INTEGER;
+
+    if (is_type(t, module_state->common_FloatType))
+        return OP_FLOAT;
+
+    if (is_type(t, module_state->common_StringType))
+        return OP_STRING;
+
+    if (is_type(t, module_state->common_BytesType))
+        return OP_BYTES;
+
+    if (!is_type(t, module_state->common_ArrayType) &&
+        !is_type(t, module_state->common_RecordType) &&
+        !is_type(t, module_state->common_ChoiceType)) {
+        PyErr_SetString(PyExc_ValueError, "unsupported type");
         return -1;
-    Py_DECREF(t_entries);
+    }
 
-    Py_ssize_t size = PyList_Size(t_entries);
-    if (size < 0)
+    PyObject *id = PyLong_FromVoidPtr(t);
+    if (!id)
         return -1;
 
-    if (!size)
-        return 0;
+    PyObject *index_obj = PyDict_GetItemWithError(program->type_nodes, id);
+    if (index_obj) {
+        Py_DECREF(id);
+        return PyLong_AsSsize_t(index_obj);
+    }
+    if (PyErr_Occurred()) {
+        Py_DECREF(id);
+        return -1;
+    }
 
-    PyObject *entry_name = PyTuple_GetItem(value, 0);
-    if (!entry_name)
+    index_obj = PyLong_FromSize_t(program->nodes_len);
+    if (!index_obj) {
+        Py_DECREF(id);
         return -1;
+    }
 
-    PyObject *entry = PyTuple_GetItem(value, 1);
-    if (!entry)
+    int err = PyDict_SetItem(program->type_nodes, id, index_obj);
+    Py_DECREF(index_obj);
+    Py_DECREF(id);
+    if (err)
         return -1;
 
-    size_t id;
-    PyObject *entry_type = NULL;
-    for (id = 0; id < size; ++id) {
-        PyObject *temp = PyList_GetItem(t_entries, id);
-        if (!temp)
+    if (is_type(t, module_state->common_ArrayType)) {
+        PyObject *item_type = PyObject_GetAttrString(t, "t");
+        if (!item_type)
+            return -1;
+        Py_DECREF(item_type);
+
+        ssize_t index = add_node(program, OP_ARRAY);
+        if (index < 0)
             return -1;
 
-        PyObject *temp_name = PyTuple_GetItem(temp, 0);
-        if (!temp_name)
+        ssize_t t_index = compile_type(module_state, program, item_type);
+        if (t_index < 0)
             return -1;
 
-        if (PyUnicode_Compare(entry_name, temp_name)) {
-            if (PyErr_Occurred())
+        program->nodes[index].t_index = t_index;
+        return index;
+    }
+
+    if (is_type(t, module_state->common_RecordType)) {
+        ssize_t index = add_node(program, OP_RECORD);
+        if (index < 0)
+            return -1;
+
+        if (program->record_classes) {
+            PyObject *id = PyLong_FromVoidPtr(t);
+            if (!id)
                 return -1;
-            continue;
+
+            PyObject *record_class =
+                PyDict_GetItemWithError(program->record_classes, id);
+            Py_DECREF(id);
+            if (!record_class && PyErr_Occurred())
+                return -1;
+
+            if (record_class &&
+                !(PyType_Check(record_class) &&
+                  PyType_IsSubtype((PyTypeObject *)record_class,
+                                   &PyTuple_Type))) {
+                PyErr_SetString(PyExc_TypeError,
+                                "record class must be tuple subclass");
+                return -1;
+            }
+
+            Py_XINCREF(record_class);
+            program->nodes[index].record_class = record_class;
         }
 
-        entry_type = PyTuple_GetItem(temp, 1);
-        if (!entry_type)
-            return -1;
-        break;
+        return compile_entries(module_state, program, index, t);
     }
-    if (!entry_type)
+
+    ssize_t index = add_node(program, OP_CHOICE);
+    if (index < 0)
         return -1;
+    return compile_entries(module_state, program, index, t);
+}
 
-    size_t init_buff_pos = (buff ? buff->pos : 0);
 
-    size_t result = hat_sbs_encode_choice_header(buff, id);
+static inline bool is_typed_array_item(node_t *node) {
+    return node->op == OP_BOOLEAN || node->op == OP_INTEGER ||
+           node->op == OP_FLOAT;
+}
 
-    hat_buff_t *entry_buff = (result ? NULL : buff);
-    ssize_t entry_result =
-        encode_generic(entry_buff, module_state, refs, entry_type, entry);
-    if (entry_result < 0) {
-        if (buff)
-            buff->pos = init_buff_pos;
-        return -1;
+
+static size_t resolve_ref_index(program_t *program, size_t index) {
+    for (size_t i = 0; i < program->nodes_len; ++i) {
+        if (program->nodes[index].op != OP_REF)
+            return index;
+        index = program->nodes[index].t_index;
     }
-    result += entry_result;
 
-    if (buff && result) {
-        result += buff->pos - init_buff_pos;
-        buff->pos = init_buff_pos;
+    // recursive alias
+    return program->nodes_len;
+}
+
+
+static ssize_t get_fixed_size(node_t *node) {
+    if (node->fixed_size != FIXED_SIZE_UNKNOWN)
+        return node->fixed_size;
+
+    // recursive types have variable size
+    node->fixed_size = FIXED_SIZE_VARIABLE;
+
+    ssize_t fixed_size = FIXED_SIZE_VARIABLE;
+
+    switch (node->op) {
+    case OP_NONE:
+        fixed_size = 0;
+        break;
+
+    case OP_BOOLEAN:
+        fixed_size = 1;
+        break;
+
+    case OP_FLOAT:
+        fixed_size = 8;
+        break;
+
+    case OP_REF:
+        fixed_size = get_fixed_size(node->t);
+        break;
+
+    case OP_RECORD:
+        fixed_size = 0;
+        for (size_t i = 0; i < node->entries_len; ++i) {
+            ssize_t entry_size = get_fixed_size(node->entries[i].type);
+            if (entry_size < 0) {
+                fixed_size = FIXED_SIZE_VARIABLE;
+                break;
+            }
+            fixed_size += entry_size;
+        }
+        break;
+
+    case OP_CHOICE:
+        if (!node->entries_len)
+            fixed_size = 0;
+        break;
+
+    default:
+        break;
     }
 
-    return result;
+    node->fixed_size = fixed_size;
+    return fixed_size;
 }
 
 
-static PyObject *decode_none() {
-    Py_INCREF(Py_None);
-    return Py_None;
+static int link_program(program_t *program) {
+    for (size_t i = 0; i < program->nodes_len; ++i) {
+        node_t *node = program->nodes + i;
+        if (node->op != OP_REF)
+            continue;
+
+        size_t t_index = resolve_ref_index(program, i);
+        if (t_index >= program->nodes_len) {
+            node->op = OP_UNRESOLVED;
+            continue;
+        }
+
+        node->t_index = t_index;
+    }
+
+    for (size_t i = 0; i < program->nodes_len; ++i) {
+        node_t *node = program->nodes + i;
+
+        if (node->op == OP_ARRAY || node->op == OP_REF)
+            node->t = program->nodes + resolve_ref_index(program, node->t_index);
+
+        if (node->op == OP_ARRAY && is_typed_array_item(node->t))
+            node->array_type = program->array_type;
+
+        if (node->op == OP_RECORD || node->op == OP_CHOICE) {
+            node->entries = program->entries + node->entries_index;
+            for (size_t j = 0; j < node->entries_len; ++j) {
+                entry_t *entry = node->entries + j;
+                entry->type = program->nodes +
+                              resolve_ref_index(program, entry->type_index);
+            }
+        }
+
+        node->fixed_size = FIXED_SIZE_UNKNOWN;
+    }
+
+    for (size_t i = 0; i < program->nodes_len; ++i)
+        get_fixed_size(program->nodes + i);
+
+    return 0;
 }
 
 
-static PyObject *decode_boolean(hat_buff_t *buff) {
-    bool value;
-    if (hat_sbs_decode_boolean(buff, &value))
+static program_t *program_create(module_state_t *module_state,
+                                 PyObject *refs, PyObject *record_classes,
+                                 bool typed_arrays, PyObject *t) {
+    if (!PyDict_Check(refs)) {
+        PyErr_SetString(PyExc_TypeError, "refs must be dict");
         return NULL;
-    return PyBool_FromLong(value);
+    }
+
+    if (record_classes == Py_None)
+        record_classes = NULL;
+
+    if (record_classes && !PyDict_Check(record_classes)) {
+        PyErr_SetString(PyExc_TypeError, "record_classes must be dict");
+        return NULL;
+    }
+
+    program_t *program = (program_t *)PyType_GenericAlloc(
+        (PyTypeObject *)module_state->Program, 0);
+    if (!program)
+        return NULL;
+
+    ssize_t root_index = -1;
+
+    Py_INCREF(refs);
+    program->refs = refs;
+    Py_XINCREF(t);
+    program->type = t;
+    Py_XINCREF(record_classes);
+    program->record_classes = record_classes;
+
+    if (typed_arrays) {
+        PyObject *array_module = PyImport_ImportModule("array");
+        if (!array_module)
+            goto error;
+
+        program->array_type = PyObject_GetAttrString(array_module, "array");
+        Py_DECREF(array_module);
+        if (!program->array_type)
+            goto error;
+    }
+
+    program->ref_nodes = PyDict_New();
+    if (!program->ref_nodes)
+        goto error;
+
+    program->type_nodes = PyDict_New();
+    if (!program->type_nodes)
+        goto error;
+
+    for (op_t op = OP_NONE; op < SIMPLE_NODES_LEN; ++op)
+        if (add_node(program, op) < 0)
+            goto error;
+
+    if (t) {
+        root_index = compile_type(module_state, program, t);
+        if (root_index < 0)
+            goto error;
+
+    } else {
+        PyObject *ref;
+        PyObject *ref_type;
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(refs, &pos, &ref, &ref_type)) {
+            if (!is_type(ref, module_state->common_Ref))
+                continue;
+            if (compile_ref(module_state, program, ref) < 0)
+                goto error;
+        }
+    }
+
+    if (link_program(program))
+        goto error;
+
+    if (root_index >= 0)
+        program->root =
+            program->nodes + resolve_ref_index(program, root_index);
+
+    return program;
+
+error:
+    Py_DECREF((PyObject *)program);
+    return NULL;
 }
 
 
-static PyObject *decode_integer(hat_buff_t *buff) {
-    int64_t value;
-    if (hat_sbs_decode_integer(buff, &value))
+static node_t *program_get_node(program_t *program, PyObject *ref) {
+    PyObject *index_obj = PyDict_GetItemWithError(program->ref_nodes, ref);
+    if (!index_obj) {
+        if (!PyErr_Occurred())
+            PyErr_SetObject(PyExc_KeyError, ref);
         return NULL;
-    return PyLong_FromLongLong(value);
+    }
+
+    ssize_t index = PyLong_AsSsize_t(index_obj);
+    if (index < 0)
+        return NULL;
+
+    node_t *node = program->nodes + index;
+    return (node->op == OP_REF ? node->t : node);
 }
 
 
-static PyObject *decode_float(hat_buff_t *buff) {
-    double value;
-    if (hat_sbs_decode_float(buff, &value))
+static node_t *program_get_type_node(module_state_t *module_state,
+                                     program_t *program, PyObject *t) {
+    if (is_type(t, module_state->common_NoneType))
+        return program->nodes + OP_NONE;
+
+    if (is_type(t, module_state->common_BooleanType))
+        return program->nodes + OP_BOOLEAN;
+
+    if (is_type(t, module_state->common_IntegerType))
+        return program->nodes + OP_INTEGER;
+
+    if (is_type(t, module_state->common_FloatType))
+        return program->nodes + OP_FLOAT;
+
+    if (is_type(t, module_state->common_StringType))
+        return program->nodes + OP_STRING;
+
+    if (is_type(t, module_state->common_BytesType))
+        return program->nodes + OP_BYTES;
+
+    PyObject *id = PyLong_FromVoidPtr(t);
+    if (!id)
         return NULL;
-    return PyFloat_FromDouble(value);
+
+    PyObject *index_obj = PyDict_GetItemWithError(program->type_nodes, id);
+    Py_DECREF(id);
+    if (!index_obj)
+        return NULL;
+
+    ssize_t index = PyLong_AsSsize_t(index_obj);
+    if (index < 0)
+        return NULL;
+
+    return program->nodes + index;
+}
+
+
+static node_t *get_root(module_state_t *module_state, PyObject *refs,
+                        PyObject *t, program_t **temp_program) {
+    *temp_program = NULL;
+
+    if (is_type(refs, module_state->Program)) {
+        program_t *program = (program_t *)refs;
+
+        if (is_type(t, module_state->common_Ref))
+            return program_get_node(program, t);
+
+        // types contained in compiled refs are already compiled
+        node_t *node = program_get_type_node(module_state, program, t);
+        if (node || PyErr_Occurred())
+            return node;
+
+        *temp_program = program_create(
+            module_state, program->refs, program->record_classes,
+            program->array_type != NULL, t);
+
+    } else {
+        *temp_program = program_create(module_state, refs, NULL, false, t);
+    }
+
+    if (!*temp_program)
+        return NULL;
+
+    return (*temp_program)->root;
+}
+
+
+static int set_unresolved_error(node_t *node) {
+    if (node->ref) {
+        PyErr_Format(PyExc_ValueError, "unresolved ref %R", node->ref);
+    } else {
+        PyErr_SetString(PyExc_ValueError, "recursive ref");
+    }
+    return -1;
+}
+
+
+static void encoder_init(encoder_t *encoder) {
+    encoder->buff = (hat_buff_t){
+        .data = encoder->initial_data, .size = ENCODER_INITIAL_SIZE, .pos = 0};
+    encoder->fixed = false;
+    encoder->overflow = false;
+    encoder->segments = NULL;
+    encoder->min_ref_size = 0;
+}
+
+
+static void encoder_init_fixed(encoder_t *encoder, uint8_t *data, size_t size,
+                               size_t pos) {
+    encoder->buff = (hat_buff_t){.data = data, .size = size, .pos = pos};
+    encoder->fixed = true;
+    encoder->overflow = false;
+    encoder->segments = NULL;
+    encoder->min_ref_size = 0;
+}
+
+
+static void encoder_destroy(encoder_t *encoder) {
+    if (encoder->fixed || encoder->buff.data == encoder->initial_data)
+        return;
+
+    hat_sbs_buff_free(&(encoder->buff));
+}
+
+
+static int encoder_reserve(encoder_t *encoder, size_t size) {
+    if (hat_buff_available(&(encoder->buff)) >= size)
+        return 0;
+
+    if (encoder->fixed) {
+        encoder->overflow = true;
+        PyErr_SetString(PyExc_ValueError, "insufficient buffer size");
+        return -1;
+    }
+
+    hat_buff_t buff = encoder->buff;
+    if (buff.data == encoder->initial_data)
+        buff = (hat_buff_t){.data = NULL, .size = 0, .pos = 0};
+
+    if (hat_sbs_buff_reserve(&buff, encoder->buff.pos + size)) {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    if (encoder->buff.data == encoder->initial_data)
+        memcpy(buff.data, encoder->initial_data, encoder->buff.pos);
+
+    buff.pos = encoder->buff.pos;
+    encoder->buff = buff;
+    return 0;
+}
+
+
+// moves buffer content to new segment
+static int encoder_flush(encoder_t *encoder) {
+    if (!encoder->buff.pos)
+        return 0;
+
+    PyObject *segment = PyBytes_FromStringAndSize(
+        (const char *)encoder->buff.data, encoder->buff.pos);
+    if (!segment)
+        return -1;
+
+    int result = PyList_Append(encoder->segments, segment);
+    Py_DECREF(segment);
+
+    encoder->buff.pos = 0;
+    return result;
+}
+
+
+static int encode_boolean(encoder_t *encoder, PyObject *value) {
+    int v = PyObject_IsTrue(value);
+    if (v < 0)
+        return -1;
+
+    size_t size = hat_sbs_encode_boolean(&(encoder->buff), v);
+    if (!size)
+        return 0;
+
+    if (encoder_reserve(encoder, size))
+        return -1;
+    hat_sbs_encode_boolean(&(encoder->buff), v);
+    return 0;
+}
+
+
+static int encode_bigint(encoder_t *encoder, PyObject *value, int sign) {
+    // two's complement representation requires additional sign bit
+    PyObject *abs_value = (sign < 0 ? PyNumber_Invert(value) : value);
+    if (!abs_value)
+        return -1;
+
+    PyObject *bit_length = PyObject_CallMethod(abs_value, "bit_length", NULL);
+    if (sign < 0)
+        Py_DECREF(abs_value);
+    if (!bit_length)
+        return -1;
+
+    size_t bits = PyLong_AsSize_t(bit_length);
+    Py_DECREF(bit_length);
+    if (bits == (size_t)-1 && PyErr_Occurred())
+        return -1;
+
+    PyObject *to_bytes = PyObject_GetAttrString(value, "to_bytes");
+    if (!to_bytes)
+        return -1;
+
+    PyObject *args = Py_BuildValue("(ns)", (Py_ssize_t)(bits / 8 + 1),
+                                   "little");
+    PyObject *kwargs = Py_BuildValue("{sO}", "signed", Py_True);
+    PyObject *bytes = ((args && kwargs)
+                           ? PyObject_Call(to_bytes, args, kwargs)
+                           : NULL);
+    Py_XDECREF(kwargs);
+    Py_XDECREF(args);
+    Py_DECREF(to_bytes);
+    if (!bytes)
+        return -1;
+
+    char *v;
+    Py_ssize_t v_len;
+    int result = -1;
+    if (PyBytes_AsStringAndSize(bytes, &v, &v_len))
+        goto cleanup;
+
+    size_t size =
+        hat_sbs_encode_bigint(&(encoder->buff), (uint8_t *)v, v_len);
+    if (size) {
+        if (encoder_reserve(encoder, size))
+            goto cleanup;
+        hat_sbs_encode_bigint(&(encoder->buff), (uint8_t *)v, v_len);
+    }
+
+    result = 0;
+
+cleanup:
+    Py_DECREF(bytes);
+    return result;
+}
+
+
+static int encode_integer(encoder_t *encoder, PyObject *value) {
+    int overflow;
+    long long v = PyLong_AsLongLongAndOverflow(value, &overflow);
+    if (v == -1 && PyErr_Occurred())
+        return -1;
+
+    if (overflow)
+        return encode_bigint(encoder, value, overflow);
+
+    size_t size = hat_sbs_encode_integer(&(encoder->buff), v);
+    if (!size)
+        return 0;
+
+    if (encoder_reserve(encoder, size))
+        return -1;
+    hat_sbs_encode_integer(&(encoder->buff), v);
+    return 0;
+}
+
+
+static int encode_float(encoder_t *encoder, PyObject *value) {
+    double v = PyFloat_AsDouble(value);
+    if (v == -1.0 && PyErr_Occurred())
+        return -1;
+
+    size_t size = hat_sbs_encode_float(&(encoder->buff), v);
+    if (!size)
+        return 0;
+
+    if (encoder_reserve(encoder, size))
+        return -1;
+    hat_sbs_encode_float(&(encoder->buff), v);
+    return 0;
+}
+
+
+static int encode_payload(encoder_t *encoder, const char *v, size_t v_len) {
+    size_t size = hat_sbs_encode_integer(NULL, v_len) + v_len;
+    if (encoder_reserve(encoder, size))
+        return -1;
+
+    if (v_len < RELEASE_GIL_MIN_SIZE) {
+        hat_sbs_encode_bytes(&(encoder->buff), (uint8_t *)v, v_len);
+        return 0;
+    }
+
+    // payload is owned by immutable object referenced by caller
+    Py_BEGIN_ALLOW_THREADS;
+    hat_sbs_encode_bytes(&(encoder->buff), (uint8_t *)v, v_len);
+    Py_END_ALLOW_THREADS;
+
+    return 0;
+}
+
+
+static int encode_string(encoder_t *encoder, PyObject *value) {
+    Py_ssize_t v_len;
+    const char *v = PyUnicode_AsUTF8AndSize(value, &v_len);
+    if (!v)
+        return -1;
+
+    return encode_payload(encoder, v, v_len);
+}
+
+
+static int encode_bytes(encoder_t *encoder, PyObject *value) {
+    char *v;
+    Py_ssize_t v_len;
+    if (PyBytes_AsStringAndSize(value, &v, &v_len) == -1)
+        return -1;
+
+    if (!encoder->segments || !v_len ||
+        (size_t)v_len < encoder->min_ref_size)
+        return encode_payload(encoder, v, v_len);
+
+    // payload is referenced by segments instead of copied
+    size_t size = hat_sbs_encode_integer(NULL, v_len);
+    if (encoder_reserve(encoder, size))
+        return -1;
+    hat_sbs_encode_integer(&(encoder->buff), v_len);
+
+    if (encoder_flush(encoder))
+        return -1;
+
+    return PyList_Append(encoder->segments, value);
+}
+
+
+static int encode_array_header(encoder_t *encoder, size_t len) {
+    size_t size = hat_sbs_encode_array_header(&(encoder->buff), len);
+    if (!size)
+        return 0;
+
+    if (encoder_reserve(encoder, size))
+        return -1;
+    hat_sbs_encode_array_header(&(encoder->buff), len);
+    return 0;
+}
+
+
+// buffer item format code or 0 if format is not supported for items of
+// typed array item node
+static char get_typed_array_format(node_t *item_node, Py_buffer *view) {
+    const char *format = (view->format ? view->format : "B");
+    if (*format == '@' || *format == '=')
+        format++;
+
+    if (!format[0] || format[1])
+        return 0;
+
+    switch (item_node->op) {
+    case OP_BOOLEAN:
+        return (strchr("?bB", *format) && view->itemsize == 1) ? *format : 0;
+
+    case OP_INTEGER:
+        return (strchr("bBhHiIlLqQnN", *format) && view->itemsize <= 8)
+                   ? *format
+                   : 0;
+
+    case OP_FLOAT:
+        if (*format == 'd' && view->itemsize == sizeof(double))
+            return *format;
+        if (*format == 'f' && view->itemsize == sizeof(float))
+            return *format;
+        return 0;
+
+    default:
+        return 0;
+    }
+}
+
+
+static void encode_fixed_items(hat_buff_t *buff, node_t *item_node,
+                               char format, const uint8_t *items, size_t len) {
+    for (size_t i = 0; i < len; ++i) {
+        if (item_node->op == OP_BOOLEAN) {
+            hat_sbs_encode_boolean(buff, items[i] != 0);
+
+        } else if (format == 'f') {
+            float v;
+            memcpy(&v, items + i * sizeof(float), sizeof(float));
+            hat_sbs_encode_float(buff, v);
+
+        } else {
+            double v;
+            memcpy(&v, items + i * sizeof(double), sizeof(double));
+            hat_sbs_encode_float(buff, v);
+        }
+    }
+}
+
+
+// returns false if unsigned item value doesn't fit into int64_t (value is
+// stored in u)
+static bool read_integer_item(char format, const uint8_t *item,
+                              size_t item_size, int64_t *v, uint64_t *u) {
+    // lowercase format codes are signed
+    bool is_signed = (format >= 'a');
+
+    if (is_signed) {
+        int8_t v8;
+        int16_t v16;
+        int32_t v32;
+        switch (item_size) {
+        case 1:
+            memcpy(&v8, item, 1);
+            *v = v8;
+            break;
+        case 2:
+            memcpy(&v16, item, 2);
+            *v = v16;
+            break;
+        case 4:
+            memcpy(&v32, item, 4);
+            *v = v32;
+            break;
+        default:
+            memcpy(v, item, 8);
+            break;
+        }
+
+        return true;
+    }
+
+    uint8_t u8;
+    uint16_t u16;
+    uint32_t u32;
+    switch (item_size) {
+    case 1:
+        memcpy(&u8, item, 1);
+        *u = u8;
+        break;
+    case 2:
+        memcpy(&u16, item, 2);
+        *u = u16;
+        break;
+    case 4:
+        memcpy(&u32, item, 4);
+        *u = u32;
+        break;
+    default:
+        memcpy(u, item, 8);
+        break;
+    }
+
+    if (*u > INT64_MAX)
+        return false;
+
+    *v = *u;
+    return true;
+}
+
+
+static int encode_integer_item(encoder_t *encoder, char format,
+                               const uint8_t *item, size_t item_size) {
+    int64_t v;
+    uint64_t u;
+    if (!read_integer_item(format, item, item_size, &v, &u)) {
+        PyObject *value = PyLong_FromUnsignedLongLong(u);
+        if (!value)
+            return -1;
+
+        int result = encode_integer(encoder, value);
+        Py_DECREF(value);
+        return result;
+    }
+
+    size_t size = hat_sbs_encode_integer(&(encoder->buff), v);
+    if (!size)
+        return 0;
+
+    if (encoder_reserve(encoder, size))
+        return -1;
+    hat_sbs_encode_integer(&(encoder->buff), v);
+    return 0;
+}
+
+
+// returns 1 if value is not supported typed array
+static int encode_typed_array(encoder_t *encoder, node_t *node,
+                              PyObject *value) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(value, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT)) {
+        PyErr_Clear();
+        return 1;
+    }
+
+    char format = get_typed_array_format(node->t, &view);
+    if (!format) {
+        PyBuffer_Release(&view);
+        return 1;
+    }
+
+    const uint8_t *items = view.buf;
+    size_t len = view.len / view.itemsize;
+    int result = -1;
+
+    if (encode_array_header(encoder, len))
+        goto cleanup;
+
+    if (node->t->op == OP_INTEGER) {
+        for (size_t i = 0; i < len; ++i)
+            if (encode_integer_item(encoder, format, items + i * view.itemsize,
+                                    view.itemsize))
+                goto cleanup;
+
+        result = 0;
+        goto cleanup;
+    }
+
+    size_t size = len * (node->t->op == OP_FLOAT ? 8 : 1);
+    if (encoder_reserve(encoder, size))
+        goto cleanup;
+
+    if (size < RELEASE_GIL_MIN_SIZE) {
+        encode_fixed_items(&(encoder->buff), node->t, format, items, len);
+
+    } else {
+        // buffer is exported until released
+        Py_BEGIN_ALLOW_THREADS;
+        encode_fixed_items(&(encoder->buff), node->t, format, items, len);
+        Py_END_ALLOW_THREADS;
+    }
+
+    result = 0;
+
+cleanup:
+    PyBuffer_Release(&view);
+    return result;
+}
+
+
+static int encode_array(encoder_t *encoder, node_t *node, PyObject *value) {
+    if (is_typed_array_item(node->t) && PyObject_CheckBuffer(value)) {
+        int result = encode_typed_array(encoder, node, value);
+        if (result <= 0)
+            return result;
+    }
+
+    Py_ssize_t len = PyList_Size(value);
+    if (len < 0)
+        return -1;
+
+    if (encode_array_header(encoder, len))
+        return -1;
+
+    for (size_t i = 0; i < len; ++i) {
+        // strong reference - list can be modified by other threads
+        PyObject *item = PySequence_GetItem(value, i);
+        if (!item)
+            return -1;
+
+        int result = encode_node(encoder, node->t, item);
+        Py_DECREF(item);
+        if (result)
+            return -1;
+    }
+
+    return 0;
+}
+
+
+static int encode_record(encoder_t *encoder, node_t *node, PyObject *value) {
+    // tuples contain entry values in order of record entries
+    bool positional = PyTuple_Check(value);
+    if (positional && PyTuple_Size(value) != node->entries_len) {
+        PyErr_SetString(PyExc_ValueError, "invalid record size");
+        return -1;
+    }
+
+    for (size_t i = 0; i < node->entries_len; ++i) {
+        entry_t *entry = node->entries + i;
+
+        PyObject *entry_value;
+        if (positional) {
+            entry_value = PyTuple_GetItem(value, i);
+            Py_XINCREF(entry_value);
+
+        } else {
+            entry_value = PyObject_GetItem(value, entry->name);
+        }
+        if (!entry_value)
+            return -1;
+
+        int result = encode_node(encoder, entry->type, entry_value);
+        Py_DECREF(entry_value);
+        if (result)
+            return -1;
+    }
+
+    return 0;
+}
+
+
+static entry_t *get_choice_entry(node_t *node, PyObject *entry_name,
+                                 size_t *id) {
+    // same error is reported regardless of lookup method
+    if (!PyUnicode_Check(entry_name)) {
+        PyErr_SetString(PyExc_ValueError, "invalid entry name");
+        return NULL;
+    }
+
+    if (node->entry_ids) {
+        PyObject *id_obj = PyDict_GetItemWithError(node->entry_ids,
+                                                   entry_name);
+        if (id_obj) {
+            *id = PyLong_AsSize_t(id_obj);
+            return node->entries + *id;
+        }
+
+        if (PyErr_Occurred())
+            return NULL;
+
+    } else {
+        for (*id = 0; *id < node->entries_len; ++(*id)) {
+            if (PyUnicode_Compare(entry_name, node->entries[*id].name)) {
+                if (PyErr_Occurred())
+                    return NULL;
+                continue;
+            }
+
+            return node->entries + *id;
+        }
+    }
+
+    PyErr_SetString(PyExc_ValueError, "invalid entry name");
+    return NULL;
+}
+
+
+static int encode_choice(encoder_t *encoder, node_t *node, PyObject *value) {
+    if (!node->entries_len)
+        return 0;
+
+    PyObject *entry_name = PyTuple_GetItem(value, 0);
+    if (!entry_name)
+        return -1;
+
+    PyObject *entry_value = PyTuple_GetItem(value, 1);
+    if (!entry_value)
+        return -1;
+
+    size_t id;
+    entry_t *entry = get_choice_entry(node, entry_name, &id);
+    if (!entry)
+        return -1;
+
+    size_t size = hat_sbs_encode_choice_header(&(encoder->buff), id);
+    if (size) {
+        if (encoder_reserve(encoder, size))
+            return -1;
+        hat_sbs_encode_choice_header(&(encoder->buff), id);
+    }
+
+    return encode_node(encoder, entry->type, entry_value);
+}
+
+
+static PyObject *decode_none() {
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+
+static PyObject *decode_boolean(decoder_t *decoder) {
+    bool value;
+    if (hat_sbs_decode_boolean(&(decoder->buff), &value))
+        return NULL;
+    return PyBool_FromLong(value);
+}
+
+
+static PyObject *decode_bigint(decoder_t *decoder, size_t size) {
+    size_t value_len = (size * 7 + 7) / 8;
+    PyObject *bytes = PyBytes_FromStringAndSize(NULL, value_len);
+    if (!bytes)
+        return NULL;
+
+    uint8_t *value = (uint8_t *)PyBytes_AsString(bytes);
+    hat_sbs_decode_bigint(&(decoder->buff), value, value_len);
+
+    PyObject *from_bytes =
+        PyObject_GetAttrString((PyObject *)&PyLong_Type, "from_bytes");
+    PyObject *args = Py_BuildValue("(Os)", bytes, "little");
+    PyObject *kwargs = Py_BuildValue("{sO}", "signed", Py_True);
+    PyObject *result = ((from_bytes && args && kwargs)
+                            ? PyObject_Call(from_bytes, args, kwargs)
+                            : NULL);
+    Py_XDECREF(kwargs);
+    Py_XDECREF(args);
+    Py_XDECREF(from_bytes);
+    Py_DECREF(bytes);
+
+    return result;
+}
+
+
+static PyObject *decode_integer(decoder_t *decoder) {
+    int64_t value;
+    if (!hat_sbs_decode_integer(&(decoder->buff), &value))
+        return PyLong_FromLongLong(value);
+
+    // valid integers which don't fit into int64_t
+    size_t size = hat_sbs_get_integer_size(&(decoder->buff));
+    if (size >= HAT_SBS_INTEGER_MAX_SIZE)
+        return decode_bigint(decoder, size);
+
+    return NULL;
+}
+
+
+static PyObject *decode_float(decoder_t *decoder) {
+    double value;
+    if (hat_sbs_decode_float(&(decoder->buff), &value))
+        return NULL;
+    return PyFloat_FromDouble(value);
+}
+
+
+static PyObject *decode_string(decoder_t *decoder) {
+    uint8_t *value;
+    size_t value_len;
+    if (hat_sbs_decode_string(&(decoder->buff), &value, &value_len))
+        return NULL;
+    return PyUnicode_DecodeUTF8((const char *)value, value_len, NULL);
+}
+
+
+static PyObject *decode_bytes(decoder_t *decoder) {
+    uint8_t *value;
+    size_t value_len;
+    if (hat_sbs_decode_bytes(&(decoder->buff), &value, &value_len))
+        return NULL;
+
+    if (!decoder->data && value_len < RELEASE_GIL_MIN_SIZE)
+        return PyBytes_FromStringAndSize((const char *)value, value_len);
+
+    if (!decoder->data) {
+        PyObject *result = PyBytes_FromStringAndSize(NULL, value_len);
+        if (!result)
+            return NULL;
+
+        // decoded data buffer is exported for the duration of decoding
+        char *result_data = PyBytes_AsString(result);
+        Py_BEGIN_ALLOW_THREADS;
+        memcpy(result_data, value, value_len);
+        Py_END_ALLOW_THREADS;
+
+        return result;
+    }
+
+    Py_ssize_t start = value - decoder->buff.data;
+    return PySequence_GetSlice(decoder->data, start, start + value_len);
+}
+
+
+static int decode_fixed_items(hat_buff_t *buff, node_t *item_node,
+                              uint8_t *items, size_t len) {
+    for (size_t i = 0; i < len; ++i) {
+        if (item_node->op == OP_BOOLEAN) {
+            bool v;
+            if (hat_sbs_decode_boolean(buff, &v))
+                return -1;
+            items[i] = v;
+
+        } else {
+            double v;
+            if (hat_sbs_decode_float(buff, &v))
+                return -1;
+            memcpy(items + i * sizeof(double), &v, sizeof(double));
+        }
+    }
+
+    return 0;
+}
+
+
+static int decode_integer_item(decoder_t *decoder, uint8_t *item) {
+    int64_t v;
+    if (hat_sbs_decode_integer(&(decoder->buff), &v)) {
+        // integers which don't fit into int64_t raise OverflowError
+        PyObject *value = decode_integer(decoder);
+        if (!value)
+            return -1;
+
+        v = PyLong_AsLongLong(value);
+        Py_DECREF(value);
+        if (v == -1 && PyErr_Occurred())
+            return -1;
+    }
+
+    memcpy(item, &v, sizeof(int64_t));
+    return 0;
+}
+
+
+static int decode_integer_items(decoder_t *decoder, uint8_t *items,
+                                size_t len) {
+    for (size_t i = 0; i < len; ++i)
+        if (decode_integer_item(decoder, items + i * sizeof(int64_t)))
+            return -1;
+
+    return 0;
+}
+
+
+static PyObject *decode_typed_array(decoder_t *decoder, node_t *node,
+                                    size_t len) {
+    const char *format;
+    size_t item_size;
+    size_t min_encoded_size;
+    switch (node->t->op) {
+    case OP_BOOLEAN:
+        format = "B";
+        item_size = 1;
+        min_encoded_size = 1;
+        break;
+
+    case OP_INTEGER:
+        format = "q";
+        item_size = sizeof(int64_t);
+        min_encoded_size = 1;
+        break;
+
+    default:
+        format = "d";
+        item_size = sizeof(double);
+        min_encoded_size = 8;
+        break;
+    }
+
+    // length is validated before allocation of items
+    if (hat_buff_available(&(decoder->buff)) / min_encoded_size < len)
+        return NULL;
+
+    PyObject *bytes = PyBytes_FromStringAndSize(NULL, len * item_size);
+    if (!bytes)
+        return NULL;
+
+    uint8_t *items = (uint8_t *)PyBytes_AsString(bytes);
+    int err;
+
+    if (node->t->op == OP_INTEGER) {
+        err = decode_integer_items(decoder, items, len);
+
+    } else if (len * item_size < RELEASE_GIL_MIN_SIZE) {
+        err = decode_fixed_items(&(decoder->buff), node->t, items, len);
+
+    } else {
+        // decoded data buffer is exported for the duration of decoding
+        Py_BEGIN_ALLOW_THREADS;
+        err = decode_fixed_items(&(decoder->buff), node->t, items, len);
+        Py_END_ALLOW_THREADS;
+    }
+
+    PyObject *result =
+        (err ? NULL
+             : PyObject_CallFunction(node->array_type, "sO", format, bytes));
+    Py_DECREF(bytes);
+    return result;
+}
+
+
+static PyObject *decode_array(decoder_t *decoder, node_t *node) {
+    size_t len;
+    if (hat_sbs_decode_array_header(&(decoder->buff), &len))
+        return NULL;
+
+    if (node->array_type)
+        return decode_typed_array(decoder, node, len);
+
+    PyObject *result = PyList_New(len);
+    for (size_t i = 0; result && i < len; ++i) {
+        PyObject *item = decode_node(decoder, node->t);
+
+        if (item && PyList_SetItem(result, i, item))
+            Py_CLEAR(item);
+
+        if (!item)
+            Py_CLEAR(result);
+    }
+
+    return result;
+}
+
+
+static bool is_atomic(PyObject *value) {
+    return value == Py_None || PyBool_Check(value) ||
+           PyLong_CheckExact(value) || PyFloat_CheckExact(value) ||
+           PyUnicode_CheckExact(value) || PyBytes_CheckExact(value);
+}
+
+
+static PyObject *decode_record_tuple(decoder_t *decoder, node_t *node) {
+    // record class instance is allocated directly (without intermediate
+    // tuple) - equivalent to tuple.__new__(record_class, entry_values)
+    allocfunc record_alloc =
+        PyType_GetSlot((PyTypeObject *)node->record_class, Py_tp_alloc);
+    PyObject *result =
+        record_alloc((PyTypeObject *)node->record_class, node->entries_len);
+    if (!result)
+        return NULL;
+
+    bool atomic = true;
+    for (size_t i = 0; i < node->entries_len; ++i) {
+        PyObject *entry_value = decode_node(decoder, node->entries[i].type);
+        if (!entry_value) {
+            Py_DECREF(result);
+            return NULL;
+        }
+
+        atomic = atomic && is_atomic(entry_value);
+        PyTuple_SetItem(result, i, entry_value);
+    }
+
+    // same as dicts containing only atomic values, records which can not
+    // be part of reference cycle are not tracked by garbage collector
+    if (atomic)
+        PyObject_GC_UnTrack(result);
+
+    return result;
+}
+
+
+static PyObject *decode_record(decoder_t *decoder, node_t *node) {
+    if (!node->entries_len) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    if (node->record_class)
+        return decode_record_tuple(decoder, node);
+
+    PyObject *result = PyDict_New();
+    for (size_t i = 0; result && i < node->entries_len; ++i) {
+        entry_t *entry = node->entries + i;
+
+        PyObject *entry_value = decode_node(decoder, entry->type);
+        if (!entry_value) {
+            Py_CLEAR(result);
+            break;
+        }
+
+        if (PyDict_SetItem(result, entry->name, entry_value))
+            Py_CLEAR(result);
+
+        Py_DECREF(entry_value);
+    }
+
+    return result;
+}
+
+
+static PyObject *decode_choice(decoder_t *decoder, node_t *node) {
+    if (!node->entries_len) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    size_t id;
+    if (hat_sbs_decode_choice_header(&(decoder->buff), &id))
+        return NULL;
+
+    if (id >= node->entries_len) {
+        PyErr_SetString(PyExc_ValueError, "invalid choice id");
+        return NULL;
+    }
+
+    entry_t *entry = node->entries + id;
+
+    PyObject *entry_value = decode_node(decoder, entry->type);
+    if (!entry_value)
+        return NULL;
+
+    PyObject *result = PyTuple_New(2);
+    if (!result) {
+        Py_DECREF(entry_value);
+        return NULL;
+    }
+
+    Py_INCREF(entry->name);
+    PyTuple_SetItem(result, 0, entry->name);
+    PyTuple_SetItem(result, 1, entry_value);
+
+    return result;
+}
+
+
+static int skip_node(hat_buff_t *buff, node_t *node, size_t count) {
+    if (node->fixed_size >= 0) {
+        if (count && hat_buff_available(buff) / count < node->fixed_size)
+            return HAT_SBS_ERROR;
+        buff->pos += count * node->fixed_size;
+        return HAT_SBS_SUCCESS;
+    }
+
+    for (size_t i = 0; i < count; ++i) {
+        switch (node->op) {
+        case OP_INTEGER:
+            if (hat_sbs_skip_integer(buff))
+                return HAT_SBS_ERROR;
+            break;
+
+        case OP_STRING:
+        case OP_BYTES:
+            if (hat_sbs_skip_bytes(buff))
+                return HAT_SBS_ERROR;
+            break;
+
+        case OP_ARRAY: {
+            size_t len;
+            if (hat_sbs_decode_array_header(buff, &len))
+                return HAT_SBS_ERROR;
+            if (skip_node(buff, node->t, len))
+                return HAT_SBS_ERROR;
+            break;
+        }
+
+        case OP_RECORD:
+            for (size_t j = 0; j < node->entries_len; ++j)
+                if (skip_node(buff, node->entries[j].type, 1))
+                    return HAT_SBS_ERROR;
+            break;
+
+        case OP_CHOICE: {
+            size_t id;
+            if (hat_sbs_decode_choice_header(buff, &id))
+                return HAT_SBS_ERROR;
+            if (id >= node->entries_len)
+                return HAT_SBS_ERROR;
+            if (skip_node(buff, node->entries[id].type, 1))
+                return HAT_SBS_ERROR;
+            break;
+        }
+
+        default:
+            return HAT_SBS_ERROR;
+        }
+    }
+
+    return HAT_SBS_SUCCESS;
+}
+
+
+static int encode_node(encoder_t *encoder, node_t *node, PyObject *value) {
+    switch (node->op) {
+    case OP_NONE:
+        return 0;
+
+    case OP_BOOLEAN:
+        return encode_boolean(encoder, value);
+
+    case OP_INTEGER:
+        return encode_integer(encoder, value);
+
+    case OP_FLOAT:
+        return encode_float(encoder, value);
+
+    case OP_STRING:
+        return encode_string(encoder, value);
+
+    case OP_BYTES:
+        return encode_bytes(encoder, value);
+
+    case OP_ARRAY:
+        return encode_array(encoder, node, value);
+
+    case OP_RECORD:
+        return encode_record(encoder, node, value);
+
+    case OP_CHOICE:
+        return encode_choice(encoder, node, value);
+
+    case OP_UNRESOLVED:
+        return set_unresolved_error(node);
+
+    default:
+        break;
+    }
+
+    PyErr_SetNone(PyExc_ValueError);
+    return -1;
+}
+
+
+static int get_integer_size(PyObject *value, size_t *size) {
+    int overflow;
+    long long v = PyLong_AsLongLongAndOverflow(value, &overflow);
+    if (v == -1 && PyErr_Occurred())
+        return -1;
+
+    if (!overflow) {
+        *size += hat_sbs_encode_integer(NULL, v);
+        return 0;
+    }
+
+    // number of significant bits without sign bit
+    PyObject *abs_value = (overflow < 0 ? PyNumber_Invert(value) : value);
+    if (!abs_value)
+        return -1;
+
+    PyObject *bit_length = PyObject_CallMethod(abs_value, "bit_length", NULL);
+    if (overflow < 0)
+        Py_DECREF(abs_value);
+    if (!bit_length)
+        return -1;
+
+    size_t bits = PyLong_AsSize_t(bit_length);
+    Py_DECREF(bit_length);
+    if (bits == (size_t)-1 && PyErr_Occurred())
+        return -1;
+
+    *size += bits / 7 + 1;
+    return 0;
+}
+
+
+static int get_payload_size(PyObject *value, bool is_string, size_t *size) {
+    Py_ssize_t v_len;
+    if (is_string) {
+        if (!PyUnicode_AsUTF8AndSize(value, &v_len))
+            return -1;
+
+    } else {
+        char *v;
+        if (PyBytes_AsStringAndSize(value, &v, &v_len) == -1)
+            return -1;
+    }
+
+    *size += hat_sbs_encode_integer(NULL, v_len) + v_len;
+    return 0;
+}
+
+
+// returns 1 if value is not supported typed array
+static int get_typed_array_size(node_t *node, PyObject *value,
+                                size_t *size) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(value, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT)) {
+        PyErr_Clear();
+        return 1;
+    }
+
+    char format = get_typed_array_format(node->t, &view);
+    if (!format) {
+        PyBuffer_Release(&view);
+        return 1;
+    }
+
+    const uint8_t *items = view.buf;
+    size_t len = view.len / view.itemsize;
+    *size += hat_sbs_encode_array_header(NULL, len);
+
+    if (node->t->op != OP_INTEGER) {
+        *size += len * node->t->fixed_size;
+
+    } else {
+        for (size_t i = 0; i < len; ++i) {
+            int64_t v;
+            uint64_t u;
+            *size += (read_integer_item(format, items + i * view.itemsize,
+                                        view.itemsize, &v, &u)
+                          ? hat_sbs_encode_integer(NULL, v)
+                          : 10);
+        }
+    }
+
+    PyBuffer_Release(&view);
+    return 0;
+}
+
+
+static int get_encoded_size(node_t *node, PyObject *value, size_t *size);
+
+
+static int get_array_size(node_t *node, PyObject *value, size_t *size) {
+    if (is_typed_array_item(node->t) && PyObject_CheckBuffer(value)) {
+        int result = get_typed_array_size(node, value, size);
+        if (result <= 0)
+            return result;
+    }
+
+    Py_ssize_t len = PyList_Size(value);
+    if (len < 0)
+        return -1;
+
+    *size += hat_sbs_encode_array_header(NULL, len);
+
+    // items of fixed size types are not accessed
+    if (node->t->fixed_size >= 0) {
+        *size += len * node->t->fixed_size;
+        return 0;
+    }
+
+    for (size_t i = 0; i < len; ++i) {
+        // strong reference - list can be modified by other threads
+        PyObject *item = PySequence_GetItem(value, i);
+        if (!item)
+            return -1;
+
+        int result = get_encoded_size(node->t, item, size);
+        Py_DECREF(item);
+        if (result)
+            return -1;
+    }
+
+    return 0;
+}
+
+
+static int get_record_size(node_t *node, PyObject *value, size_t *size) {
+    bool positional = PyTuple_Check(value);
+    if (positional && PyTuple_Size(value) != node->entries_len) {
+        PyErr_SetString(PyExc_ValueError, "invalid record size");
+        return -1;
+    }
+
+    for (size_t i = 0; i < node->entries_len; ++i) {
+        entry_t *entry = node->entries + i;
+
+        if (entry->type->fixed_size >= 0) {
+            *size += entry->type->fixed_size;
+            continue;
+        }
+
+        PyObject *entry_value;
+        if (positional) {
+            entry_value = PyTuple_GetItem(value, i);
+            Py_XINCREF(entry_value);
+
+        } else {
+            entry_value = PyObject_GetItem(value, entry->name);
+        }
+        if (!entry_value)
+            return -1;
+
+        int result = get_encoded_size(entry->type, entry_value, size);
+        Py_DECREF(entry_value);
+        if (result)
+            return -1;
+    }
+
+    return 0;
+}
+
+
+static int get_choice_size(node_t *node, PyObject *value, size_t *size) {
+    PyObject *entry_name = PyTuple_GetItem(value, 0);
+    if (!entry_name)
+        return -1;
+
+    PyObject *entry_value = PyTuple_GetItem(value, 1);
+    if (!entry_value)
+        return -1;
+
+    size_t id;
+    entry_t *entry = get_choice_entry(node, entry_name, &id);
+    if (!entry)
+        return -1;
+
+    *size += hat_sbs_encode_choice_header(NULL, id);
+    return get_encoded_size(entry->type, entry_value, size);
+}
+
+
+// adds encoded size of value to size (values of fixed size types are not
+// accessed)
+static int get_encoded_size(node_t *node, PyObject *value, size_t *size) {
+    if (node->fixed_size >= 0) {
+        *size += node->fixed_size;
+        return 0;
+    }
+
+    switch (node->op) {
+    case OP_INTEGER:
+        return get_integer_size(value, size);
+
+    case OP_STRING:
+        return get_payload_size(value, true, size);
+
+    case OP_BYTES:
+        return get_payload_size(value, false, size);
+
+    case OP_ARRAY:
+        return get_array_size(node, value, size);
+
+    case OP_RECORD:
+        return get_record_size(node, value, size);
+
+    case OP_CHOICE:
+        return get_choice_size(node, value, size);
+
+    case OP_UNRESOLVED:
+        return set_unresolved_error(node);
+
+    default:
+        break;
+    }
+
+    PyErr_SetNone(PyExc_ValueError);
+    return -1;
+}
+
+
+static PyObject *decode_node(decoder_t *decoder, node_t *node) {
+    PyObject *result = NULL;
+
+    switch (node->op) {
+    case OP_NONE:
+        return decode_none();
+
+    case OP_BOOLEAN:
+        result = decode_boolean(decoder);
+        break;
+
+    case OP_INTEGER:
+        result = decode_integer(decoder);
+        break;
+
+    case OP_FLOAT:
+        result = decode_float(decoder);
+        break;
+
+    case OP_STRING:
+        result = decode_string(decoder);
+        break;
+
+    case OP_BYTES:
+        result = decode_bytes(decoder);
+        break;
+
+    case OP_ARRAY:
+        result = decode_array(decoder, node);
+        break;
+
+    case OP_RECORD:
+        result = decode_record(decoder, node);
+        break;
+
+    case OP_CHOICE:
+        result = decode_choice(decoder, node);
+        break;
+
+    case OP_UNRESOLVED:
+        set_unresolved_error(node);
+        return NULL;
+
+    default:
+        PyErr_SetNone(PyExc_ValueError);
+        return NULL;
+    }
+
+    if (!result && !PyErr_Occurred())
+        PyErr_SetString(PyExc_ValueError, "invalid data");
+
+    return result;
+}
+
+
+// minimal encoded size of record entry value
+static size_t get_entry_min_size(node_t *node) {
+    switch (node->op) {
+    case OP_BOOLEAN:
+    case OP_INTEGER:
+    case OP_STRING:
+    case OP_BYTES:
+    case OP_ARRAY:
+        return 1;
+
+    case OP_FLOAT:
+        return 8;
+
+    case OP_CHOICE:
+        return (node->entries_len ? 1 : 0);
+
+    default:
+        return 0;
+    }
+}
+
+
+// columns record node or NULL if node is not array of non empty records
+static node_t *get_columns_node(node_t *node) {
+    if (node->op != OP_ARRAY || node->t->op != OP_RECORD ||
+        !node->t->entries_len) {
+        PyErr_SetString(PyExc_ValueError, "unsupported type");
+        return NULL;
+    }
+
+    return node->t;
+}
+
+
+// typed array item format and size of column decoded as array.array
+static const char *get_column_format(node_t *node, size_t *item_size) {
+    switch (node->op) {
+    case OP_BOOLEAN:
+        *item_size = 1;
+        return "B";
+
+    case OP_INTEGER:
+        *item_size = sizeof(int64_t);
+        return "q";
+
+    case OP_FLOAT:
+        *item_size = sizeof(double);
+        return "d";
+
+    default:
+        *item_size = 0;
+        return NULL;
+    }
+}
+
+
+static int decode_column_item(decoder_t *decoder, node_t *node,
+                              PyObject *column, uint8_t *items, size_t i) {
+    switch (node->op) {
+    case OP_BOOLEAN:
+    case OP_FLOAT:
+        return decode_fixed_items(
+            &(decoder->buff), node,
+            items + i * (node->op == OP_FLOAT ? sizeof(double) : 1), 1);
+
+    case OP_INTEGER:
+        return decode_integer_item(decoder, items + i * sizeof(int64_t));
+
+    default:
+        break;
+    }
+
+    PyObject *value = decode_node(decoder, node);
+    if (!value)
+        return -1;
+
+    return PyList_SetItem(column, i, value);
+}
+
+
+static PyObject *decode_columns_node(decoder_t *decoder, node_t *node) {
+    node_t *record_node = get_columns_node(node);
+    if (!record_node)
+        return NULL;
+
+    size_t len;
+    if (hat_sbs_decode_array_header(&(decoder->buff), &len)) {
+        PyErr_SetString(PyExc_ValueError, "invalid data");
+        return NULL;
+    }
+
+    size_t entries_len = record_node->entries_len;
+    size_t min_size = 0;
+    for (size_t i = 0; i < entries_len; ++i)
+        min_size += get_entry_min_size(record_node->entries[i].type);
+
+    // length is validated before allocation of columns
+    if (min_size && hat_buff_available(&(decoder->buff)) / min_size < len) {
+        PyErr_SetString(PyExc_ValueError, "invalid data");
+        return NULL;
+    }
+
+    PyObject *array_module = PyImport_ImportModule("array");
+    if (!array_module)
+        return NULL;
+
+    PyObject *array_type = PyObject_GetAttrString(array_module, "array");
+    Py_DECREF(array_module);
+    if (!array_type)
+        return NULL;
+
+    PyObject *result = NULL;
+
+    // bytes containing array items or lists of decoded values
+    PyObject **columns = PyMem_Calloc(entries_len, sizeof(PyObject *));
+    if (!columns) {
+        PyErr_NoMemory();
+        goto cleanup;
+    }
+
+    for (size_t i = 0; i < entries_len; ++i) {
+        size_t item_size;
+        if (get_column_format(record_node->entries[i].type, &item_size)) {
+            columns[i] = PyBytes_FromStringAndSize(NULL, len * item_size);
+
+        } else {
+            columns[i] = PyList_New(len);
+        }
+
+        if (!columns[i])
+            goto cleanup;
+    }
+
+    for (size_t i = 0; i < len; ++i) {
+        for (size_t j = 0; j < entries_len; ++j) {
+            node_t *entry_node = record_node->entries[j].type;
+            uint8_t *items = (PyBytes_Check(columns[j])
+                                  ? (uint8_t *)PyBytes_AsString(columns[j])
+                                  : NULL);
+
+            if (decode_column_item(decoder, entry_node, columns[j], items,
+                                   i)) {
+                if (!PyErr_Occurred())
+                    PyErr_SetString(PyExc_ValueError, "invalid data");
+                goto cleanup;
+            }
+        }
+    }
+
+    result = PyDict_New();
+    for (size_t i = 0; result && i < entries_len; ++i) {
+        size_t item_size;
+        const char *format =
+            get_column_format(record_node->entries[i].type, &item_size);
+
+        PyObject *column;
+        if (format) {
+            column = PyObject_CallFunction(array_type, "sO", format,
+                                           columns[i]);
+
+        } else {
+            column = columns[i];
+            Py_INCREF(column);
+        }
+
+        if (!column ||
+            PyDict_SetItem(result, record_node->entries[i].name, column))
+            Py_CLEAR(result);
+
+        Py_XDECREF(column);
+    }
+
+cleanup:
+
+    if (columns) {
+        for (size_t i = 0; i < entries_len; ++i)
+            Py_XDECREF(columns[i]);
+        PyMem_Free(columns);
+    }
+
+    Py_DECREF(array_type);
+
+    return result;
+}
+
+
+typedef struct {
+    PyObject *values;
+
+    // items of values supporting buffer protocol with supported typed array
+    // format (format is 0 if values are accessed as sequence)
+    Py_buffer view;
+    char format;
+} column_t;
+
+
+static int encode_column_item(encoder_t *encoder, node_t *node,
+                              column_t *column, size_t i) {
+    if (!column->format) {
+        // strong reference - sequence can be modified by other threads
+        PyObject *value = PySequence_GetItem(column->values, i);
+        if (!value)
+            return -1;
+
+        int result = encode_node(encoder, node, value);
+        Py_DECREF(value);
+        return result;
+    }
+
+    const uint8_t *item = (const uint8_t *)column->view.buf +
+                          i * column->view.itemsize;
+
+    if (node->op == OP_INTEGER)
+        return encode_integer_item(encoder, column->format, item,
+                                   column->view.itemsize);
+
+    if (encoder_reserve(encoder, (node->op == OP_FLOAT ? 8 : 1)))
+        return -1;
+
+    encode_fixed_items(&(encoder->buff), node, column->format, item, 1);
+    return 0;
+}
+
+
+static int encode_columns_node(encoder_t *encoder, node_t *node,
+                               PyObject *value) {
+    node_t *record_node = get_columns_node(node);
+    if (!record_node)
+        return -1;
+
+    size_t entries_len = record_node->entries_len;
+    int result = -1;
+
+    column_t *columns = PyMem_Calloc(entries_len, sizeof(column_t));
+    if (!columns) {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    size_t len = 0;
+    for (size_t i = 0; i < entries_len; ++i) {
+        node_t *entry_node = record_node->entries[i].type;
+        column_t *column = columns + i;
+
+        column->values = PyObject_GetItem(value, record_node->entries[i].name);
+        if (!column->values)
+            goto cleanup;
+
+        if (is_typed_array_item(entry_node) &&
+            PyObject_CheckBuffer(column->values)) {
+            if (PyObject_GetBuffer(column->values, &(column->view),
+                                   PyBUF_C_CONTIGUOUS | PyBUF_FORMAT)) {
+                PyErr_Clear();
+
+            } else {
+                column->format =
+                    get_typed_array_format(entry_node, &(column->view));
+                if (!column->format)
+                    PyBuffer_Release(&(column->view));
+            }
+        }
+
+        Py_ssize_t column_len =
+            (column->format ? column->view.len / column->view.itemsize
+                            : PyObject_Length(column->values));
+        if (column_len < 0)
+            goto cleanup;
+
+        if (i && column_len != len) {
+            PyErr_SetString(PyExc_ValueError, "invalid column size");
+            goto cleanup;
+        }
+
+        len = column_len;
+    }
+
+    if (encode_array_header(encoder, len))
+        goto cleanup;
+
+    for (size_t i = 0; i < len; ++i)
+        for (size_t j = 0; j < entries_len; ++j)
+            if (encode_column_item(encoder, record_node->entries[j].type,
+                                   columns + j, i))
+                goto cleanup;
+
+    result = 0;
+
+cleanup:
+
+    for (size_t i = 0; i < entries_len; ++i) {
+        if (columns[i].format)
+            PyBuffer_Release(&(columns[i].view));
+        Py_XDECREF(columns[i].values);
+    }
+    PyMem_Free(columns);
+
+    return result;
+}
+
+
+static void projection_node_free(projection_node_t *projection_node) {
+    if (!projection_node)
+        return;
+
+    for (size_t i = 0; i < projection_node->children_len; ++i)
+        projection_node_free(projection_node->children[i]);
+
+    PyMem_Free(projection_node->children);
+    PyMem_Free(projection_node);
+}
+
+
+static int set_invalid_fields_error(PyObject *fields) {
+    PyObject *key;
+    PyObject *value;
+    Py_ssize_t pos = 0;
+
+    if (PyDict_Next(fields, &pos, &key, &value)) {
+        PyErr_Format(PyExc_ValueError, "invalid field %R", key);
+    } else {
+        PyErr_SetString(PyExc_ValueError, "invalid fields");
+    }
+    return -1;
+}
+
+
+static projection_node_t *projection_node_create(node_t *node,
+                                                 PyObject *fields) {
+    if (node->op == OP_UNRESOLVED) {
+        set_unresolved_error(node);
+        return NULL;
+    }
+
+    projection_node_t *projection_node =
+        PyMem_Calloc(1, sizeof(projection_node_t));
+    if (!projection_node) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+
+    projection_node->node = node;
+
+    if (fields == Py_None)
+        return projection_node;
+
+    if (!PyDict_Check(fields)) {
+        PyErr_SetString(PyExc_TypeError, "fields must be dict or None");
+        goto error;
+    }
+
+    if (node->op == OP_ARRAY) {
+        projection_node->children = PyMem_Calloc(1, sizeof(void *));
+        if (!projection_node->children) {
+            PyErr_NoMemory();
+            goto error;
+        }
+        projection_node->children_len = 1;
+
+        projection_node->children[0] = projection_node_create(node->t, fields);
+        if (!projection_node->children[0])
+            goto error;
+
+        return projection_node;
+    }
+
+    if ((node->op != OP_RECORD && node->op != OP_CHOICE) ||
+        !node->entries_len) {
+        set_invalid_fields_error(fields);
+        goto error;
+    }
+
+    projection_node->children =
+        PyMem_Calloc(node->entries_len, sizeof(void *));
+    if (!projection_node->children) {
+        PyErr_NoMemory();
+        goto error;
+    }
+    projection_node->children_len = node->entries_len;
+
+    PyObject *key;
+    PyObject *value;
+    Py_ssize_t pos = 0;
+    while (PyDict_Next(fields, &pos, &key, &value)) {
+        size_t i = 0;
+        for (; i < node->entries_len; ++i) {
+            int eq = PyObject_RichCompareBool(node->entries[i].name, key,
+                                              Py_EQ);
+            if (eq < 0)
+                goto error;
+            if (eq)
+                break;
+        }
+
+        if (i >= node->entries_len) {
+            PyErr_Format(PyExc_ValueError, "invalid field %R", key);
+            goto error;
+        }
+
+        if (projection_node->children[i])
+            continue;
+
+        projection_node->children[i] =
+            projection_node_create(node->entries[i].type, value);
+        if (!projection_node->children[i])
+            goto error;
+    }
+
+    return projection_node;
+
+error:
+    projection_node_free(projection_node);
+    return NULL;
+}
+
+
+static PyObject *decode_projection_node(decoder_t *decoder,
+                                        projection_node_t *projection_node) {
+    node_t *node = projection_node->node;
+
+    if (!projection_node->children)
+        return decode_node(decoder, node);
+
+    if (node->op == OP_ARRAY) {
+        size_t len;
+        if (hat_sbs_decode_array_header(&(decoder->buff), &len)) {
+            PyErr_SetString(PyExc_ValueError, "invalid data");
+            return NULL;
+        }
+
+        PyObject *result = PyList_New(len);
+        for (size_t i = 0; result && i < len; ++i) {
+            PyObject *item =
+                decode_projection_node(decoder, projection_node->children[0]);
+
+            if (item && PyList_SetItem(result, i, item))
+                Py_CLEAR(item);
+
+            if (!item)
+                Py_CLEAR(result);
+        }
+
+        return result;
+    }
+
+    if (node->op == OP_RECORD) {
+        PyObject *result = PyDict_New();
+        for (size_t i = 0; result && i < node->entries_len; ++i) {
+            entry_t *entry = node->entries + i;
+            projection_node_t *child = projection_node->children[i];
+
+            if (!child) {
+                if (skip_node(&(decoder->buff), entry->type, 1)) {
+                    PyErr_SetString(PyExc_ValueError, "invalid data");
+                    Py_CLEAR(result);
+                }
+                continue;
+            }
+
+            PyObject *entry_value = decode_projection_node(decoder, child);
+            if (!entry_value) {
+                Py_CLEAR(result);
+                break;
+            }
+
+            if (PyDict_SetItem(result, entry->name, entry_value))
+                Py_CLEAR(result);
+
+            Py_DECREF(entry_value);
+        }
+
+        return result;
+    }
+
+    // OP_CHOICE
+    size_t id;
+    if (hat_sbs_decode_choice_header(&(decoder->buff), &id)) {
+        PyErr_SetString(PyExc_ValueError, "invalid data");
+        return NULL;
+    }
+
+    if (id >= node->entries_len) {
+        PyErr_SetString(PyExc_ValueError, "invalid choice id");
+        return NULL;
+    }
+
+    entry_t *entry = node->entries + id;
+    projection_node_t *child = projection_node->children[id];
+
+    PyObject *entry_value;
+    if (child) {
+        entry_value = decode_projection_node(decoder, child);
+        if (!entry_value)
+            return NULL;
+
+    } else {
+        if (skip_node(&(decoder->buff), entry->type, 1)) {
+            PyErr_SetString(PyExc_ValueError, "invalid data");
+            return NULL;
+        }
+
+        Py_INCREF(Py_None);
+        entry_value = Py_None;
+    }
+
+    PyObject *result = PyTuple_New(2);
+    if (!result) {
+        Py_DECREF(entry_value);
+        return NULL;
+    }
+
+    Py_INCREF(entry->name);
+    PyTuple_SetItem(result, 0, entry->name);
+    PyTuple_SetItem(result, 1, entry_value);
+
+    return result;
+}
+
+
+static PyObject *encode_root(node_t *root, PyObject *value) {
+    encoder_t encoder;
+    encoder_init(&encoder);
+    PyObject *data = NULL;
+
+    if (!encode_node(&encoder, root, value))
+        data = PyBytes_FromStringAndSize((const char *)encoder.buff.data,
+                                         encoder.buff.pos);
+
+    encoder_destroy(&encoder);
+
+    return data;
+}
+
+
+static PyObject *encode_into_root(node_t *root, PyObject *value,
+                                  PyObject *buffer, Py_ssize_t offset) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(buffer, &view, PyBUF_WRITABLE))
+        return NULL;
+
+    if (offset < 0 || offset > view.len) {
+        PyErr_SetString(PyExc_ValueError, "invalid offset");
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    encoder_t encoder;
+    encoder_init_fixed(&encoder, view.buf, view.len, offset);
+    PyObject *result = NULL;
+
+    if (!encode_node(&encoder, root, value)) {
+        result = PyLong_FromSize_t(encoder.buff.pos - offset);
+        goto cleanup;
+    }
+
+    if (!encoder.overflow)
+        goto cleanup;
+
+    PyErr_Clear();
+    encoder_init(&encoder);
+
+    if (encode_node(&encoder, root, value))
+        goto cleanup;
+
+    PyErr_Format(PyExc_ValueError,
+                 "insufficient buffer size "
+                 "(required %zu bytes, available %zd bytes)",
+                 encoder.buff.pos, view.len - offset);
+
+cleanup:
+
+    encoder_destroy(&encoder);
+    PyBuffer_Release(&view);
+
+    return result;
+}
+
+
+static PyObject *decode_root(node_t *root, PyObject *data, int zero_copy) {
+    if (zero_copy && !PyMemoryView_Check(data)) {
+        PyErr_SetString(PyExc_TypeError, "data must be memoryview");
+        return NULL;
+    }
+
+    Py_buffer view;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE))
+        return NULL;
+
+    decoder_t decoder = {
+        .buff = {.data = view.buf, .size = view.len, .pos = 0},
+        .data = (zero_copy ? data : NULL)};
+
+    PyObject *result = decode_node(&decoder, root);
+
+    PyBuffer_Release(&view);
+
+    return result;
+}
+
+
+static PyObject *encode_many_root(node_t *root, PyObject *values,
+                                  int contiguous) {
+    PyObject *iter = PyObject_GetIter(values);
+    if (!iter)
+        return NULL;
+
+    encoder_t encoder;
+    encoder_init(&encoder);
+
+    // list of encoded values or offsets of contiguously encoded values
+    PyObject *items = PyList_New(0);
+    PyObject *result = NULL;
+
+    if (contiguous && items) {
+        PyObject *offset = PyLong_FromSize_t(0);
+        if (!offset || PyList_Append(items, offset))
+            Py_CLEAR(items);
+        Py_XDECREF(offset);
+    }
+
+    PyObject *value;
+    while (items && (value = PyIter_Next(iter))) {
+        if (!contiguous)
+            encoder.buff.pos = 0;
+
+        if (encode_node(&encoder, root, value)) {
+            Py_DECREF(value);
+            Py_CLEAR(items);
+            break;
+        }
+        Py_DECREF(value);
+
+        PyObject *item =
+            (contiguous ? PyLong_FromSize_t(encoder.buff.pos)
+                        : PyBytes_FromStringAndSize(
+                              (const char *)encoder.buff.data,
+                              encoder.buff.pos));
+        if (!item || PyList_Append(items, item))
+            Py_CLEAR(items);
+        Py_XDECREF(item);
+    }
+
+    if (!items || PyErr_Occurred())
+        goto cleanup;
+
+    if (!contiguous) {
+        result = items;
+        items = NULL;
+        goto cleanup;
+    }
+
+    PyObject *data = PyBytes_FromStringAndSize(
+        (const char *)encoder.buff.data, encoder.buff.pos);
+    if (!data)
+        goto cleanup;
+
+    result = PyTuple_Pack(2, data, items);
+    Py_DECREF(data);
+
+cleanup:
+
+    Py_XDECREF(items);
+    encoder_destroy(&encoder);
+    Py_DECREF(iter);
+
+    return result;
+}
+
+
+static PyObject *decode_item(decoder_t *decoder, node_t *root, size_t start,
+                             size_t stop) {
+    decoder->buff.pos = start;
+    decoder->buff.size = stop;
+    return decode_node(decoder, root);
+}
+
+
+static PyObject *decode_many_root(node_t *root, PyObject *data,
+                                  PyObject *offsets, int zero_copy) {
+    PyObject *items = PySequence_List(offsets == Py_None ? data : offsets);
+    if (!items)
+        return NULL;
+
+    Py_ssize_t items_len = PyList_Size(items);
+    PyObject *result = NULL;
+
+    if (offsets == Py_None) {
+        // data is sequence of encoded values
+        result = PyList_New(items_len);
+
+        for (Py_ssize_t i = 0; result && i < items_len; ++i) {
+            PyObject *item_data = PyList_GetItem(items, i);
+
+            if (zero_copy && !PyMemoryView_Check(item_data)) {
+                PyErr_SetString(PyExc_TypeError, "data must be memoryview");
+                Py_CLEAR(result);
+                break;
+            }
+
+            Py_buffer view;
+            if (PyObject_GetBuffer(item_data, &view, PyBUF_SIMPLE)) {
+                Py_CLEAR(result);
+                break;
+            }
+
+            decoder_t decoder = {.buff = {.data = view.buf},
+                                 .data = (zero_copy ? item_data : NULL)};
+            PyObject *value = decode_item(&decoder, root, 0, view.len);
+            PyBuffer_Release(&view);
+
+            if (!value || PyList_SetItem(result, i, value))
+                Py_CLEAR(result);
+        }
+
+        goto cleanup;
+    }
+
+    // data is contiguous buffer and items are offsets
+    if (zero_copy && !PyMemoryView_Check(data)) {
+        PyErr_SetString(PyExc_TypeError, "data must be memoryview");
+        goto cleanup;
+    }
+
+    Py_buffer view;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE))
+        goto cleanup;
+
+    decoder_t decoder = {.buff = {.data = view.buf},
+                         .data = (zero_copy ? data : NULL)};
+
+    result = PyList_New(items_len > 0 ? items_len - 1 : 0);
+
+    size_t start = 0;
+    for (Py_ssize_t i = 0; result && i < items_len; ++i) {
+        Py_ssize_t stop = PyLong_AsSsize_t(PyList_GetItem(items, i));
+        if (stop < 0 && PyErr_Occurred()) {
+            Py_CLEAR(result);
+            break;
+        }
+
+        if (stop < 0 || stop > view.len || (i && (size_t)stop < start)) {
+            PyErr_SetString(PyExc_ValueError, "invalid offsets");
+            Py_CLEAR(result);
+            break;
+        }
+
+        if (i) {
+            PyObject *value = decode_item(&decoder, root, start, stop);
+            if (!value || PyList_SetItem(result, i - 1, value))
+                Py_CLEAR(result);
+        }
+
+        start = stop;
+    }
+
+    PyBuffer_Release(&view);
+
+cleanup:
+
+    Py_DECREF(items);
+
+    return result;
+}
+
+
+static PyObject *encode(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *value;
+
+    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &value))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    PyObject *data = encode_root(root, value);
+
+    Py_XDECREF((PyObject *)temp_program);
+
+    return data;
+}
+
+
+static PyObject *encode_into(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *value;
+    PyObject *buffer;
+    Py_ssize_t offset;
+
+    if (!PyArg_ParseTuple(args, "OOOOn", &refs, &t, &value, &buffer, &offset))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    PyObject *result = encode_into_root(root, value, buffer, offset);
+
+    Py_XDECREF((PyObject *)temp_program);
+
+    return result;
+}
+
+
+static PyObject *decode(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *data;
+    int zero_copy;
+
+    if (!PyArg_ParseTuple(args, "OOOp", &refs, &t, &data, &zero_copy))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    PyObject *result = decode_root(root, data, zero_copy);
+
+    Py_XDECREF((PyObject *)temp_program);
+
+    return result;
+}
+
+
+static PyObject *encode_many(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *values;
+    int contiguous;
+
+    if (!PyArg_ParseTuple(args, "OOOp", &refs, &t, &values, &contiguous))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    PyObject *result = encode_many_root(root, values, contiguous);
+
+    Py_XDECREF((PyObject *)temp_program);
+
+    return result;
+}
+
+
+static PyObject *decode_many(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *data;
+    PyObject *offsets;
+    int zero_copy;
+
+    if (!PyArg_ParseTuple(args, "OOOOp", &refs, &t, &data, &offsets,
+                          &zero_copy))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    PyObject *result = decode_many_root(root, data, offsets, zero_copy);
+
+    Py_XDECREF((PyObject *)temp_program);
+
+    return result;
+}
+
+
+static PyObject *encode_iov(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *value;
+    Py_ssize_t min_ref_size;
+
+    if (!PyArg_ParseTuple(args, "OOOn", &refs, &t, &value, &min_ref_size))
+        return NULL;
+
+    if (min_ref_size < 0) {
+        PyErr_SetString(PyExc_ValueError, "invalid min_ref_size");
+        return NULL;
+    }
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    encoder_t encoder;
+    encoder_init(&encoder);
+    encoder.min_ref_size = min_ref_size;
+    encoder.segments = PyList_New(0);
+
+    if (encoder.segments &&
+        (encode_node(&encoder, root, value) || encoder_flush(&encoder)))
+        Py_CLEAR(encoder.segments);
+
+    encoder_destroy(&encoder);
+    Py_XDECREF((PyObject *)temp_program);
+
+    return encoder.segments;
+}
+
+
+static PyObject *encoded_size(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *value;
+
+    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &value))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    size_t size = 0;
+    PyObject *result = (get_encoded_size(root, value, &size)
+                            ? NULL
+                            : PyLong_FromSize_t(size));
+
+    Py_XDECREF((PyObject *)temp_program);
+
+    return result;
+}
+
+
+static PyObject *encoded_sizes(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *values;
+
+    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &values))
+        return NULL;
+
+    PyObject *iter = PyObject_GetIter(values);
+    if (!iter)
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root) {
+        Py_DECREF(iter);
+        return NULL;
+    }
+
+    PyObject *result = PyList_New(0);
+
+    PyObject *value;
+    while (result && (value = PyIter_Next(iter))) {
+        size_t size = 0;
+        int err = get_encoded_size(root, value, &size);
+        Py_DECREF(value);
+        if (err) {
+            Py_CLEAR(result);
+            break;
+        }
+
+        PyObject *item = PyLong_FromSize_t(size);
+        if (!item || PyList_Append(result, item))
+            Py_CLEAR(result);
+        Py_XDECREF(item);
+    }
+
+    if (PyErr_Occurred())
+        Py_CLEAR(result);
+
+    Py_XDECREF((PyObject *)temp_program);
+    Py_DECREF(iter);
+
+    return result;
+}
+
+
+static PyObject *encode_columns(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *columns;
+
+    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &columns))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
+
+    encoder_t encoder;
+    encoder_init(&encoder);
+    PyObject *data = NULL;
+
+    if (encode_columns_node(&encoder, root, columns))
+        goto cleanup;
+
+    data = PyBytes_FromStringAndSize((const char *)encoder.buff.data,
+                                     encoder.buff.pos);
+
+cleanup:
+
+    encoder_destroy(&encoder);
+    Py_XDECREF((PyObject *)temp_program);
+
+    return data;
+}
+
+
+static PyObject *decode_columns(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return NULL;
+
+    PyObject *refs;
+    PyObject *t;
+    PyObject *data;
+    int zero_copy;
+
+    if (!PyArg_ParseTuple(args, "OOOp", &refs, &t, &data, &zero_copy))
+        return NULL;
+
+    if (zero_copy && !PyMemoryView_Check(data)) {
+        PyErr_SetString(PyExc_TypeError, "data must be memoryview");
+        return NULL;
+    }
+
+    Py_buffer view;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE))
+        return NULL;
+
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    decoder_t decoder = {
+        .buff = {.data = view.buf, .size = view.len, .pos = 0},
+        .data = (zero_copy ? data : NULL)};
+
+    PyObject *result = decode_columns_node(&decoder, root);
+
+    Py_XDECREF((PyObject *)temp_program);
+    PyBuffer_Release(&view);
+
+    return result;
 }
 
 
-static PyObject *decode_string(hat_buff_t *buff) {
-    uint8_t *value;
-    size_t value_len;
-    if (hat_sbs_decode_string(buff, &value, &value_len))
+static PyObject *skip(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
         return NULL;
-    return PyUnicode_DecodeUTF8((const char *)value, value_len, NULL);
-}
 
+    PyObject *refs;
+    PyObject *t;
+    PyObject *data;
+    Py_ssize_t count;
 
-static PyObject *decode_bytes(hat_buff_t *buff) {
-    uint8_t *value;
-    size_t value_len;
-    if (hat_sbs_decode_bytes(buff, &value, &value_len))
+    if (!PyArg_ParseTuple(args, "OOOn", &refs, &t, &data, &count))
         return NULL;
-    return PyBytes_FromStringAndSize((const char *)value, value_len);
-}
 
+    if (count < 0) {
+        PyErr_SetString(PyExc_ValueError, "invalid count");
+        return NULL;
+    }
 
-static PyObject *decode_array(hat_buff_t *buff, module_state_t *module_state,
-                              PyObject *refs, PyObject *t) {
-    size_t len;
-    if (hat_sbs_decode_array_header(buff, &len))
+    Py_buffer view;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE))
         return NULL;
 
-    PyObject *item_type = PyObject_GetAttrString(t, "t");
-    if (!item_type)
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root) {
+        PyBuffer_Release(&view);
         return NULL;
-    Py_DECREF(item_type);
+    }
 
-    PyObject *result = PyList_New(len);
-    for (size_t i = 0; result && i < len; ++i) {
-        PyObject *item = decode_generic(buff, module_state, refs, item_type);
+    PyObject *result = NULL;
+    hat_buff_t buff = {.data = view.buf, .size = view.len, .pos = 0};
 
-        if (item && PyList_SetItem(result, i, item))
-            Py_CLEAR(item);
+    if (root->op == OP_UNRESOLVED) {
+        set_unresolved_error(root);
 
-        if (!item)
-            Py_CLEAR(result);
+    } else {
+        int err;
+
+        // skipping doesn't access Python objects
+        Py_BEGIN_ALLOW_THREADS;
+        err = skip_node(&buff, root, count);
+        Py_END_ALLOW_THREADS;
+
+        if (err) {
+            PyErr_SetString(PyExc_ValueError, "invalid data");
+        } else {
+            result = PyLong_FromSize_t(buff.pos);
+        }
     }
 
+    Py_XDECREF((PyObject *)temp_program);
+    PyBuffer_Release(&view);
+
     return result;
 }
 
 
-static PyObject *decode_record(hat_buff_t *buff, module_state_t *module_state,
-                               PyObject *refs, PyObject *t) {
-    PyObject *t_entries = PyObject_GetAttrString(t, "entries");
-    if (!t_entries)
+static PyObject *scan_frames(PyObject *self, PyObject *args) {
+    PyObject *data;
+    Py_ssize_t max_size;
+
+    if (!PyArg_ParseTuple(args, "On", &data, &max_size))
         return NULL;
-    Py_DECREF(t_entries);
 
-    Py_ssize_t size = PyList_Size(t_entries);
-    if (size < 0)
+    Py_buffer view;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE))
         return NULL;
 
-    if (!size) {
-        Py_INCREF(Py_None);
-        return Py_None;
-    }
+    hat_buff_t buff = {.data = view.buf, .size = view.len, .pos = 0};
 
-    PyObject *result = PyDict_New();
-    for (size_t i = 0; result && i < size; ++i) {
-        PyObject *entry_name_type = PyList_GetItem(t_entries, i);
-        if (!entry_name_type) {
+    PyObject *result = PyList_New(0);
+    while (result && hat_buff_available(&buff)) {
+        size_t available = hat_buff_available(&buff);
+
+        size_t header_size = 0;
+        while (header_size < available &&
+               header_size < FRAME_HEADER_MAX_SIZE &&
+               !(buff.data[buff.pos + header_size] & 0x80))
+            header_size += 1;
+
+        if (header_size >= FRAME_HEADER_MAX_SIZE) {
+            PyErr_SetString(PyExc_ValueError, "invalid frame header");
             Py_CLEAR(result);
             break;
         }
 
-        PyObject *entry_name = PyTuple_GetItem(entry_name_type, 0);
-        PyObject *entry_type = PyTuple_GetItem(entry_name_type, 1);
-        if (!entry_name || !entry_type) {
+        // incomplete header
+        if (header_size >= available)
+            break;
+
+        int64_t size;
+        size_t start = buff.pos;
+        hat_sbs_decode_integer(&buff, &size);
+
+        if (size < 0 || (max_size >= 0 && size > max_size)) {
+            PyErr_Format(PyExc_ValueError, "invalid frame size %lld",
+                         (long long)size);
             Py_CLEAR(result);
             break;
         }
 
-        PyObject *entry = decode_generic(buff, module_state, refs, entry_type);
-        if (!entry) {
-            Py_CLEAR(result);
+        // incomplete frame
+        if (hat_buff_available(&buff) < (size_t)size) {
+            buff.pos = start;
             break;
         }
 
-        if (PyDict_SetItem(result, entry_name, entry))
+        PyObject *frame = Py_BuildValue("(nn)", (Py_ssize_t)buff.pos,
+                                        (Py_ssize_t)(buff.pos + size));
+        if (!frame || PyList_Append(result, frame))
             Py_CLEAR(result);
+        Py_XDECREF(frame);
 
-        Py_DECREF(entry);
+        buff.pos += size;
     }
 
+    PyBuffer_Release(&view);
+
     return result;
 }
 
 
-static PyObject *decode_choice(hat_buff_t *buff, module_state_t *module_state,
-                               PyObject *refs, PyObject *t) {
-    PyObject *t_entries = PyObject_GetAttrString(t, "entries");
-    if (!t_entries)
-        return NULL;
-    Py_DECREF(t_entries);
-
-    Py_ssize_t size = PyList_Size(t_entries);
-    if (size < 0)
+static PyObject *decode_projection(PyObject *self, PyObject *args) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
         return NULL;
 
-    if (!size) {
-        Py_INCREF(Py_None);
-        return Py_None;
-    }
+    PyObject *projection;
+    PyObject *data;
+    int zero_copy;
 
-    size_t id;
-    if (hat_sbs_decode_choice_header(buff, &id))
+    if (!PyArg_ParseTuple(args, "OOp", &projection, &data, &zero_copy))
         return NULL;
 
-    PyObject *entry_name_type = PyList_GetItem(t_entries, id);
-    if (!entry_name_type)
+    if (!is_type(projection, module_state->Projection)) {
+        PyErr_SetString(PyExc_TypeError, "invalid projection");
         return NULL;
+    }
 
-    PyObject *entry_name = PyTuple_GetItem(entry_name_type, 0);
-    PyObject *entry_type = PyTuple_GetItem(entry_name_type, 1);
-    if (!entry_name || !entry_type)
+    if (zero_copy && !PyMemoryView_Check(data)) {
+        PyErr_SetString(PyExc_TypeError, "data must be memoryview");
         return NULL;
+    }
 
-    PyObject *entry = decode_generic(buff, module_state, refs, entry_type);
-    if (!entry)
+    Py_buffer view;
+    if (PyObject_GetBuffer(data, &view, PyBUF_SIMPLE))
         return NULL;
-    Py_INCREF(entry_name);
 
-    PyObject *result = PyTuple_New(2);
-    if (!result)
-        goto cleanup;
+    decoder_t decoder = {
+        .buff = {.data = view.buf, .size = view.len, .pos = 0},
+        .data = (zero_copy ? data : NULL)};
 
-    if (PyTuple_SetItem(result, 0, entry_name))
-        goto cleanup;
-    entry_name = NULL;
+    PyObject *result = decode_projection_node(
+        &decoder, ((projection_t *)projection)->root);
 
-    if (PyTuple_SetItem(result, 1, entry))
-        goto cleanup;
-    entry = NULL;
+    PyBuffer_Release(&view);
 
-cleanup:
+    return result;
+}
 
-    Py_XDECREF(entry_name);
-    Py_XDECREF(entry);
 
-    if (PyErr_Occurred())
-        Py_CLEAR(result);
+static void program_dealloc(program_t *self) {
+    PyTypeObject *tp = Py_TYPE((PyObject *)self);
 
-    return result;
+    for (size_t i = 0; i < self->nodes_len; ++i) {
+        if (self->nodes[i].op == OP_UNRESOLVED)
+            Py_XDECREF(self->nodes[i].ref);
+        Py_XDECREF(self->nodes[i].entry_ids);
+        Py_XDECREF(self->nodes[i].record_class);
+    }
+
+    PyMem_Free(self->nodes);
+    PyMem_Free(self->entries);
+    Py_XDECREF(self->ref_nodes);
+    Py_XDECREF(self->type_nodes);
+    Py_XDECREF(self->type);
+    Py_XDECREF(self->refs);
+    Py_XDECREF(self->record_classes);
+    Py_XDECREF(self->array_type);
+
+    ((freefunc)PyType_GetSlot(tp, Py_tp_free))(self);
+    Py_DECREF(tp);
 }
 
 
-static ssize_t encode_generic(hat_buff_t *buff, module_state_t *module_state,
-                              PyObject *refs, PyObject *t, PyObject *value) {
-    int result;
+static PyObject *program_new(PyTypeObject *type, PyObject *args,
+                             PyObject *kwargs) {
+    PyObject *module = PyType_GetModule(type);
+    if (!module)
+        return NULL;
 
-    t = resolve_ref(module_state, refs, t);
-    if (!t)
-        return -1;
+    module_state_t *module_state = PyModule_GetState(module);
+    if (!module_state)
+        return NULL;
 
-    if (is_type(t, module_state->common_NoneType))
-        return encode_none();
+    PyObject *refs;
+    PyObject *record_classes = NULL;
+    int typed_arrays = false;
+    if (!PyArg_ParseTuple(args, "O|Op", &refs, &record_classes,
+                          &typed_arrays))
+        return NULL;
 
-    if (is_type(t, module_state->common_BooleanType))
-        return encode_boolean(buff, value);
+    return (PyObject *)program_create(module_state, refs, record_classes,
+                                      typed_arrays, NULL);
+}
 
-    if (is_type(t, module_state->common_IntegerType))
-        return encode_integer(buff, value);
 
-    if (is_type(t, module_state->common_FloatType))
-        return encode_float(buff, value);
+static PyObject *program_get_refs(program_t *self, void *closure) {
+    Py_INCREF(self->refs);
+    return self->refs;
+}
 
-    if (is_type(t, module_state->common_StringType))
-        return encode_string(buff, value);
 
-    if (is_type(t, module_state->common_BytesType))
-        return encode_bytes(buff, value);
+static PyGetSetDef program_getset[] = {
+    {"refs", (getter)program_get_refs, NULL, NULL, NULL},
+    {NULL, NULL, NULL, NULL, NULL}};
 
-    if (is_type(t, module_state->common_ArrayType))
-        return encode_array(buff, module_state, refs, t, value);
 
-    if (is_type(t, module_state->common_RecordType))
-        return encode_record(buff, module_state, refs, t, value);
+static PyType_Slot program_slots[] = {{Py_tp_new, program_new},
+                                      {Py_tp_dealloc, program_dealloc},
+                                      {Py_tp_getset, program_getset},
+                                      {0, NULL}};
 
-    if (is_type(t, module_state->common_ChoiceType))
-        return encode_choice(buff, module_state, refs, t, value);
 
-    PyErr_SetNone(PyExc_ValueError);
-    return -1;
+static PyType_Spec program_spec = {.name = "_cserializer.Program",
+                                   .basicsize = sizeof(program_t),
+                                   .itemsize = 0,
+                                   .flags = Py_TPFLAGS_DEFAULT,
+                                   .slots = program_slots};
+
+
+static void projection_dealloc(projection_t *self) {
+    PyTypeObject *tp = Py_TYPE((PyObject *)self);
+
+    projection_node_free(self->root);
+    Py_XDECREF((PyObject *)self->program);
+
+    ((freefunc)PyType_GetSlot(tp, Py_tp_free))(self);
+    Py_DECREF(tp);
 }
 
 
-static PyObject *decode_generic(hat_buff_t *buff, module_state_t *module_state,
-                                PyObject *refs, PyObject *t) {
-    int result;
+static PyObject *projection_new(PyTypeObject *type, PyObject *args,
+                                PyObject *kwargs) {
+    PyObject *module = PyType_GetModule(type);
+    if (!module)
+        return NULL;
 
-    t = resolve_ref(module_state, refs, t);
-    if (!t)
+    module_state_t *module_state = PyModule_GetState(module);
+    if (!module_state)
         return NULL;
 
-    if (is_type(t, module_state->common_NoneType))
-        return decode_none();
+    PyObject *refs;
+    PyObject *t;
+    PyObject *fields;
+    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &fields))
+        return NULL;
 
-    if (is_type(t, module_state->common_BooleanType))
-        return decode_boolean(buff);
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
+        return NULL;
 
-    if (is_type(t, module_state->common_IntegerType))
-        return decode_integer(buff);
+    projection_t *projection = (projection_t *)PyType_GenericAlloc(type, 0);
+    if (!projection) {
+        Py_XDECREF((PyObject *)temp_program);
+        return NULL;
+    }
 
-    if (is_type(t, module_state->common_FloatType))
-        return decode_float(buff);
+    // projection nodes reference program nodes
+    if (temp_program) {
+        projection->program = temp_program;
+    } else {
+        Py_INCREF(refs);
+        projection->program = (program_t *)refs;
+    }
 
-    if (is_type(t, module_state->common_StringType))
-        return decode_string(buff);
+    projection->root = projection_node_create(root, fields);
+    if (!projection->root) {
+        Py_DECREF((PyObject *)projection);
+        return NULL;
+    }
 
-    if (is_type(t, module_state->common_BytesType))
-        return decode_bytes(buff);
+    return (PyObject *)projection;
+}
 
-    if (is_type(t, module_state->common_ArrayType))
-        return decode_array(buff, module_state, refs, t);
 
-    if (is_type(t, module_state->common_RecordType))
-        return decode_record(buff, module_state, refs, t);
+static PyType_Slot projection_slots[] = {{Py_tp_new, projection_new},
+                                         {Py_tp_dealloc, projection_dealloc},
+                                         {0, NULL}};
 
-    if (is_type(t, module_state->common_ChoiceType))
-        return decode_choice(buff, module_state, refs, t);
 
-    PyErr_SetNone(PyExc_ValueError);
-    return NULL;
+static PyType_Spec projection_spec = {.name = "_cserializer.Projection",
+                                      .basicsize = sizeof(projection_t),
+                                      .itemsize = 0,
+                                      .flags = Py_TPFLAGS_DEFAULT,
+                                      .slots = projection_slots};
+
+
+static void codec_dealloc(codec_t *self) {
+    PyTypeObject *tp = Py_TYPE((PyObject *)self);
+
+    Py_XDECREF((PyObject *)self->program);
+
+    ((freefunc)PyType_GetSlot(tp, Py_tp_free))(self);
+    Py_DECREF(tp);
 }
 
 
-static PyObject *encode(PyObject *self, PyObject *args) {
-    module_state_t *module_state = PyModule_GetState(self);
+static PyObject *codec_new(PyTypeObject *type, PyObject *args,
+                           PyObject *kwargs) {
+    PyObject *module = PyType_GetModule(type);
+    if (!module)
+        return NULL;
+
+    module_state_t *module_state = PyModule_GetState(module);
     if (!module_state)
         return NULL;
 
     PyObject *refs;
     PyObject *t;
-    PyObject *value;
-
-    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &value))
+    if (!PyArg_ParseTuple(args, "OO", &refs, &t))
         return NULL;
 
-    ssize_t data_size = encode_generic(NULL, module_state, refs, t, value);
-    if (data_size < 0)
+    program_t *temp_program;
+    node_t *root = get_root(module_state, refs, t, &temp_program);
+    if (!root)
         return NULL;
 
-    PyObject *data = PyBytes_FromStringAndSize(NULL, data_size);
-    if (!data)
+    codec_t *codec = (codec_t *)PyType_GenericAlloc(type, 0);
+    if (!codec) {
+        Py_XDECREF((PyObject *)temp_program);
         return NULL;
+    }
+
+    // root references program nodes
+    if (temp_program) {
+        codec->program = temp_program;
+    } else {
+        Py_INCREF(refs);
+        codec->program = (program_t *)refs;
+    }
 
-    hat_buff_t buff = {
-        .data = (uint8_t *)PyBytes_AsString(data), .size = data_size, .pos = 0};
+    codec->root = root;
 
-    if (!buff.data) {
-        Py_DECREF(data);
+    return (PyObject *)codec;
+}
+
+
+static PyObject *get_zero_copy_data(PyObject *data) {
+    PyObject *view = PyMemoryView_FromObject(data);
+    if (!view)
         return NULL;
-    }
 
-    ssize_t result = encode_generic(&buff, module_state, refs, t, value);
-    if (result || hat_buff_available(&buff)) {
-        Py_DECREF(data);
+    PyObject *bytes_view = PyObject_CallMethod(view, "cast", "s", "B");
+    Py_DECREF(view);
+    if (!bytes_view)
         return NULL;
-    }
 
-    return data;
+    PyObject *result = PyObject_CallMethod(bytes_view, "toreadonly", NULL);
+    Py_DECREF(bytes_view);
+
+    return result;
 }
 
 
-static PyObject *decode(PyObject *self, PyObject *args) {
-    module_state_t *module_state = PyModule_GetState(self);
-    if (!module_state)
+static PyObject *codec_encode(codec_t *self, PyObject *value) {
+    return encode_root(self->root, value);
+}
+
+
+static PyObject *codec_encode_into(codec_t *self, PyObject *args,
+                                   PyObject *kwargs) {
+    static char *kwlist[] = {"value", "buffer", "offset", NULL};
+
+    PyObject *value;
+    PyObject *buffer;
+    Py_ssize_t offset = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|n", kwlist, &value,
+                                     &buffer, &offset))
         return NULL;
 
-    PyObject *refs;
-    PyObject *t;
+    return encode_into_root(self->root, value, buffer, offset);
+}
+
+
+static PyObject *codec_decode(codec_t *self, PyObject *args,
+                              PyObject *kwargs) {
+    static char *kwlist[] = {"data", "zero_copy", NULL};
+
     PyObject *data;
+    int zero_copy = false;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$p", kwlist, &data,
+                                     &zero_copy))
+        return NULL;
+
+    if (!zero_copy)
+        return decode_root(self->root, data, false);
+
+    data = get_zero_copy_data(data);
+    if (!data)
+        return NULL;
+
+    PyObject *result = decode_root(self->root, data, true);
+    Py_DECREF(data);
+
+    return result;
+}
+
+
+static PyObject *codec_encode_many(codec_t *self, PyObject *args,
+                                   PyObject *kwargs) {
+    static char *kwlist[] = {"values", "contiguous", NULL};
+
+    PyObject *values;
+    int contiguous = false;
 
-    if (!PyArg_ParseTuple(args, "OOO", &refs, &t, &data))
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$p", kwlist, &values,
+                                     &contiguous))
         return NULL;
 
-    if (!PyMemoryView_Check(data))
+    return encode_many_root(self->root, values, contiguous);
+}
+
+
+static PyObject *codec_decode_many(codec_t *self, PyObject *args,
+                                   PyObject *kwargs) {
+    static char *kwlist[] = {"data", "offsets", "zero_copy", NULL};
+
+    PyObject *data;
+    PyObject *offsets = Py_None;
+    int zero_copy = false;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|O$p", kwlist, &data,
+                                     &offsets, &zero_copy))
         return NULL;
 
-    void *buff_data;
-    Py_ssize_t buff_size;
-    if (get_legacy_buffer(data, &buff_data, &buff_size))
+    if (!zero_copy)
+        return decode_many_root(self->root, data, offsets, false);
+
+    if (offsets != Py_None) {
+        data = get_zero_copy_data(data);
+
+    } else {
+        PyObject *items = PySequence_List(data);
+        if (!items)
+            return NULL;
+
+        Py_ssize_t items_len = PyList_Size(items);
+        for (Py_ssize_t i = 0; items && i < items_len; ++i) {
+            PyObject *item = get_zero_copy_data(PyList_GetItem(items, i));
+            if (!item || PyList_SetItem(items, i, item))
+                Py_CLEAR(items);
+        }
+
+        data = items;
+    }
+
+    if (!data)
         return NULL;
 
-    hat_buff_t buff = {.data = buff_data, .size = buff_size, .pos = 0};
+    PyObject *result = decode_many_root(self->root, data, offsets, true);
+    Py_DECREF(data);
+
+    return result;
+}
+
+
+static PyMethodDef codec_methods[] = {
+    {"encode", (PyCFunction)codec_encode, METH_O, NULL},
+    {"encode_into", (PyCFunction)(void (*)(void))codec_encode_into,
+     METH_VARARGS | METH_KEYWORDS, NULL},
+    {"decode", (PyCFunction)(void (*)(void))codec_decode,
+     METH_VARARGS | METH_KEYWORDS, NULL},
+    {"encode_many", (PyCFunction)(void (*)(void))codec_encode_many,
+     METH_VARARGS | METH_KEYWORDS, NULL},
+    {"decode_many", (PyCFunction)(void (*)(void))codec_decode_many,
+     METH_VARARGS | METH_KEYWORDS, NULL},
+    {NULL, NULL, 0, NULL}};
+
+
+static PyType_Slot codec_slots[] = {{Py_tp_new, codec_new},
+                                    {Py_tp_dealloc, codec_dealloc},
+                                    {Py_tp_methods, codec_methods},
+                                    {0, NULL}};
+
+
+static PyType_Spec codec_spec = {.name = "_cserializer.Codec",
+                                 .basicsize = sizeof(codec_t),
+                                 .itemsize = 0,
+                                 .flags = Py_TPFLAGS_DEFAULT,
+                                 .slots = codec_slots};
 
-    return decode_generic(&buff, module_state, refs, t);
+
+static int module_traverse(PyObject *self, visitproc visit, void *arg) {
+    module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return 0;
+    Py_VISIT(module_state->common_Ref);
+    Py_VISIT(module_state->common_NoneType);
+    Py_VISIT(module_state->common_BooleanType);
+    Py_VISIT(module_state->common_IntegerType);
+    Py_VISIT(module_state->common_FloatType);
+    Py_VISIT(module_state->common_StringType);
+    Py_VISIT(module_state->common_BytesType);
+    Py_VISIT(module_state->common_ArrayType);
+    Py_VISIT(module_state->common_RecordType);
+    Py_VISIT(module_state->common_ChoiceType);
+    Py_VISIT(module_state->Program);
+    Py_VISIT(module_state->Projection);
+    Py_VISIT(module_state->Codec);
+    return 0;
 }
 
 
 static int module_clear(PyObject *self) {
-    if (!self)
-        return 0;
     module_state_t *module_state = PyModule_GetState(self);
+    if (!module_state)
+        return 0;
     Py_CLEAR(module_state->common_Ref);
     Py_CLEAR(module_state->common_NoneType);
     Py_CLEAR(module_state->common_BooleanType);
@@ -605,117 +3625,158 @@ static int module_clear(PyObject *self) {
     Py_CLEAR(module_state->common_ArrayType);
     Py_CLEAR(module_state->common_RecordType);
     Py_CLEAR(module_state->common_ChoiceType);
+    Py_CLEAR(module_state->Program);
+    Py_CLEAR(module_state->Projection);
+    Py_CLEAR(module_state->Codec);
     return 0;
 }
 
 
-PyMethodDef module_methods[] = {{"encode", encode, METH_VARARGS, NULL},
-                                {"decode", decode, METH_VARARGS, NULL},
-                                {NULL, NULL, 0, NULL}};
+static void module_free(void *self) { module_clear((PyObject *)self); }
 
 
-struct PyModuleDef module_def = {PyModuleDef_HEAD_INIT,
-                                 "_cserializer",
-                                 NULL,
-                                 sizeof(module_state_t),
-                                 module_methods,
-                                 NULL,
-                                 NULL,
-                                 module_clear,
-                                 NULL};
+PyMethodDef module_methods[] = {
+    {"encode", encode, METH_VARARGS, NULL},
+    {"encode_into", encode_into, METH_VARARGS, NULL},
+    {"decode", decode, METH_VARARGS, NULL},
+    {"encode_many", encode_many, METH_VARARGS, NULL},
+    {"decode_many", decode_many, METH_VARARGS, NULL},
+    {"encode_iov", encode_iov, METH_VARARGS, NULL},
+    {"encoded_size", encoded_size, METH_VARARGS, NULL},
+    {"encoded_sizes", encoded_sizes, METH_VARARGS, NULL},
+    {"encode_columns", encode_columns, METH_VARARGS, NULL},
+    {"decode_columns", decode_columns, METH_VARARGS, NULL},
+    {"skip", skip, METH_VARARGS, NULL},
+    {"decode_projection", decode_projection, METH_VARARGS, NULL},
+    {"scan_frames", scan_frames, METH_VARARGS, NULL},
+    {NULL, NULL, 0, NULL}};
 
 
-PyMODINIT_FUNC PyInit__cserializer() {
-    PyObject *module = PyModule_Create(&module_def);
-    if (!module)
-        return NULL;
-
+static int module_exec(PyObject *module) {
     module_state_t *module_state = PyModule_GetState(module);
-    module_state->common_Ref = NULL;
-    module_state->common_NoneType = NULL;
-    module_state->common_BooleanType = NULL;
-    module_state->common_IntegerType = NULL;
-    module_state->common_FloatType = NULL;
-    module_state->common_StringType = NULL;
-    module_state->common_BytesType = NULL;
-    module_state->common_ArrayType = NULL;
-    module_state->common_RecordType = NULL;
-    module_state->common_ChoiceType = NULL;
+    if (!module_state)
+        return -1;
 
+    // module state is released by module_free in case of error
     PyObject *common = PyImport_ImportModule("hat.sbs.serializer.common");
     if (!common)
-        goto cleanup;
+        return -1;
 
     PyObject *common_dict = PyModule_GetDict(common);
     if (!common_dict)
-        goto cleanup;
+        goto error;
 
     module_state->common_Ref = PyMapping_GetItemString(common_dict, "Ref");
     if (!module_state->common_Ref)
-        goto cleanup;
+        goto error;
 
     module_state->common_NoneType =
         PyMapping_GetItemString(common_dict, "NoneType");
     if (!module_state->common_NoneType)
-        goto cleanup;
+        goto error;
 
     module_state->common_BooleanType =
         PyMapping_GetItemString(common_dict, "BooleanType");
     if (!module_state->common_BooleanType)
-        goto cleanup;
+        goto error;
 
     module_state->common_IntegerType =
         PyMapping_GetItemString(common_dict, "IntegerType");
     if (!module_state->common_IntegerType)
-        goto cleanup;
+        goto error;
 
     module_state->common_FloatType =
         PyMapping_GetItemString(common_dict, "FloatType");
     if (!module_state->common_FloatType)
-        goto cleanup;
+        goto error;
 
     module_state->common_StringType =
         PyMapping_GetItemString(common_dict, "StringType");
     if (!module_state->common_StringType)
-        goto cleanup;
+        goto error;
 
     module_state->common_BytesType =
         PyMapping_GetItemString(common_dict, "BytesType");
     if (!module_state->common_BytesType)
-        goto cleanup;
+        goto error;
 
     module_state->common_ArrayType =
         PyMapping_GetItemString(common_dict, "ArrayType");
     if (!module_state->common_ArrayType)
-        goto cleanup;
+        goto error;
 
     module_state->common_RecordType =
         PyMapping_GetItemString(common_dict, "RecordType");
     if (!module_state->common_RecordType)
-        goto cleanup;
+        goto error;
 
     module_state->common_ChoiceType =
         PyMapping_GetItemString(common_dict, "ChoiceType");
     if (!module_state->common_ChoiceType)
-        goto cleanup;
+        goto error;
 
-cleanup:
+    module_state->Program =
+        PyType_FromModuleAndSpec(module, &program_spec, NULL);
+    if (!module_state->Program)
+        goto error;
+
+    Py_INCREF(module_state->Program);
+    if (PyModule_AddObject(module, "Program", module_state->Program)) {
+        Py_DECREF(module_state->Program);
+        goto error;
+    }
 
-    Py_XDECREF(common);
+    module_state->Projection =
+        PyType_FromModuleAndSpec(module, &projection_spec, NULL);
+    if (!module_state->Projection)
+        goto error;
 
-    if (PyErr_Occurred()) {
-        Py_XDECREF(module_state->common_Ref);
-        Py_XDECREF(module_state->common_NoneType);
-        Py_XDECREF(module_state->common_BooleanType);
-        Py_XDECREF(module_state->common_IntegerType);
-        Py_XDECREF(module_state->common_FloatType);
-        Py_XDECREF(module_state->common_StringType);
-        Py_XDECREF(module_state->common_BytesType);
-        Py_XDECREF(module_state->common_ArrayType);
-        Py_XDECREF(module_state->common_RecordType);
-        Py_XDECREF(module_state->common_ChoiceType);
-        Py_CLEAR(module);
+    Py_INCREF(module_state->Projection);
+    if (PyModule_AddObject(module, "Projection",
+                           module_state->Projection)) {
+        Py_DECREF(module_state->Projection);
+        goto error;
+    }
+
+    module_state->Codec = PyType_FromModuleAndSpec(module, &codec_spec, NULL);
+    if (!module_state->Codec)
+        goto error;
+
+    Py_INCREF(module_state->Codec);
+    if (PyModule_AddObject(module, "Codec", module_state->Codec)) {
+        Py_DECREF(module_state->Codec);
+        goto error;
     }
 
-    return module;
+    Py_DECREF(common);
+    return 0;
+
+error:
+    Py_DECREF(common);
+    return -1;
 }
+
+
+static PyModuleDef_Slot module_slots[] = {
+    {Py_mod_exec, module_exec},
+#ifdef Py_mod_multiple_interpreters
+    {Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED},
+#endif
+#ifdef Py_mod_gil
+    {Py_mod_gil, Py_MOD_GIL_NOT_USED},
+#endif
+    {0, NULL}};
+
+
+struct PyModuleDef module_def = {PyModuleDef_HEAD_INIT,
+                                 "_cserializer",
+                                 NULL,
+                                 sizeof(module_state_t),
+                                 module_methods,
+                                 module_slots,
+                                 module_traverse,
+                                 module_clear,
+                                 module_free};
+
+
+PyMODINIT_FUNC PyInit__cserializer() { return PyModuleDef_Init(&module_def); }
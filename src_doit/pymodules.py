@@ -1,4 +1,5 @@
 from pathlib import Path
+import sysconfig
 
 from hat.doit import common
 from hat.doit.c import (get_py_ext_suffix,
@@ -15,7 +16,9 @@ __all__ = ['task_pymodules',
            'task_pymodules_serializer_cleanup']
 
 
-py_limited_api = next(iter(common.PyVersion))
+# free-threaded builds don't support limited API
+py_limited_api = (None if sysconfig.get_config_var('Py_GIL_DISABLED')
+                  else common.PyVersion.CP311)
 py_ext_suffix = get_py_ext_suffix(py_limited_api=py_limited_api)
 
 build_dir = Path('build')
@@ -52,18 +52,35 @@ Example usage of SBS serializer::
 
 """
 
-from hat.sbs.common import Ref, Data
-from hat.sbs.repository import Repository
-from hat.sbs.serializer import (Serializer,
+from hat.sbs.common import Ref, Data, Columns
+from hat.sbs.lazy import LazyRecord, LazyArray
+from hat.sbs.repository import Repository, Projection
+from hat.sbs.serializer import (Codec,
+                                Serializer,
                                 CSerializer,
                                 PySerializer,
+                                CodegenSerializer,
                                 DefaultSerializer)
+from hat.sbs.stream import (StreamDecodeError,
+                            StreamDecoder,
+                            frame_encode,
+                            frame_encode_header)
 
 
 __all__ = ['Ref',
            'Data',
+           'Columns',
+           'LazyRecord',
+           'LazyArray',
            'Repository',
+           'Projection',
+           'Codec',
            'Serializer',
            'CSerializer',
            'PySerializer',
-           'DefaultSerializer']
+           'CodegenSerializer',
+           'DefaultSerializer',
+           'StreamDecodeError',
+           'StreamDecoder',
+           'frame_encode',
+           'frame_encode_header']
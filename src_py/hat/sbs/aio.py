@@ -0,0 +1,165 @@
+"""Asyncio stream integration
+
+Messages are transmitted as frames defined by `hat.sbs.stream`.
+
+"""
+
+import asyncio
+import collections
+import typing
+
+from hat.sbs import common
+from hat.sbs.repository import Repository
+from hat.sbs.serializer import Serializer, DefaultSerializer
+from hat.sbs.stream import (StreamDecodeError,
+                            StreamDecoder,
+                            frame_encode_header)
+
+
+class MessageReader:
+    """Framed message reader
+
+    Instance is asynchronous iterator of received messages which stops once
+    connection is closed.
+
+    Data is read from `reader` in chunks of up to `chunk_size` bytes into
+    single receive buffer. If `max_size` is set, receiving of larger message
+    is considered protocol error.
+
+    If received message can not be decoded, messages received before
+    invalid message are returned first and `hat.sbs.StreamDecodeError` is
+    raised afterwards.
+
+    """
+
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 repo: Repository,
+                 name: str | common.Ref, *,
+                 serializer: type[Serializer] = DefaultSerializer,
+                 max_size: int | None = None,
+                 chunk_size: int = 0x10000):
+        self._reader = reader
+        self._chunk_size = chunk_size
+        self._decoder = StreamDecoder(repo, name,
+                                      serializer=serializer,
+                                      max_size=max_size)
+        self._messages = collections.deque()
+        self._error = None
+        self._resume = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> common.Data:
+        if not self._messages and not await self._receive():
+            raise StopAsyncIteration()
+
+        return self._messages.popleft()
+
+    async def read(self) -> common.Data:
+        """Read single message
+
+        Raises `ConnectionError` if connection is closed.
+
+        """
+        if not self._messages and not await self._receive():
+            raise ConnectionError()
+
+        return self._messages.popleft()
+
+    async def _receive(self):
+        while not self._messages:
+            if self._error:
+                error, self._error = self._error, None
+                self._resume = True
+                raise error
+
+            if self._resume:
+                # frames buffered after invalid frame are decoded first
+                self._resume = False
+                chunk = b''
+
+            else:
+                chunk = await self._reader.read(self._chunk_size)
+                if not chunk:
+                    if self._decoder.pending:
+                        raise ConnectionError('connection closed during '
+                                              'frame reception')
+
+                    return False
+
+            try:
+                self._messages.extend(self._decoder.feed(chunk))
+
+            except StreamDecodeError as e:
+                # previously decoded messages are returned before error
+                self._messages.extend(e.messages)
+                e.messages = []
+                self._error = e
+
+        return True
+
+
+class MessageWriter:
+    """Framed message writer
+
+    Messages are written to `writer` without waiting for transport buffer
+    to be flushed - `drain` should be awaited regularly to respect flow
+    control. If `max_size` is set, writing of larger message raises
+    `ValueError`.
+
+    """
+
+    def __init__(self,
+                 writer: asyncio.StreamWriter,
+                 repo: Repository,
+                 name: str | common.Ref, *,
+                 serializer: type[Serializer] = DefaultSerializer,
+                 max_size: int | None = None):
+        self._writer = writer
+        self._repo = repo
+        self._name = name
+        self._serializer = serializer
+        self._max_size = max_size
+
+    def write(self, value: common.Data):
+        """Write single message"""
+        data = self._encode(value)
+        self._writer.writelines([frame_encode_header(len(data)), data])
+
+    def write_many(self, values: typing.Iterable[common.Data]):
+        """Write multiple messages
+
+        All messages are encoded prior to writing and written to transport
+        at once (frame headers and encoded messages are passed to transport
+        without copying into single buffer). If any of messages can not be
+        encoded, none of messages is written.
+
+        """
+        parts = []
+        for value in values:
+            data = self._encode(value)
+            parts.append(frame_encode_header(len(data)))
+            parts.append(data)
+
+        if parts:
+            self._writer.writelines(parts)
+
+    async def drain(self):
+        """Wait until transport buffer is flushed below its high watermark
+
+        Raises `ConnectionError` if connection is closed.
+
+        """
+        await self._writer.drain()
+
+    def _encode(self, value):
+        data = self._repo.encode(self._name, value,
+                                 serializer=self._serializer)
+
+        if self._max_size is not None and len(data) > self._max_size:
+            raise ValueError(f'message size {len(data)} exceeds max size '
+                             f'{self._max_size}')
+
+        return data
@@ -1,3 +1,4 @@
+import array
 import typing
 
 from hat import util
@@ -58,4 +59,8 @@ Type: typing.TypeAlias = (Ref |
 Data: typing.TypeAlias = (None | bool | int | float | str | util.Bytes |
                           typing.List['Data'] |
                           typing.Dict[str, 'Data'] |
-                          typing.Tuple[str, 'Data'])
+                          typing.Tuple[str, 'Data'] |
+                          typing.Tuple['Data', ...])
+
+Columns: typing.TypeAlias = typing.Sequence[Data] | array.array
+"""Column of Record entry values"""
@@ -1,12 +1,29 @@
-from collections.abc import Iterable
+from collections.abc import Container, Iterable, Mapping
+import typing
 
 from hat.sbs import common
 from hat.sbs import parser
 
 
-def evaluate_modules(modules: Iterable[parser.AstModule]
+Cache: typing.TypeAlias = dict[typing.Hashable, common.Type]
+"""Evaluated types cache"""
+
+
+def evaluate_modules(modules: Iterable[parser.AstModule],
+                     cache: Cache | None = None
                      ) -> dict[common.Ref, common.Type]:
-    """Evaluate modules."""
+    """Evaluate modules.
+
+    Structurally identical Array, Choice and anonymous Record types are
+    represented with single shared instance and instantiations of
+    parametrized types with same arguments are evaluated only once. Record
+    types defined directly by type definitions are not shared with other
+    Record types. If `cache` is provided, these types are shared between
+    all evaluations with same cache (which should be used only with same
+    modules).
+
+    """
+    cache = cache if cache is not None else {}
     refs = dict(_builtin_refs)
     modules_dict = {module.name: module for module in modules}
     for module in modules_dict.values():
@@ -14,11 +31,68 @@ def evaluate_modules(modules: Iterable[parser.AstModule]
             if ast_type_def.args:
                 continue
             ref = common.Ref(module.name, ast_type_def.name)
-            refs[ref] = _resolve_ref(modules_dict, ref, [])
+            refs[ref] = _resolve_ref(modules_dict, ref, [], cache)
     return refs
 
 
-def _resolve_ref(modules_dict, ref, args):
+def evaluate_refs(modules: Mapping[str, parser.AstModule],
+                  refs: Iterable[common.Ref],
+                  evaluated_refs: Container[common.Ref] = (),
+                  cache: Cache | None = None
+                  ) -> dict[common.Ref, common.Type]:
+    """Evaluate type definitions referenced by refs.
+
+    All type definitions referenced (directly or indirectly) by evaluated
+    types are also evaluated, except refs contained in `evaluated_refs`.
+    Refs which can not be resolved (unknown modules, types or parametrized
+    types) are not included in result. Modules are accessed only if they
+    contain referenced type definitions.
+
+    See `evaluate_modules` for `cache`.
+
+    """
+    cache = cache if cache is not None else {}
+    result = {}
+    stack = list(refs)
+    while stack:
+        ref = stack.pop()
+        if ref in evaluated_refs or ref in result:
+            continue
+
+        module = modules.get(ref.module)
+        if module is None:
+            continue
+
+        ast_type_def = module.type_defs.get(ref.name)
+        if ast_type_def is None or ast_type_def.args:
+            continue
+
+        t = _resolve_ref(modules, ref, [], cache)
+        result[ref] = t
+        stack.extend(_get_type_refs(t))
+
+    return result
+
+
+def _get_type_refs(t):
+    if isinstance(t, common.Ref):
+        yield t
+
+    elif isinstance(t, common.ArrayType):
+        yield from _get_type_refs(t.t)
+
+    elif isinstance(t, (common.RecordType, common.ChoiceType)):
+        for _, entry_type in t.entries:
+            yield from _get_type_refs(entry_type)
+
+
+def _resolve_ref(modules_dict, ref, args, cache):
+    # instantiations are memoized by ref and arguments
+    key = 'ref', ref, tuple(_get_key(arg) for arg in args)
+    t = cache.get(key)
+    if t is not None:
+        return t
+
     if ref in _builtin_arg_refs:
         ast_type_def = _builtin_arg_refs[ref]
     else:
@@ -30,15 +104,21 @@ def _resolve_ref(modules_dict, ref, args):
     mappings = dict(zip((common.Ref(None, arg)
                          for arg in ast_type_def.args),
                         args))
-    return _resolve_type(modules_dict, ref.module, ast_type_def.type, mappings)
+    # records defined directly by user type definitions are not interned
+    t = _resolve_type(modules_dict, ref.module, ast_type_def.type, mappings,
+                      cache, named=ref not in _builtin_arg_refs)
+    cache[key] = t
+    return t
 
 
-def _resolve_type(modules_dict, module, ast_type, mappings):
+def _resolve_type(modules_dict, module, ast_type, mappings, cache,
+                  named=False):
     ref = common.Ref(ast_type.module, ast_type.name)
-    args = [_resolve_type(modules_dict, module, arg, mappings)
+    args = [_resolve_type(modules_dict, module, arg, mappings, cache)
             for arg in ast_type.args]
     entries = [(entry.name,
-                _resolve_type(modules_dict, module, entry.type, mappings))
+                _resolve_type(modules_dict, module, entry.type, mappings,
+                              cache))
                for entry in ast_type.entries]
 
     if ref in mappings:
@@ -52,18 +132,19 @@ def _resolve_type(modules_dict, module, ast_type, mappings):
         return ref
 
     if ref in _builtin_arg_refs:
-        return _resolve_ref(modules_dict, ref, args)
+        return _resolve_ref(modules_dict, ref, args, cache)
 
     if ref == common.Ref(None, 'Array'):
         if len(args) != 1:
             raise Exception('Array requires one argument')
-        return common.ArrayType(args[0])
+        return _intern(cache, common.ArrayType(args[0]))
 
     if ref == common.Ref(None, 'Record'):
-        return common.RecordType(entries)
+        t = common.RecordType(entries)
+        return t if named else _intern(cache, t)
 
     if ref == common.Ref(None, 'Choice'):
-        return common.ChoiceType(entries)
+        return _intern(cache, common.ChoiceType(entries))
 
     if not ref.module:
         ref = ref._replace(module=module)
@@ -71,7 +152,30 @@ def _resolve_type(modules_dict, module, ast_type, mappings):
     if not args:
         return ref
 
-    return _resolve_ref(modules_dict, ref, args)
+    return _resolve_ref(modules_dict, ref, args, cache)
+
+
+def _intern(cache, t):
+    if isinstance(t, common.ArrayType):
+        key = 'array', _get_key(t.t)
+
+    else:
+        key = (type(t).__name__,
+               tuple((entry_name, _get_key(entry_type))
+                     for entry_name, entry_type in t.entries))
+
+    return cache.setdefault(key, t)
+
+
+def _get_key(t):
+    # array, record and choice types are interned - other types are
+    # compared by value
+    if isinstance(t, (common.ArrayType,
+                      common.RecordType,
+                      common.ChoiceType)):
+        return id(t)
+
+    return t
 
 
 _builtin_refs = {common.Ref(None, 'None'): common.NoneType(),
@@ -0,0 +1,193 @@
+"""Lazy decoding
+
+Lazily decoded Records and Arrays are represented as read-only proxies
+over encoded data. Values of Record entries and Array items are decoded
+on first access and cached.
+
+"""
+
+import bisect
+import collections.abc
+import typing
+
+from hat import util
+
+from hat.sbs import common
+from hat.sbs.serializer import Serializer
+
+
+class LazyRecord(collections.abc.Mapping):
+    """Lazily decoded Record"""
+
+    def __init__(self,
+                 decoder: '_Decoder',
+                 t: common.RecordType,
+                 data: memoryview):
+        self._decoder = decoder
+        self._t = t
+        self._data = data
+        self._indexes = decoder.get_entry_indexes(t)
+        self._offsets = [0]
+        self._values = {}
+
+    def __getitem__(self, name: str) -> common.Data:
+        if name in self._values:
+            return self._values[name]
+
+        index = self._indexes[name]
+        offset = self._get_offset(index)
+        entry_type = self._t.entries[index][1]
+
+        value = self._decoder.decode(entry_type, self._data[offset:])
+        self._values[name] = value
+        return value
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._indexes)
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __repr__(self) -> str:
+        return f'LazyRecord({dict(self)!r})'
+
+    def _get_offset(self, index):
+        offsets = self._offsets
+        while len(offsets) <= index:
+            entry_type = self._t.entries[len(offsets) - 1][1]
+            offset = offsets[-1]
+            offset += self._decoder.skip(entry_type, self._data[offset:])
+            offsets.append(offset)
+
+        return offsets[index]
+
+
+class LazyArray(collections.abc.Sequence):
+    """Lazily decoded Array"""
+
+    def __init__(self,
+                 decoder: '_Decoder',
+                 t: common.ArrayType,
+                 data: memoryview):
+        self._decoder = decoder
+        self._t = t
+        self._data = data
+        self._len = decoder.decode(_integer_type, data)
+        self._indexes = [0]
+        self._offsets = [decoder.skip(_integer_type, data)]
+        self._values = {}
+
+    def __getitem__(self, index: int | slice) -> common.Data:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+
+        if index < 0:
+            index += self._len
+
+        if not (0 <= index < self._len):
+            raise IndexError('array index out of range')
+
+        if index in self._values:
+            return self._values[index]
+
+        offset = self._get_offset(index)
+        value = self._decoder.decode(self._t.t, self._data[offset:])
+        self._values[index] = value
+        return value
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __eq__(self, other: typing.Any) -> bool:
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+
+        if isinstance(other, (str, bytes, bytearray, memoryview)):
+            return NotImplemented
+
+        return (len(self) == len(other) and
+                all(i == j for i, j in zip(self, other)))
+
+    def __repr__(self) -> str:
+        return f'LazyArray({list(self)!r})'
+
+    def _get_offset(self, index):
+        # offsets are cached for accessed indexes - offset of requested
+        # index is calculated by skipping items from closest cached index
+        i = bisect.bisect_right(self._indexes, index) - 1
+        if self._indexes[i] == index:
+            return self._offsets[i]
+
+        offset = self._offsets[i]
+        offset += self._decoder.skip(self._t.t, self._data[offset:],
+                                     index - self._indexes[i])
+
+        self._indexes.insert(i + 1, index)
+        self._offsets.insert(i + 1, offset)
+        return offset
+
+
+def decode(serializer: type[Serializer],
+           refs: dict[common.Ref, common.Type],
+           compiled_refs: typing.Any,
+           t: common.Type,
+           data: util.Bytes,
+           zero_copy: bool = False
+           ) -> common.Data:
+    """Decode data lazily
+
+    Non empty Records are decoded as `LazyRecord` and Arrays are decoded as
+    `LazyArray`. Values of all other types are decoded eagerly (Choice values
+    are decoded as tuples containing lazily decoded entry value).
+
+    `compiled_refs` are `refs` precompiled by `serializer`.
+
+    """
+    decoder = _Decoder(serializer=serializer,
+                       refs=refs,
+                       compiled_refs=compiled_refs,
+                       zero_copy=zero_copy)
+    return decoder.decode(t, memoryview(data).cast('B'))
+
+
+_integer_type = common.IntegerType()
+
+
+class _Decoder:
+
+    def __init__(self, serializer, refs, compiled_refs, zero_copy):
+        self._serializer = serializer
+        self._refs = refs
+        self._compiled_refs = compiled_refs
+        self._zero_copy = zero_copy
+        self._entry_indexes = {}
+
+    def decode(self, t, data):
+        while isinstance(t, common.Ref) and t in self._refs:
+            t = self._refs[t]
+
+        if isinstance(t, common.ArrayType):
+            return LazyArray(self, t, data)
+
+        if isinstance(t, common.RecordType) and t.entries:
+            return LazyRecord(self, t, data)
+
+        if isinstance(t, common.ChoiceType) and t.entries:
+            index = self.decode(_integer_type, data)
+            offset = self.skip(_integer_type, data)
+            entry_name, entry_type = t.entries[index]
+            return entry_name, self.decode(entry_type, data[offset:])
+
+        return self._serializer.decode(self._compiled_refs, t, data,
+                                       self._zero_copy)
+
+    def skip(self, t, data, count=1):
+        return self._serializer.skip(self._compiled_refs, t, data, count)
+
+    def get_entry_indexes(self, t):
+        entry_indexes = self._entry_indexes.get(id(t))
+        if entry_indexes is None:
+            entry_indexes = {name: i for i, (name, _) in enumerate(t.entries)}
+            self._entry_indexes[id(t)] = entry_indexes
+
+        return entry_indexes
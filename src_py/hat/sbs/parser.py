@@ -1,7 +1,8 @@
+import functools
+import re
 import typing
 
 from hat import json
-import hat.peg
 
 
 class AstType(typing.NamedTuple):
@@ -28,8 +29,36 @@ class AstModule(typing.NamedTuple):
 
 
 def parse(schema: str) -> AstModule:
-    """Parse SBS schema"""
-    ast = _grammar.parse(schema)
+    """Parse SBS schema
+
+    Schema is parsed with hand written recursive descent parser which
+    accepts same language as reference PEG grammar (see `parse_peg`).
+    In case of syntax error, `Exception` containing line and column of
+    error is raised.
+
+    """
+    return _Parser(schema).parse_module()
+
+
+def parse_module_name(schema: str) -> str:
+    """Parse name of module defined by SBS schema
+
+    Only module header is parsed - type definitions are not validated.
+
+    """
+    match = _module_name_pattern.match(schema)
+    if match:
+        return match.group(1)
+
+    # parsing of entire schema reports error position
+    return parse(schema).name
+
+
+def parse_peg(schema: str) -> AstModule:
+    """Parse SBS schema with reference PEG grammar"""
+    import hat.peg
+
+    ast = _get_grammar().parse(schema)
     return hat.peg.walk_ast(ast, _actions)
 
 
@@ -69,7 +98,207 @@ def _type_from_json(data):
                    args=[_type_from_json(i) for i in data['args']])
 
 
-_grammar = hat.peg.Grammar(r'''
+class _Parser:
+
+    def __init__(self, schema):
+        self._schema = schema
+        self._tokens = _tokenize(schema)
+        self._index = 0
+
+    def parse_module(self):
+        self._expect_keyword('module')
+        self._expect_separated()
+        name = self._expect_identifier()
+
+        type_defs = {}
+        while self._peek().kind != 'eof':
+            self._expect_separated()
+            type_def = self._parse_type_def()
+            type_defs[type_def.name] = type_def
+
+        return AstModule(name=name,
+                         type_defs=type_defs)
+
+    def _parse_type_def(self):
+        name = self._expect_identifier()
+
+        args = []
+        if self._peek().value == '(':
+            self._next()
+            while self._peek().kind == 'identifier':
+                args.append(self._next().value)
+            self._expect_symbol(')')
+
+        self._expect_symbol('=')
+        return AstTypeDef(name=name,
+                          args=args,
+                          type=self._parse_type())
+
+    def _parse_type(self):
+        token = self._peek()
+        name = self._expect_identifier()
+
+        if name in _simple_types:
+            return AstType(module=None,
+                           name=name,
+                           entries=[],
+                           args=[])
+
+        if name.startswith(_simple_types):
+            # reference grammar matches simple type as prefix of identifier
+            raise self._error(token, 'invalid type identifier')
+
+        if name in ('Record', 'Choice') and self._peek().value == '{':
+            return AstType(module=None,
+                           name=name,
+                           entries=self._parse_entries(),
+                           args=[])
+
+        module = None
+        token = self._peek()
+        if token.value == '.' and not token.separated:
+            self._next()
+            if not self._peek().separated:
+                module, name = name, self._expect_identifier()
+
+            else:
+                raise self._error(self._peek(), 'expected identifier')
+
+        args = []
+        if self._peek().value == '(':
+            self._next()
+            if self._peek().value != ')':
+                args.append(self._parse_type())
+                while self._peek().value != ')':
+                    self._expect_separated()
+                    args.append(self._parse_type())
+            self._next()
+
+        return AstType(module=module,
+                       name=name,
+                       entries=[],
+                       args=args)
+
+    def _parse_entries(self):
+        self._expect_symbol('{')
+
+        entries = [self._parse_entry()]
+        while self._peek().value != '}':
+            self._expect_separated()
+            entries.append(self._parse_entry())
+        self._next()
+
+        return entries
+
+    def _parse_entry(self):
+        name = self._expect_identifier()
+        self._expect_symbol(':')
+        return AstEntry(name=name,
+                        type=self._parse_type())
+
+    def _peek(self):
+        return self._tokens[self._index]
+
+    def _next(self):
+        token = self._tokens[self._index]
+        if token.kind != 'eof':
+            self._index += 1
+        return token
+
+    def _expect_identifier(self):
+        token = self._next()
+        if token.kind != 'identifier':
+            raise self._error(token, 'expected identifier')
+        return token.value
+
+    def _expect_keyword(self, keyword):
+        token = self._next()
+        if token.value != keyword:
+            raise self._error(token, f'expected {keyword!r}')
+
+    def _expect_symbol(self, symbol):
+        token = self._next()
+        if token.value != symbol:
+            raise self._error(token, f'expected {symbol!r}')
+
+    def _expect_separated(self):
+        # mandatory white-space between consecutive definitions
+        token = self._peek()
+        if not token.separated:
+            raise self._error(token, 'expected white-space')
+
+    def _error(self, token, message):
+        return _create_error(self._schema, token.offset, message)
+
+
+class _Token(typing.NamedTuple):
+    kind: str
+    value: str
+    offset: int
+    # token is preceded by white-space or comment
+    separated: bool
+
+
+def _tokenize(schema):
+    tokens = []
+    separated = False
+    offset = 0
+    match = _token_pattern.match
+
+    while offset < len(schema):
+        token_match = match(schema, offset)
+        if not token_match:
+            raise _create_error(schema, offset, 'invalid character')
+
+        kind = token_match.lastgroup
+        if kind == 'ws':
+            separated = True
+
+        else:
+            tokens.append(_Token(kind, token_match.group(), offset,
+                                 separated))
+            separated = False
+
+        offset = token_match.end()
+
+    tokens.append(_Token('eof', '', offset, separated))
+    return tokens
+
+
+def _create_error(schema, offset, message):
+    lines = _eol_pattern.split(schema[:offset])
+    return Exception(f'{message} (line {len(lines)}, '
+                     f'column {len(lines[-1]) + 1})')
+
+
+_simple_types = 'None', 'Boolean', 'Integer', 'Float', 'String', 'Bytes'
+
+# comments are terminated with end of line (same as in reference grammar)
+_token_pattern = re.compile(r"""
+    (?P<ws> (?: [,\ \t\r\n] | \#[^\r\n]*(?:\r\n|\n|\r) )+ )
+  | (?P<identifier> [A-Za-z][A-Za-z0-9_]* )
+  | (?P<symbol> [.=:(){}] )
+""", re.VERBOSE)
+
+_module_name_pattern = re.compile(r"""
+    (?: [,\ \t\r\n] | \#[^\r\n]*(?:\r\n|\n|\r) )*
+    module
+    (?: [,\ \t\r\n] | \#[^\r\n]*(?:\r\n|\n|\r) )+
+    ([A-Za-z][A-Za-z0-9_]*)
+    (?! [A-Za-z0-9_] )
+""", re.VERBOSE)
+
+_eol_pattern = re.compile(r'\r\n|\n|\r')
+
+
+@functools.cache
+def _get_grammar():
+    import hat.peg
+
+    return hat.peg.Grammar(_grammar_definition, 'Module')
+
+
+_grammar_definition = r'''
     Module          <- OWS 'module' MWS Identifier TypeDefinitions OWS EOF
     TypeDefinitions <- (MWS TypeDefinition (MWS TypeDefinition)*)?
     TypeDefinition  <- Identifier OWS ArgNames? OWS '=' OWS Type
@@ -109,7 +338,7 @@ _grammar = hat.peg.Grammar(r'''
     WS              <- ',' / ' ' / '\t' / EOL
     EOL             <- '\r\n' / '\n' / '\r'
     EOF             <- !.
-''', 'Module')
+'''
 
 
 _actions = {
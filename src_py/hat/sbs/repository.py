@@ -1,4 +1,9 @@
+import collections.abc
+import hashlib
+import os
 import pathlib
+import pickle
+import tempfile
 import typing
 
 from hat import json
@@ -6,8 +11,9 @@ from hat import util
 
 from hat.sbs import common
 from hat.sbs import evaluator
+from hat.sbs import lazy
 from hat.sbs import parser
-from hat.sbs.serializer import Serializer, DefaultSerializer
+from hat.sbs.serializer import Codec, Serializer, DefaultSerializer
 
 
 class Repository:
@@ -19,30 +25,378 @@ class Repository:
         * path to direcory recursivly searched for .sbs files
         * other repository
 
+    If `cache_dir` is provided, parsed modules and evaluated types are
+    stored in cache directory, identified by hash of schema sources. If
+    cache contains result for same schema sources, parsing and evaluation
+    are skipped. Cache entries are stored as pickled data - cache directory
+    should not be writable by untrusted users. Errors during storing of
+    cache entries are ignored.
+
+    If `lazy` is ``True``, only module names are read during initialization.
+    Modules are parsed when first referenced and types are evaluated on
+    first usage (together with all types they reference). Errors in
+    schemas are reported when erroneous module or type is first used.
+    Lazy mode doesn't support `cache_dir`.
+
     """
 
     def __init__(self,
-                 *args: typing.Union['Repository', pathlib.Path, str]):
-        self._modules = list(_parse_args(args))
-        self._refs = evaluator.evaluate_modules(self._modules)
+                 *args: typing.Union['Repository', pathlib.Path, str],
+                 cache_dir: pathlib.PurePath | None = None,
+                 lazy: bool = False):
+        sources = list(_get_sources(args))
+
+        if lazy:
+            if cache_dir is not None:
+                raise ValueError('cache not supported in lazy mode')
+
+            self._modules = _LazyModules(sources)
+            self._evaluator_cache = {}
+            self._refs = evaluator.evaluate_modules([],
+                                                    self._evaluator_cache)
+
+        else:
+            sources = [_read_source(source) for source in sources]
+            cache_path = (_get_cache_path(cache_dir, sources)
+                          if cache_dir is not None else None)
+            cached = _load_cache(cache_path) if cache_path else None
+
+            if cached:
+                self._modules, self._refs = cached
+
+            else:
+                self._modules = [parser.parse(source)
+                                 if isinstance(source, str) else source
+                                 for source in sources]
+                self._refs = evaluator.evaluate_modules(self._modules)
+
+                if cache_path:
+                    try:
+                        _store_cache(cache_path, self._modules, self._refs)
+
+                    except OSError:
+                        # cache is optional - repository is usable without
+                        # stored cache entry
+                        pass
+
+        self._compiled_refs = {}
+        self._projections = {}
+        self._record_classes = None
 
     def encode(self,
                name: str | common.Ref,
                value: common.Data, *,
                serializer: type[Serializer] = DefaultSerializer
                ) -> util.Bytes:
-        """Encode value."""
-        ref = _parse_name(name) if isinstance(name, str) else name
-        return serializer.encode(self._refs, ref, value)
+        """Encode value.
+
+        Record values can be provided as mappings or as tuples containing
+        entry values in order of Record entries (e.g. instances of
+        :meth:`Repository.record_class`).
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encode(refs, ref, value)
+
+    def encode_into(self,
+                    name: str | common.Ref,
+                    value: common.Data,
+                    buffer: bytearray | memoryview,
+                    offset: int = 0, *,
+                    serializer: type[Serializer] = DefaultSerializer
+                    ) -> int:
+        """Encode value into writable buffer starting at offset.
+
+        Buffer can be any object supporting writable buffer protocol (e.g.
+        `bytearray`, `memoryview`, `mmap.mmap`). Returns number of bytes
+        written. If buffer doesn't have enough space available,
+        `ValueError` reporting required size is raised.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encode_into(refs, ref, value, buffer, offset)
+
+    def encode_iov(self,
+                   name: str | common.Ref,
+                   value: common.Data, *,
+                   serializer: type[Serializer] = DefaultSerializer,
+                   min_ref_size: int = 0x10000
+                   ) -> list[util.Bytes]:
+        """Encode value into list of segments.
+
+        Concatenation of segments is equal to result of
+        :meth:`Repository.encode`. Segments can be passed directly to
+        vectored I/O functions (e.g. `socket.socket.sendmsg` or
+        `asyncio.WriteTransport.writelines`). `CSerializer` adds Bytes
+        values of at least `min_ref_size` bytes to segments by reference,
+        without copying their content.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encode_iov(refs, ref, value, min_ref_size)
+
+    def encode_many(self,
+                    name: str | common.Ref,
+                    values: typing.Iterable[common.Data], *,
+                    serializer: type[Serializer] = DefaultSerializer,
+                    contiguous: bool = False
+                    ) -> list[util.Bytes] | tuple[util.Bytes, list[int]]:
+        """Encode multiple values.
+
+        If `contiguous` is ``False``, list of encoded values is returned.
+        Otherwise, values are encoded into single buffer and tuple containing
+        buffer and offsets (start offset of each value followed by buffer
+        length) is returned.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encode_many(refs, ref, values, contiguous)
+
+    def encoded_size(self,
+                     name: str | common.Ref,
+                     value: common.Data, *,
+                     serializer: type[Serializer] = DefaultSerializer
+                     ) -> int:
+        """Get size of encoded value.
+
+        `CSerializer` computes size without encoding value. Size of values
+        with fixed encoded size (None, Boolean, Float and Records containing
+        only these types) is computed from type, without accessing value, so
+        these values are not validated.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encoded_size(refs, ref, value)
+
+    def encoded_sizes(self,
+                      name: str | common.Ref,
+                      values: typing.Iterable[common.Data], *,
+                      serializer: type[Serializer] = DefaultSerializer
+                      ) -> list[int]:
+        """Get sizes of multiple encoded values.
+
+        See :meth:`Repository.encoded_size`.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encoded_sizes(refs, ref, values)
 
     def decode(self,
                name: str | common.Ref,
                data: util.Bytes, *,
-               serializer: type[Serializer] = DefaultSerializer
+               serializer: type[Serializer] = DefaultSerializer,
+               zero_copy: bool = False,
+               fields: typing.Iterable[str] | None = None,
+               record_tuples: bool = False,
+               typed_arrays: bool = False
                ) -> common.Data:
-        """Decode data."""
-        ref = _parse_name(name) if isinstance(name, str) else name
-        return serializer.decode(self._refs, ref, data)
+        """Decode data.
+
+        If `zero_copy` is ``True``, Bytes values are decoded as read-only
+        `memoryview` slices of `data` instead of `bytes` copies. These
+        slices reference `data` memory directly: they keep `data` alive,
+        prevent resizing of resizable buffers (e.g. `bytearray`) while they
+        exist and reflect any subsequent modification of `data` content.
+
+        If `fields` are provided, only selected fields are decoded (see
+        :meth:`Repository.projection`). Projections are compiled once for
+        each combination of `name`, `fields` and `serializer`.
+
+        If `record_tuples` is ``True``, non empty Records are decoded as
+        instances of named tuple classes generated for each Record type
+        (see :meth:`Repository.record_class`) instead of dicts. Named
+        tuples don't contain per instance dict which significantly reduces
+        memory usage of large number of decoded values.
+
+        If `typed_arrays` is ``True``, Arrays of Booleans, Integers and
+        Floats are decoded as `array.array` instances (with typecodes
+        ``'B'``, ``'q'`` and ``'d'``) instead of lists. Decoding of
+        Integers which can not be represented with 64 bits raises
+        `OverflowError`.
+
+        """
+        ref = self._get_ref(name)
+
+        if fields is not None:
+            if record_tuples:
+                raise ValueError('record tuples not supported with fields')
+
+            if typed_arrays:
+                raise ValueError('typed arrays not supported with fields')
+
+            key = serializer, ref, tuple(fields)
+            projection = self._projections.get(key)
+            if projection is None:
+                projection = self.projection(ref, key[2],
+                                             serializer=serializer)
+                self._projections[key] = projection
+
+            return projection.decode(data, zero_copy=zero_copy)
+
+        refs = self._get_compiled_refs(serializer, record_tuples,
+                                       typed_arrays)
+        return serializer.decode(refs, ref, data, zero_copy)
+
+    def decode_many(self,
+                    name: str | common.Ref,
+                    data: typing.Iterable[util.Bytes] | util.Bytes,
+                    offsets: typing.Iterable[int] | None = None, *,
+                    serializer: type[Serializer] = DefaultSerializer,
+                    zero_copy: bool = False,
+                    record_tuples: bool = False,
+                    typed_arrays: bool = False
+                    ) -> list[common.Data]:
+        """Decode multiple values.
+
+        If `offsets` is ``None``, `data` is iterable of encoded values.
+        Otherwise, `data` is single buffer and `offsets` contain start offset
+        of each encoded value followed by end offset of last value (as
+        returned by :meth:`Repository.encode_many`).
+
+        See :meth:`Repository.decode` for `zero_copy`, `record_tuples` and
+        `typed_arrays`.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer, record_tuples,
+                                       typed_arrays)
+        return serializer.decode_many(refs, ref, data, offsets, zero_copy)
+
+    def encode_columns(self,
+                       name: str | common.Ref,
+                       columns: typing.Mapping[str, common.Columns], *,
+                       serializer: type[Serializer] = DefaultSerializer
+                       ) -> util.Bytes:
+        """Encode Array of Records from columns of entry values.
+
+        Type `name` must be Array of non empty Records. `columns` map Record
+        entry names to sequences of entry values (all columns must have same
+        length). Columns of Boolean, Integer and Float entries can also be
+        provided as objects supporting buffer protocol (e.g.
+        `array.array`) with matching item format.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.encode_columns(refs, ref, columns)
+
+    def decode_columns(self,
+                       name: str | common.Ref,
+                       data: util.Bytes, *,
+                       serializer: type[Serializer] = DefaultSerializer,
+                       zero_copy: bool = False
+                       ) -> dict[str, common.Columns]:
+        """Decode Array of Records into columns of entry values.
+
+        Type `name` must be Array of non empty Records. Result maps Record
+        entry names to columns containing values of that entry for all
+        Array items. Columns of Boolean, Integer and Float entries are
+        `array.array` instances (with typecodes ``'B'``, ``'q'`` and
+        ``'d'``) and all other columns are lists, which avoids creation of
+        Record object for each Array item.
+
+        See :meth:`Repository.decode` for `zero_copy`.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return serializer.decode_columns(refs, ref, data, zero_copy)
+
+    def decode_lazy(self,
+                    name: str | common.Ref,
+                    data: util.Bytes, *,
+                    serializer: type[Serializer] = DefaultSerializer,
+                    zero_copy: bool = False
+                    ) -> common.Data:
+        """Decode data lazily.
+
+        Records are decoded as read-only `LazyRecord` mappings and Arrays
+        are decoded as read-only `LazyArray` sequences. Their entries and
+        items are decoded only when accessed, so reading few fields from
+        large message doesn't require decoding of entire message.
+
+        Returned proxies reference `data` for as long as they exist (see
+        :meth:`Repository.decode` for `zero_copy` semantics).
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        return lazy.decode(serializer, self._refs, refs, ref, data, zero_copy)
+
+    def codec(self,
+              name: str | common.Ref, *,
+              serializer: type[Serializer] = DefaultSerializer,
+              record_tuples: bool = False,
+              typed_arrays: bool = False
+              ) -> Codec:
+        """Create codec of type `name`.
+
+        Codec binds resolved type and serializer's precompiled refs, so its
+        `encode`, `encode_into`, `decode`, `encode_many` and `decode_many`
+        methods don't look up type name or type on each call. Codec
+        remains valid for lifetime of repository.
+
+        See :meth:`Repository.decode` for `record_tuples` and
+        `typed_arrays`.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer, record_tuples,
+                                       typed_arrays)
+        return serializer.compile_codec(refs, ref)
+
+    def projection(self,
+                   name: str | common.Ref,
+                   fields: typing.Iterable[str], *,
+                   serializer: type[Serializer] = DefaultSerializer
+                   ) -> 'Projection':
+        """Create projection of type to selected fields.
+
+        Each field is dot separated path of Record or Choice entry names
+        (Arrays are transparent - path is applied to each array item).
+        Decoded Records contain only selected entries. Choice values with
+        unselected entry are decoded with ``None`` as entry value. All
+        other values are skipped without decoding.
+
+        """
+        ref = self._get_ref(name)
+        refs = self._get_compiled_refs(serializer)
+        projection = serializer.compile_projection(refs, ref, fields)
+        return Projection(serializer, projection)
+
+    def record_class(self,
+                     name: str | common.Ref
+                     ) -> type[tuple]:
+        """Get named tuple class used for decoding of Record type.
+
+        Class is generated for each non empty Record type and has fields
+        named as Record entries (entry names which are not valid field names
+        are replaced with positional names). Records referenced by `name`
+        are named same as referenced type - all other Records are named
+        ``Record``. Structurally identical anonymous Record types are
+        represented with single instance and share same class named
+        ``Record`` - Record types defined directly by type definitions
+        (including instantiations of parametrized types) have their own
+        classes.
+
+        """
+        ref = self._get_ref(name)
+
+        t = self._refs.get(ref)
+        while isinstance(t, common.Ref):
+            t = self._refs.get(t)
+
+        record_class = self._get_record_classes().get(id(t))
+        if record_class is None:
+            raise ValueError(f'{ref} is not non empty Record')
+
+        return record_class
 
     def to_json(self) -> json.Data:
         """Export repository content as json serializable data.
@@ -52,7 +406,8 @@ class Repository:
         :meth:`Repository.from_json`.
 
         """
-        return [parser.module_to_json(module) for module in self._modules]
+        return [parser.module_to_json(module)
+                for module in self._get_modules()]
 
     @staticmethod
     def from_json(data: pathlib.PurePath | json.Data) -> 'Repository':
@@ -69,27 +424,249 @@ class Repository:
         repo = Repository()
         repo._modules = [parser.module_from_json(i) for i in data]
         repo._refs = evaluator.evaluate_modules(repo._modules)
+        repo._compiled_refs = {}
+        repo._projections = {}
+        repo._record_classes = None
         return repo
 
+    def _get_modules(self):
+        if isinstance(self._modules, _LazyModules):
+            return self._modules.get_all()
+
+        return self._modules
+
+    def _get_ref(self, name):
+        ref = _parse_name(name) if isinstance(name, str) else name
+
+        if not isinstance(self._modules, _LazyModules) or ref in self._refs:
+            return ref
+
+        refs = evaluator.evaluate_refs(self._modules, [ref], self._refs,
+                                       self._evaluator_cache)
+        if not refs:
+            return ref
+
+        # new refs dict is created (instead of modifying existing one) so
+        # that programs held by existing codecs and projections remain
+        # valid - compiled refs cache is rebuilt on next usage
+        self._refs = {**self._refs, **refs}
+        self._compiled_refs = {}
+
+        if self._record_classes is not None:
+            self._record_classes = _create_record_classes(
+                self._refs, dict(self._record_classes))
+
+        return ref
+
+    def _get_compiled_refs(self, serializer, record_tuples=False,
+                           typed_arrays=False):
+        key = serializer, record_tuples, typed_arrays
+        refs = self._compiled_refs.get(key)
+        if refs is None:
+            if record_tuples or typed_arrays:
+                record_classes = (self._get_record_classes() if record_tuples
+                                  else None)
+                refs = serializer.compile(self._refs, record_classes,
+                                          typed_arrays)
+
+            else:
+                refs = serializer.compile(self._refs)
+
+            self._compiled_refs[key] = refs
+
+        return refs
+
+    def _get_record_classes(self):
+        if self._record_classes is None:
+            self._record_classes = _create_record_classes(self._refs)
+
+        return self._record_classes
+
+
+class Projection:
+    """Precompiled projection of SBS type to selected fields.
+
+    Instances are created with :meth:`Repository.projection`.
+
+    """
+
+    def __init__(self,
+                 serializer: type[Serializer],
+                 projection: typing.Any):
+        self._serializer = serializer
+        self._projection = projection
+
+    def decode(self,
+               data: util.Bytes, *,
+               zero_copy: bool = False
+               ) -> common.Data:
+        """Decode selected fields."""
+        return self._serializer.decode_projection(self._projection, data,
+                                                  zero_copy)
+
+
+class _LazyModules(collections.abc.Mapping):
+    """Modules indexed by name and parsed on first access"""
+
+    def __init__(self, sources):
+        self._sources = sources
+        self._modules = {}
+        self._indexes = {}
+
+        # last of modules with same name is used (same as in evaluator)
+        for i, source in enumerate(sources):
+            if isinstance(source, parser.AstModule):
+                name = source.name
+
+            else:
+                # schema content is not kept in memory until parsed
+                name = parser.parse_module_name(_read_source(source))
+
+            self._indexes[name] = i
+
+    def __getitem__(self, name):
+        return self._get_module(self._indexes[name])
+
+    def __iter__(self):
+        return iter(self._indexes)
+
+    def __len__(self):
+        return len(self._indexes)
 
-def _parse_args(args):
+    def get_all(self):
+        return [self._get_module(i) for i in range(len(self._sources))]
+
+    def _get_module(self, index):
+        module = self._modules.get(index)
+        if module is None:
+            source = _read_source(self._sources[index])
+            module = (parser.parse(source) if isinstance(source, str)
+                      else source)
+            self._modules[index] = module
+
+        return module
+
+
+def _get_sources(args):
+    # sources are schema strings, paths of schema files or already parsed
+    # modules
     for arg in args:
         if isinstance(arg, pathlib.PurePath):
-            paths = ([arg] if arg.suffix == '.sbs'
-                     else arg.rglob('*.sbs'))
-            for path in paths:
-                yield parser.parse(path.read_text('utf-8'))
+            yield from ([arg] if arg.suffix == '.sbs'
+                        else arg.rglob('*.sbs'))
 
         elif isinstance(arg, Repository):
-            yield from arg._modules
+            yield from arg._get_modules()
 
         elif isinstance(arg, str):
-            yield parser.parse(arg)
+            yield arg
 
         else:
             raise ValueError('unsupported arg')
 
 
+def _read_source(source):
+    if isinstance(source, pathlib.PurePath):
+        return source.read_text('utf-8')
+
+    return source
+
+
+def _get_cache_path(cache_dir, sources):
+    sources_hash = hashlib.sha256(f'{_cache_version}'.encode())
+
+    for source in sources:
+        if isinstance(source, str):
+            data = b's' + source.encode('utf-8')
+
+        else:
+            data = b'm' + json.encode(parser.module_to_json(source)).encode()
+
+        # length prefix separates consecutive sources
+        sources_hash.update(len(data).to_bytes(8, 'big'))
+        sources_hash.update(data)
+
+    return pathlib.Path(cache_dir) / f'{sources_hash.hexdigest()}.pickle'
+
+
+def _load_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            version, modules, refs = pickle.load(f)
+
+    except Exception:
+        return
+
+    if version != _cache_version:
+        return
+
+    return modules, refs
+
+
+def _store_cache(path, modules, refs):
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # cache entry is replaced atomically (concurrently started processes
+    # can store same entry)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            pickle.dump((_cache_version, modules, refs), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp_path, path)
+
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _create_record_classes(refs, record_classes=None):
+    # existing record classes are kept
+    record_classes = record_classes if record_classes is not None else {}
+
+    # records referenced directly are named by refs
+    for ref, t in refs.items():
+        if isinstance(t, common.RecordType) and t.entries:
+            record_classes.setdefault(id(t),
+                                      _create_record_class(ref.name, t))
+
+    visited = set()
+    for t in refs.values():
+        _create_nested_record_classes(t, record_classes, visited)
+
+    return record_classes
+
+
+def _create_nested_record_classes(t, record_classes, visited):
+    if isinstance(t, common.ArrayType):
+        _create_nested_record_classes(t.t, record_classes, visited)
+
+    elif isinstance(t, (common.RecordType, common.ChoiceType)):
+        if id(t) in visited:
+            return
+
+        visited.add(id(t))
+
+        if isinstance(t, common.RecordType) and t.entries:
+            record_classes.setdefault(id(t),
+                                      _create_record_class('Record', t))
+
+        for _, entry_type in t.entries:
+            _create_nested_record_classes(entry_type, record_classes,
+                                          visited)
+
+
+def _create_record_class(name, t):
+    return collections.namedtuple(name,
+                                  [entry_name for entry_name, _ in t.entries],
+                                  rename=True)
+
+
+# version of cache entry representation
+_cache_version = 3
+
+
 def _parse_name(name):
     segments = name.split('.', 1)
     module = segments[0] if len(segments) > 1 else None
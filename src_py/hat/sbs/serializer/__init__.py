@@ -1,11 +1,17 @@
 import typing
 
-from hat.sbs.serializer.common import Serializer
+from hat.sbs.serializer.codegenserializer import CodegenSerializer
+from hat.sbs.serializer.common import Codec, Serializer
 from hat.sbs.serializer.cserializer import CSerializer
 from hat.sbs.serializer.pyserializer import PySerializer
 
 
-__all__ = ['Serializer', 'CSerializer', 'PySerializer', 'DefaultSerializer']
+__all__ = ['Codec',
+           'Serializer',
+           'CSerializer',
+           'PySerializer',
+           'CodegenSerializer',
+           'DefaultSerializer']
 
 
 try:
@@ -0,0 +1,572 @@
+import array
+import collections
+import itertools
+import threading
+
+from hat.sbs.serializer import common
+from hat.sbs.serializer.primitives import (float_struct,
+                                           encode_integer,
+                                           decode_integer,
+                                           encode_typed_array,
+                                           decode_typed_array,
+                                           get_min_size)
+from hat.sbs.serializer.pyserializer import PySerializer
+
+
+class CodegenSerializer(common.Serializer):
+    """Serializer implementation based on generated Python code
+
+    Each type is translated to specialized Python encoder and decoder
+    functions (without type dispatching at runtime). Functions are
+    generated on first usage of each type and cached in precompiled refs.
+
+    Programs generated for refs which are not precompiled are cached for
+    limited number of most recently used refs (identified by identity) -
+    these refs should not be modified after their first usage.
+
+    """
+
+    def compile(refs, record_classes=None, typed_arrays=False):
+        return _Program(refs, record_classes, typed_arrays)
+
+    def encode(refs, t, value):
+        program = _get_program(refs)
+        out = bytearray()
+        program.get_encoder(t)(value, out)
+        return bytes(out)
+
+    def decode(refs, t, data, zero_copy=False):
+        program = _get_program(refs)
+        data = _get_data(data, zero_copy)
+        value, _ = program.get_decoder(t, zero_copy)(data, 0)
+        return value
+
+    def compile_codec(refs, t):
+        return _Codec(_get_program(refs), t)
+
+    def encode_columns(refs, t, columns):
+        program = _get_program(refs)
+        out = bytearray()
+        program.get_encoder(t, columns=True)(columns, out)
+        return bytes(out)
+
+    def decode_columns(refs, t, data, zero_copy=False):
+        program = _get_program(refs)
+        data = _get_data(data, zero_copy)
+        decoder = program.get_decoder(t, zero_copy, columns=True)
+        columns, _ = decoder(data, 0)
+        return columns
+
+    def skip(refs, t, data, count=1):
+        program = _get_program(refs)
+        data = memoryview(data).cast('B')
+        decoder = program.get_decoder(t, True)
+
+        pos = 0
+        for _ in range(count):
+            _, pos = decoder(data, pos)
+
+        return pos
+
+    def compile_projection(refs, t, fields):
+        return PySerializer.compile_projection(_get_program(refs).refs, t,
+                                               fields)
+
+    def decode_projection(projection, data, zero_copy=False):
+        return PySerializer.decode_projection(projection, data, zero_copy)
+
+
+class _Program:
+
+    def __init__(self, refs, record_classes=None, typed_arrays=False):
+        self._refs = refs
+        self._generator = _Generator(refs, record_classes or {},
+                                     typed_arrays)
+        self._encoders = {}
+        self._decoders = {}
+        # programs can be shared between threads - generator state is
+        # modified only while lock is held
+        self._lock = threading.Lock()
+
+    @property
+    def refs(self):
+        return self._refs
+
+    def get_encoder(self, t, columns=False):
+        key = _get_key(t), columns
+        encoder = self._encoders.get(key)
+        if encoder is None:
+            with self._lock:
+                encoder = self._generator.get_encoder(t, columns)
+                self._encoders[key] = encoder
+
+        return encoder
+
+    def get_decoder(self, t, zero_copy, columns=False):
+        key = _get_key(t), zero_copy, columns
+        decoder = self._decoders.get(key)
+        if decoder is None:
+            with self._lock:
+                decoder = self._generator.get_decoder(t, zero_copy, columns)
+                self._decoders[key] = decoder
+
+        return decoder
+
+
+class _Codec(common.SerializerCodec):
+
+    def __init__(self, program, t):
+        super().__init__(CodegenSerializer, program, t)
+        self._program = program
+        self._encoder = program.get_encoder(t)
+        self._decoder = program.get_decoder(t, False)
+
+    def encode(self, value):
+        out = bytearray()
+        self._encoder(value, out)
+        return bytes(out)
+
+    def decode(self, data, *, zero_copy=False):
+        decoder = (self._program.get_decoder(self._t, True) if zero_copy
+                   else self._decoder)
+        value, _ = decoder(_get_data(data, zero_copy), 0)
+        return value
+
+
+class _Generator:
+
+    def __init__(self, refs, record_classes, typed_arrays):
+        self._refs = refs
+        self._record_classes = record_classes
+        self._typed_arrays = typed_arrays
+        self._names = {}
+        self._types = []
+        self._tables = []
+        self._counter = itertools.count(1)
+        self._globals = {'_encode_integer': encode_integer,
+                         '_decode_integer': decode_integer,
+                         '_decode_bytes': _decode_bytes,
+                         '_encode_typed_array': encode_typed_array,
+                         '_decode_typed_array': decode_typed_array,
+                         '_float_pack': float_struct.pack,
+                         '_float_unpack': float_struct.unpack_from,
+                         '_tuple_new': tuple.__new__,
+                         '_array': array.array}
+
+    def get_encoder(self, t, columns=False):
+        return self._generate('k' if columns else 'e', t, None)
+
+    def get_decoder(self, t, zero_copy, columns=False):
+        return self._generate('c' if columns else 'd', t, zero_copy)
+
+    def _generate(self, kind, t, zero_copy):
+        names_len = len(self._names)
+        types_len = len(self._types)
+        globals_len = len(self._globals)
+
+        try:
+            name = self._get_function(kind, t, zero_copy)
+            self._resolve_tables()
+            return self._globals[name]
+
+        except BaseException:
+            # names of all functions generated during failed generation
+            # are removed (already generated functions can reference
+            # functions which were not generated)
+            for key in list(self._names)[names_len:]:
+                del self._names[key]
+
+            for name in list(self._globals)[globals_len:]:
+                del self._globals[name]
+
+            del self._types[types_len:]
+            self._tables = []
+            raise
+
+    def _get_function(self, kind, t, zero_copy):
+        t = self._resolve(t)
+        key = kind, _get_key(t), zero_copy
+
+        name = self._names.get(key)
+        if name is not None:
+            return name
+
+        # name is registered prior to body generation because of recursive
+        # types - in case of failure, it is removed by `_generate`
+        name = f'_{kind}{next(self._counter)}'
+        self._names[key] = name
+
+        # generated functions reference types by id
+        self._types.append(t)
+
+        if kind == 'e':
+            lines = [f'def {name}(value, out):',
+                     *self._get_encoder_body(t)]
+
+        elif kind == 'k':
+            lines = [f'def {name}(columns, out):',
+                     *self._get_columns_encoder_body(t)]
+
+        elif kind == 'c':
+            lines = [f'def {name}(data, pos):',
+                     *self._get_columns_decoder_body(t, zero_copy)]
+
+        else:
+            lines = [f'def {name}(data, pos):',
+                     *self._get_decoder_body(t, zero_copy)]
+
+        exec('\n'.join(lines), self._globals)
+        return name
+
+    def _resolve(self, t):
+        while isinstance(t, common.Ref):
+            if t not in self._refs:
+                raise ValueError(f'unresolved ref {t}')
+
+            t = self._refs[t]
+
+        return t
+
+    def _get_encoder_body(self, t):
+        if isinstance(t, common.ArrayType):
+            item_t = self._resolve(t.t)
+            if isinstance(item_t, (common.BooleanType, common.FloatType)):
+                item_t = self._add_global('_i', item_t)
+                yield '    if not isinstance(value, list):'
+                yield '        typed_array = _encode_typed_array(' \
+                      f'{item_t}, value)'
+                yield '        if typed_array is not None:'
+                yield '            count, items = typed_array'
+                yield '            _encode_integer(count, out)'
+                yield '            out += items'
+                yield '            return'
+
+            yield '    _encode_integer(len(value), out)'
+            yield '    for item in value:'
+            yield from self._get_encode_lines(t.t, 'item', '        ')
+
+        elif isinstance(t, common.RecordType) and t.entries:
+            names = [f'entry{i}' for i in range(len(t.entries))]
+
+            # tuples contain entry values in order of record entries
+            yield '    if isinstance(value, tuple):'
+            yield f'        if len(value) != {len(t.entries)}:'
+            yield "            raise ValueError('invalid record size')"
+            yield f"        {', '.join(names)}, = value"
+            yield '    else:'
+            for name, (entry_name, _) in zip(names, t.entries):
+                yield f'        {name} = value[{entry_name!r}]'
+
+            for name, (_, entry_type) in zip(names, t.entries):
+                yield from self._get_encode_lines(entry_type, name, '    ')
+
+        elif isinstance(t, common.ChoiceType) and t.entries:
+            # reverse order - first of duplicate entry names is used
+            entries = self._add_table({
+                entry_name: (_encode_id(i),
+                             self._get_function('e', entry_type, None))
+                for i, (entry_name, entry_type) in reversed(
+                    list(enumerate(t.entries)))})
+
+            yield '    entry_name, entry_value = value'
+            yield f'    entry = {entries}.get(entry_name)'
+            yield '    if entry is None:'
+            yield "        raise Exception('invalid entry name')"
+            yield '    out += entry[0]'
+            yield '    entry[1](entry_value, out)'
+
+        elif isinstance(t, (common.RecordType, common.ChoiceType)):
+            yield '    pass'
+
+        else:
+            yield from self._get_encode_lines(t, 'value', '    ')
+
+        yield '    return'
+
+    def _get_encode_lines(self, t, value, indent):
+        t = self._resolve(t)
+
+        if isinstance(t, common.NoneType):
+            yield f'{indent}pass'
+
+        elif isinstance(t, common.BooleanType):
+            yield f'{indent}out.append(1 if {value} else 0)'
+
+        elif isinstance(t, common.IntegerType):
+            yield f'{indent}_encode_integer({value}, out)'
+
+        elif isinstance(t, common.FloatType):
+            yield f'{indent}out += _float_pack({value})'
+
+        elif isinstance(t, common.StringType):
+            yield f"{indent}encoded = {value}.encode('utf-8')"
+            yield f'{indent}_encode_integer(len(encoded), out)'
+            yield f'{indent}out += encoded'
+
+        elif isinstance(t, common.BytesType):
+            yield f'{indent}encoded = {value}'
+            yield f'{indent}_encode_integer(len(encoded), out)'
+            yield f'{indent}out += encoded'
+
+        elif isinstance(t, (common.ArrayType,
+                            common.RecordType,
+                            common.ChoiceType)):
+            yield f"{indent}{self._get_function('e', t, None)}({value}, out)"
+
+        else:
+            raise ValueError('unsupported type')
+
+    def _get_decoder_body(self, t, zero_copy):
+        if isinstance(t, common.ArrayType) and self._typed_arrays and \
+                isinstance(self._resolve(t.t), (common.BooleanType,
+                                                common.IntegerType,
+                                                common.FloatType)):
+            item_t = self._add_global('_i', self._resolve(t.t))
+            yield '    count, pos = _decode_integer(data, pos)'
+            yield '    value, pos = _decode_typed_array(' \
+                  f'{item_t}, data, pos, count)'
+
+        elif isinstance(t, common.ArrayType):
+            yield '    count, pos = _decode_integer(data, pos)'
+            yield '    value = []'
+            yield '    for _ in range(count):'
+            yield from self._get_decode_lines(t.t, 'item', zero_copy,
+                                              '        ')
+            yield '        value.append(item)'
+
+        elif isinstance(t, common.RecordType) and t.entries:
+            names = []
+            for i, (entry_name, entry_type) in enumerate(t.entries):
+                name = f'entry{i}'
+                names.append(f'{entry_name!r}: {name}')
+                yield from self._get_decode_lines(entry_type, name,
+                                                  zero_copy, '    ')
+
+            record_class = self._record_classes.get(id(t))
+            if record_class is not None:
+                record_class = self._add_global('_r', record_class)
+                values = ''.join(f'entry{i}, ' for i in range(len(names)))
+                yield f'    value = _tuple_new({record_class}, ({values}))'
+
+            else:
+                yield f"    value = {{{', '.join(names)}}}"
+
+        elif isinstance(t, common.ChoiceType) and t.entries:
+            entries = self._add_table([
+                (entry_name, self._get_function('d', entry_type, zero_copy))
+                for entry_name, entry_type in t.entries])
+
+            yield '    entry_id, pos = _decode_integer(data, pos)'
+            yield f'    if not (0 <= entry_id < {len(t.entries)}):'
+            yield "        raise ValueError('invalid choice id')"
+            yield f'    entry_name, entry_decoder = {entries}[entry_id]'
+            yield '    entry_value, pos = entry_decoder(data, pos)'
+            yield '    value = entry_name, entry_value'
+
+        elif isinstance(t, (common.RecordType, common.ChoiceType)):
+            yield '    value = None'
+
+        else:
+            yield from self._get_decode_lines(t, 'value', zero_copy, '    ')
+
+        yield '    return value, pos'
+
+    def _get_decode_lines(self, t, value, zero_copy, indent):
+        t = self._resolve(t)
+
+        if isinstance(t, common.NoneType):
+            yield f'{indent}{value} = None'
+
+        elif isinstance(t, common.BooleanType):
+            yield f'{indent}{value} = bool(data[pos])'
+            yield f'{indent}pos += 1'
+
+        elif isinstance(t, common.IntegerType):
+            # single byte integers are decoded inline
+            yield f'{indent}i = data[pos]'
+            yield f'{indent}if i & 0x80:'
+            yield f'{indent}    {value} = i - 0x100 if i & 0x40 else i - 0x80'
+            yield f'{indent}    pos += 1'
+            yield f'{indent}else:'
+            yield f'{indent}    {value}, pos = _decode_integer(data, pos)'
+
+        elif isinstance(t, common.FloatType):
+            yield f'{indent}{value}, = _float_unpack(data, pos)'
+            yield f'{indent}pos += 8'
+
+        elif isinstance(t, common.StringType):
+            yield from self._get_decode_bytes_lines(indent)
+            yield f"{indent}{value} = str(data[start:pos], 'utf-8')"
+
+        elif isinstance(t, common.BytesType):
+            yield from self._get_decode_bytes_lines(indent)
+            if zero_copy:
+                yield f'{indent}{value} = data[start:pos]'
+            else:
+                yield f'{indent}{value} = bytes(data[start:pos])'
+
+        elif isinstance(t, (common.ArrayType,
+                            common.RecordType,
+                            common.ChoiceType)):
+            function = self._get_function('d', t, zero_copy)
+            yield f'{indent}{value}, pos = {function}(data, pos)'
+
+        else:
+            raise ValueError('unsupported type')
+
+    def _get_columns_encoder_body(self, t):
+        entries = self._get_columns_entries(t)
+        names = [f'entry{i}' for i in range(len(entries))]
+
+        for i, (entry_name, _) in enumerate(entries):
+            yield f'    column{i} = columns[{entry_name!r}]'
+
+        yield '    count = len(column0)'
+        for i in range(1, len(entries)):
+            yield f'    if len(column{i}) != count:'
+            yield "        raise ValueError('invalid column size')"
+
+        columns = ', '.join(f'column{i}' for i in range(len(entries)))
+        yield '    _encode_integer(count, out)'
+        yield f"    for {', '.join(names)}, in zip({columns}):"
+        for name, (_, entry_type) in zip(names, entries):
+            yield from self._get_encode_lines(entry_type, name, '        ')
+
+        yield '    return'
+
+    def _get_columns_decoder_body(self, t, zero_copy):
+        entries = self._get_columns_entries(t)
+        min_size = sum(get_min_size(entry_type)
+                       for _, entry_type in entries)
+
+        yield '    count, pos = _decode_integer(data, pos)'
+        yield f'    if {min_size} * count > len(data) - pos:'
+        yield "        raise ValueError('invalid data')"
+
+        for i, (_, entry_type) in enumerate(entries):
+            typecode = _get_column_typecode(entry_type)
+            column = f'_array({typecode!r})' if typecode else '[]'
+            yield f'    column{i} = {column}'
+            yield f'    append{i} = column{i}.append'
+
+        yield '    for _ in range(count):'
+        for i, (_, entry_type) in enumerate(entries):
+            yield from self._get_decode_lines(entry_type, 'item', zero_copy,
+                                              '        ')
+            yield f'        append{i}(item)'
+
+        columns = ', '.join(f'{entry_name!r}: column{i}'
+                            for i, (entry_name, _) in enumerate(entries))
+        yield f'    return {{{columns}}}, pos'
+
+    def _get_columns_entries(self, t):
+        if isinstance(t, common.ArrayType):
+            t = self._resolve(t.t)
+
+            if isinstance(t, common.RecordType) and t.entries:
+                return [(entry_name, self._resolve(entry_type))
+                        for entry_name, entry_type in t.entries]
+
+        raise ValueError('unsupported type')
+
+    def _get_decode_bytes_lines(self, indent):
+        # sizes smaller than 0x40 are decoded inline
+        yield f'{indent}i = data[pos]'
+        yield f'{indent}if i & 0xC0 == 0x80:'
+        yield f'{indent}    start = pos + 1'
+        yield f'{indent}    pos = start + i - 0x80'
+        yield f'{indent}    if pos > len(data):'
+        yield f"{indent}        raise ValueError('invalid data')"
+        yield f'{indent}else:'
+        yield f'{indent}    start, pos = _decode_bytes(data, pos)'
+
+    def _add_global(self, prefix, value):
+        name = f'{prefix}{next(self._counter)}'
+        self._globals[name] = value
+        return name
+
+    def _add_table(self, table):
+        # tables contain function names until all (possibly recursive)
+        # functions are generated
+        name = f'_t{next(self._counter)}'
+        self._globals[name] = table
+        self._tables.append(table)
+        return name
+
+    def _resolve_tables(self):
+        for table in self._tables:
+            if isinstance(table, dict):
+                for key, (entry_id, function) in table.items():
+                    table[key] = entry_id, self._globals[function]
+
+            else:
+                for i, (entry_name, function) in enumerate(table):
+                    table[i] = entry_name, self._globals[function]
+
+        self._tables = []
+
+
+_program_cache_size = 16
+_program_cache = collections.OrderedDict()
+_program_cache_lock = threading.Lock()
+
+
+def _get_program(refs):
+    if isinstance(refs, _Program):
+        return refs
+
+    # cache holds reference to refs so that their id can not be reused
+    key = id(refs)
+    with _program_cache_lock:
+        entry = _program_cache.get(key)
+        if entry:
+            _program_cache.move_to_end(key)
+            return entry[1]
+
+        program = _Program(refs)
+        _program_cache[key] = refs, program
+        if len(_program_cache) > _program_cache_size:
+            _program_cache.popitem(last=False)
+
+        return program
+
+
+def _get_key(t):
+    # types are not hashable (entries are lists)
+    return t if isinstance(t, common.Ref) else (type(t), id(t))
+
+
+def _get_data(data, zero_copy):
+    if zero_copy:
+        return memoryview(data).cast('B').toreadonly()
+
+    if isinstance(data, bytes):
+        return data
+
+    return memoryview(data).cast('B')
+
+
+def _get_column_typecode(t):
+    if isinstance(t, common.BooleanType):
+        return 'B'
+
+    if isinstance(t, common.IntegerType):
+        return 'q'
+
+    if isinstance(t, common.FloatType):
+        return 'd'
+
+
+def _encode_id(i):
+    out = bytearray()
+    encode_integer(i, out)
+    return bytes(out)
+
+
+def _decode_bytes(data, pos):
+    size, start = decode_integer(data, pos)
+    end = start + size
+    if end > len(data):
+        raise ValueError('invalid data')
+
+    return start, end
@@ -1,26 +1,391 @@
 from hat.sbs.common import *  # NOQA
 
 import abc
+import typing
 
 from hat import util
 
-from hat.sbs.common import Ref, Type, Data
+from hat.sbs.common import Ref, Type, Data, Columns
+
+
+FieldsTree: typing.TypeAlias = dict[str, typing.Optional['FieldsTree']]
+"""Tree of field paths (``None`` represents entire value)"""
+
+
+class Codec(abc.ABC):
+    """Encoder and decoder of single precompiled type"""
+
+    @abc.abstractmethod
+    def encode(self, value: Data) -> util.Bytes:
+        """Encode value"""
+
+    @abc.abstractmethod
+    def encode_into(self,
+                    value: Data,
+                    buffer: bytearray | memoryview,
+                    offset: int = 0
+                    ) -> int:
+        """Encode value into writable buffer starting at offset"""
+
+    @abc.abstractmethod
+    def decode(self,
+               data: util.Bytes, *,
+               zero_copy: bool = False
+               ) -> Data:
+        """Decode data"""
+
+    @abc.abstractmethod
+    def encode_many(self,
+                    values: typing.Iterable[Data], *,
+                    contiguous: bool = False
+                    ) -> list[util.Bytes] | tuple[util.Bytes, list[int]]:
+        """Encode multiple values"""
+
+    @abc.abstractmethod
+    def decode_many(self,
+                    data: typing.Iterable[util.Bytes] | util.Bytes,
+                    offsets: typing.Iterable[int] | None = None, *,
+                    zero_copy: bool = False
+                    ) -> list[Data]:
+        """Decode multiple values"""
 
 
 class Serializer(abc.ABC):
 
+    @staticmethod
+    def compile(refs: dict[Ref, Type],
+                record_classes: dict[int, type[tuple]] | None = None,
+                typed_arrays: bool = False
+                ) -> typing.Any:
+        """Precompile refs
+
+        Result of precompilation can be passed as `refs` argument to
+        other serializer methods. Precompiled refs are valid only as long
+        as `refs` is not modified. Default implementation returns `refs`
+        without modification.
+
+        If `record_classes` are provided, they map ids of `RecordType`
+        instances to tuple subclasses. Values of these Record types are
+        decoded as ``tuple.__new__(record_class, entry_values)`` instead of
+        dicts.
+
+        If `typed_arrays` is ``True``, Arrays of Booleans, Integers and
+        Floats are decoded as `array.array` with type codes ``'B'``,
+        ``'q'`` and ``'d'`` instead of lists.
+
+        Default implementation doesn't support `record_classes` and
+        `typed_arrays`.
+
+        """
+        if record_classes or typed_arrays:
+            raise NotImplementedError()
+
+        return refs
+
     @staticmethod
     @abc.abstractmethod
     def encode(refs: dict[Ref, Type],
                t: Type,
                value: Data
                ) -> util.Bytes:
-        """Encode value"""
+        """Encode value
+
+        Record values can be mappings or tuples containing entry values in
+        order of Record entries. Arrays of Booleans, Integers and Floats can
+        also be provided as objects supporting buffer protocol (e.g.
+        `array.array`) with matching item format.
+
+        """
+
+    @classmethod
+    def encode_into(cls,
+                    refs: dict[Ref, Type],
+                    t: Type,
+                    value: Data,
+                    buffer: bytearray | memoryview,
+                    offset: int = 0
+                    ) -> int:
+        """Encode value into writable buffer starting at offset
+
+        Returns number of bytes written to buffer. If buffer doesn't have
+        enough space available, `ValueError` is raised. In case of error,
+        buffer content after offset is undefined.
+
+        Default implementation copies result of `encode` into buffer.
+
+        """
+        data = cls.encode(refs, t, value)
+
+        with memoryview(buffer) as buffer_view:
+            if offset < 0 or offset > buffer_view.nbytes:
+                raise ValueError('invalid offset')
+
+            available = buffer_view.nbytes - offset
+            if len(data) > available:
+                raise ValueError(f'insufficient buffer size '
+                                 f'(required {len(data)} bytes, '
+                                 f'available {available} bytes)')
+
+            with buffer_view.cast('B') as buffer_bytes:
+                buffer_bytes[offset:offset+len(data)] = data
+
+        return len(data)
+
+    @classmethod
+    def encode_iov(cls,
+                   refs: dict[Ref, Type],
+                   t: Type,
+                   value: Data,
+                   min_ref_size: int
+                   ) -> list[util.Bytes]:
+        """Encode value into list of segments
+
+        Concatenation of segments is equal to result of `encode`.
+        Implementations can add Bytes values of at least `min_ref_size`
+        bytes to segments by reference (without copying their content).
+
+        Default implementation returns list containing result of `encode`.
+
+        """
+        return [cls.encode(refs, t, value)]
 
     @staticmethod
     @abc.abstractmethod
     def decode(refs: dict[Ref, Type],
                t: Type,
-               data: util.Bytes
+               data: util.Bytes,
+               zero_copy: bool = False
                ) -> Data:
-        """Decode data"""
+        """Decode data
+
+        If `zero_copy` is ``True``, Bytes values are decoded as read-only
+        `memoryview` slices of `data` instead of `bytes` copies.
+
+        """
+
+    @classmethod
+    def encode_many(cls,
+                    refs: dict[Ref, Type],
+                    t: Type,
+                    values: typing.Iterable[Data],
+                    contiguous: bool = False
+                    ) -> list[util.Bytes] | tuple[util.Bytes, list[int]]:
+        """Encode multiple values of same type
+
+        If `contiguous` is ``False``, list of encoded values is returned.
+        Otherwise, values are encoded into single contiguous buffer and
+        tuple containing buffer and offsets is returned. Offsets contain
+        start offset of each encoded value followed by buffer length.
+
+        Default implementation calls `encode` for each value.
+
+        """
+        items = [cls.encode(refs, t, value) for value in values]
+        if not contiguous:
+            return items
+
+        offsets = [0]
+        for item in items:
+            offsets.append(offsets[-1] + len(item))
+
+        return b''.join(items), offsets
+
+    @classmethod
+    def decode_many(cls,
+                    refs: dict[Ref, Type],
+                    t: Type,
+                    data: typing.Iterable[util.Bytes] | util.Bytes,
+                    offsets: typing.Iterable[int] | None = None,
+                    zero_copy: bool = False
+                    ) -> list[Data]:
+        """Decode multiple values of same type
+
+        If `offsets` is ``None``, `data` is iterable of encoded values.
+        Otherwise, `data` is contiguous buffer and `offsets` contain start
+        offset of each encoded value followed by end offset of last value
+        (as returned by `encode_many`).
+
+        Default implementation calls `decode` for each value.
+
+        """
+        if offsets is None:
+            return [cls.decode(refs, t, i, zero_copy) for i in data]
+
+        offsets = list(offsets)
+        with memoryview(data) as data_view:
+            if any(start < 0 or start > stop or stop > data_view.nbytes
+                   for start, stop in zip(offsets, offsets[1:])):
+                raise ValueError('invalid offsets')
+
+            with data_view.cast('B') as data_bytes:
+                return [cls.decode(refs, t, data_bytes[start:stop],
+                                   zero_copy)
+                        for start, stop in zip(offsets, offsets[1:])]
+
+    @classmethod
+    def encoded_size(cls,
+                     refs: dict[Ref, Type],
+                     t: Type,
+                     value: Data
+                     ) -> int:
+        """Get size of encoded value
+
+        Implementations can skip validation of values with fixed encoded
+        size (e.g. Floats or Records containing only Booleans and Floats).
+
+        Default implementation returns length of `encode` result.
+
+        """
+        return len(cls.encode(refs, t, value))
+
+    @classmethod
+    def encoded_sizes(cls,
+                      refs: dict[Ref, Type],
+                      t: Type,
+                      values: typing.Iterable[Data]
+                      ) -> list[int]:
+        """Get sizes of multiple encoded values of same type
+
+        Default implementation calls `encoded_size` for each value.
+
+        """
+        return [cls.encoded_size(refs, t, value) for value in values]
+
+    @classmethod
+    def compile_codec(cls,
+                      refs: dict[Ref, Type],
+                      t: Type
+                      ) -> Codec:
+        """Precompile codec of type `t`
+
+        Codec methods have same semantics as serializer methods with same
+        names. Default implementation returns codec which calls serializer
+        methods with bound `refs` and `t`.
+
+        """
+        return SerializerCodec(cls, refs, t)
+
+    @staticmethod
+    @abc.abstractmethod
+    def encode_columns(refs: dict[Ref, Type],
+                       t: Type,
+                       columns: typing.Mapping[str, Columns]
+                       ) -> util.Bytes:
+        """Encode Array of Records from columns of entry values
+
+        Type `t` must be Array of non empty Records. `columns` map Record
+        entry names to sequences of entry values (all of same length).
+        Columns of Boolean, Integer and Float entries can also be provided
+        as objects supporting buffer protocol with matching item format.
+
+        """
+
+    @staticmethod
+    @abc.abstractmethod
+    def decode_columns(refs: dict[Ref, Type],
+                       t: Type,
+                       data: util.Bytes,
+                       zero_copy: bool = False
+                       ) -> dict[str, Columns]:
+        """Decode Array of Records into columns of entry values
+
+        Type `t` must be Array of non empty Records. Result maps Record
+        entry names to columns of entry values. Boolean, Integer and Float
+        entries are decoded as `array.array` with type codes ``'B'``,
+        ``'q'`` and ``'d'``. All other entries are decoded as lists.
+
+        """
+
+    @staticmethod
+    @abc.abstractmethod
+    def skip(refs: dict[Ref, Type],
+             t: Type,
+             data: util.Bytes,
+             count: int = 1
+             ) -> int:
+        """Get size of `count` consecutive encoded values at start of data
+
+        Values are skipped without decoding.
+
+        """
+
+    @staticmethod
+    @abc.abstractmethod
+    def compile_projection(refs: dict[Ref, Type],
+                           t: Type,
+                           fields: typing.Iterable[str]
+                           ) -> typing.Any:
+        """Precompile projection of type `t` to selected fields
+
+        Each field is represented as dot separated path of Record or Choice
+        entry names (Arrays are transparent - path is applied to each item).
+
+        """
+
+    @staticmethod
+    @abc.abstractmethod
+    def decode_projection(projection: typing.Any,
+                          data: util.Bytes,
+                          zero_copy: bool = False
+                          ) -> Data:
+        """Decode selected fields
+
+        Only Record entries selected by `projection` are decoded. For
+        Choice values with unselected entry, ``None`` is used as entry value.
+        All other values are skipped without decoding.
+
+        """
+
+
+class SerializerCodec(Codec):
+    """Codec calling serializer methods with bound refs and type"""
+
+    def __init__(self,
+                 serializer: type[Serializer],
+                 refs: dict[Ref, Type],
+                 t: Type):
+        self._serializer = serializer
+        self._refs = refs
+        self._t = t
+
+    def encode(self, value):
+        return self._serializer.encode(self._refs, self._t, value)
+
+    def encode_into(self, value, buffer, offset=0):
+        return self._serializer.encode_into(self._refs, self._t, value,
+                                            buffer, offset)
+
+    def decode(self, data, *, zero_copy=False):
+        return self._serializer.decode(self._refs, self._t, data, zero_copy)
+
+    def encode_many(self, values, *, contiguous=False):
+        return self._serializer.encode_many(self._refs, self._t, values,
+                                            contiguous)
+
+    def decode_many(self, data, offsets=None, *, zero_copy=False):
+        return self._serializer.decode_many(self._refs, self._t, data,
+                                            offsets, zero_copy)
+
+
+def get_fields_tree(fields: typing.Iterable[str]) -> FieldsTree:
+    """Create tree of field paths"""
+    tree = {}
+
+    for field in fields:
+        segments = field.split('.')
+        if not all(segments):
+            raise ValueError(f'invalid field {field!r}')
+
+        subtree = tree
+        for segment in segments[:-1]:
+            if segment not in subtree:
+                subtree[segment] = {}
+
+            subtree = subtree[segment]
+            if subtree is None:
+                break
+
+        else:
+            subtree[segments[-1]] = None
+
+    return tree
@@ -6,9 +6,23 @@ try:
 except ImportError:
     _cserializer = None
 
+else:
+    common.Codec.register(_cserializer.Codec)
+
 
 class CSerializer(common.Serializer):
-    """Serializer implementation in C"""
+    """Serializer implementation in C
+
+    Refs are precompiled to C representation of types where all references
+    are resolved in advance.
+
+    """
+
+    def compile(refs, record_classes=None, typed_arrays=False):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.Program(refs, record_classes, typed_arrays)
 
     def encode(refs, t, value):
         if not _cserializer:
@@ -16,8 +30,97 @@ class CSerializer(common.Serializer):
 
         return _cserializer.encode(refs, t, value)
 
-    def decode(refs, t, data):
+    def encode_into(refs, t, value, buffer, offset=0):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.encode_into(refs, t, value, buffer, offset)
+
+    def encode_iov(refs, t, value, min_ref_size):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.encode_iov(refs, t, value, min_ref_size)
+
+    def decode(refs, t, data, zero_copy=False):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        if zero_copy:
+            data = memoryview(data).cast('B').toreadonly()
+
+        return _cserializer.decode(refs, t, data, zero_copy)
+
+    def encode_many(refs, t, values, contiguous=False):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.encode_many(refs, t, values, contiguous)
+
+    def decode_many(refs, t, data, offsets=None, zero_copy=False):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        if zero_copy:
+            if offsets is None:
+                data = [memoryview(i).cast('B').toreadonly() for i in data]
+
+            else:
+                data = memoryview(data).cast('B').toreadonly()
+
+        return _cserializer.decode_many(refs, t, data, offsets, zero_copy)
+
+    def encoded_size(refs, t, value):
         if not _cserializer:
             raise Exception('implementation not available')
 
-        return _cserializer.decode(refs, t, memoryview(data))
+        return _cserializer.encoded_size(refs, t, value)
+
+    def encoded_sizes(refs, t, values):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.encoded_sizes(refs, t, values)
+
+    def compile_codec(refs, t):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.Codec(refs, t)
+
+    def encode_columns(refs, t, columns):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.encode_columns(refs, t, columns)
+
+    def decode_columns(refs, t, data, zero_copy=False):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        if zero_copy:
+            data = memoryview(data).cast('B').toreadonly()
+
+        return _cserializer.decode_columns(refs, t, data, zero_copy)
+
+    def skip(refs, t, data, count=1):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.skip(refs, t, data, count)
+
+    def compile_projection(refs, t, fields):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        return _cserializer.Projection(refs, t,
+                                       common.get_fields_tree(fields))
+
+    def decode_projection(projection, data, zero_copy=False):
+        if not _cserializer:
+            raise Exception('implementation not available')
+
+        if zero_copy:
+            data = memoryview(data).cast('B').toreadonly()
+
+        return _cserializer.decode_projection(projection, data, zero_copy)
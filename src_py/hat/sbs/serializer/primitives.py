@@ -0,0 +1,148 @@
+"""Encoding and decoding of primitive values shared by Python serializers"""
+
+import array
+import struct
+import sys
+import typing
+
+from hat import util
+
+from hat.sbs import common
+
+
+float_struct: struct.Struct = struct.Struct('>d')
+"""Encoded Float representation"""
+
+
+def encode_integer(value: int, out: bytearray):
+    """Encode Integer and append it to `out`"""
+    if -0x40 <= value < 0x40:
+        out.append(_small_integers[value])
+        return
+
+    ret = bytearray([0x80 | (value & 0x7F)])
+    while True:
+        temp = ret[-1]
+        value = value >> 7
+        if value == 0 and not (temp & 0x40):
+            break
+        if value == -1 and (temp & 0x40):
+            break
+        ret.append(value & 0x7F)
+    ret.reverse()
+    out += ret
+
+
+def decode_integer(data: util.Bytes, pos: int) -> tuple[int, int]:
+    """Decode Integer starting at `pos` and get value with next position"""
+    i = data[pos]
+    if i & 0x80:
+        return (i - 0x100 if i & 0x40 else i - 0x80), pos + 1
+
+    ret = -1 if i & 0x40 else 0
+    while True:
+        ret = (ret << 7) | (i & 0x7F)
+        pos += 1
+        if i & 0x80:
+            return ret, pos
+        i = data[pos]
+
+
+def encode_typed_array(item_t: common.Type,
+                       value: typing.Any
+                       ) -> tuple[int, util.Bytes] | None:
+    """Encode Array items provided as buffer of numeric values
+
+    Result contains number of items and encoded items. If `value` can not
+    be encoded as typed array of `item_t` items, ``None`` is returned.
+
+    """
+    if not isinstance(item_t, (common.BooleanType, common.FloatType)):
+        return
+
+    try:
+        view = memoryview(value)
+
+    except TypeError:
+        return
+
+    with view:
+        item_format = view.format.lstrip('@=')
+        count = view.nbytes // view.itemsize if view.itemsize else 0
+
+        if not view.c_contiguous:
+            return
+
+        if (isinstance(item_t, common.BooleanType) and
+                item_format in ('?', 'b', 'B')):
+            return count, view.tobytes().translate(_boolean_table)
+
+        if isinstance(item_t, common.FloatType) and item_format == 'd':
+            items = array.array('d', view.tobytes())
+
+        elif isinstance(item_t, common.FloatType) and item_format == 'f':
+            items = array.array('d', array.array('f', view.tobytes()))
+
+        else:
+            return
+
+    if sys.byteorder == 'little':
+        items.byteswap()
+
+    return count, items
+
+
+def decode_typed_array(item_t: common.Type,
+                       data: util.Bytes,
+                       pos: int,
+                       count: int
+                       ) -> tuple[array.array, int]:
+    """Decode `count` Array items as `array.array` and get next position"""
+    if isinstance(item_t, common.IntegerType):
+        items = array.array('q')
+        for _ in range(count):
+            item, pos = decode_integer(data, pos)
+            items.append(item)
+
+        return items, pos
+
+    end = pos + (8 if isinstance(item_t, common.FloatType) else 1) * count
+    if end > len(data):
+        raise ValueError('invalid data')
+
+    if isinstance(item_t, common.BooleanType):
+        return array.array('B', bytes(data[pos:end]).translate(
+            _boolean_table)), end
+
+    items = array.array('d', bytes(data[pos:end]))
+    if sys.byteorder == 'little':
+        items.byteswap()
+
+    return items, end
+
+
+def get_min_size(t: common.Type) -> int:
+    """Get minimal size of encoded value of resolved type"""
+    if isinstance(t, common.FloatType):
+        return 8
+
+    if isinstance(t, (common.BooleanType,
+                      common.IntegerType,
+                      common.StringType,
+                      common.BytesType,
+                      common.ArrayType)):
+        return 1
+
+    if isinstance(t, common.ChoiceType) and t.entries:
+        return 1
+
+    return 0
+
+
+# all non zero values are translated to 1
+_boolean_table = bytes([0, *([1] * 0xFF)])
+
+# single byte encoded integers indexed by value (negative values are
+# indexed from end of list)
+_small_integers = [*(0x80 | (i & 0x7F) for i in range(0x40)),
+                   *(0x80 | (i & 0x7F) for i in range(-0x40, 0))]
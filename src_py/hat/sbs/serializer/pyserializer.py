@@ -1,213 +1,483 @@
-import collections
-import struct
+import array
+import typing
 
 from hat.sbs.serializer import common
+from hat.sbs.serializer.primitives import (float_struct,
+                                           encode_integer,
+                                           decode_integer,
+                                           encode_typed_array,
+                                           decode_typed_array,
+                                           get_min_size)
 
 
 class PySerializer(common.Serializer):
     """Serializer implementation in Python"""
 
+    def compile(refs, record_classes=None, typed_arrays=False):
+        return _CompiledRefs(refs, record_classes, typed_arrays)
+
     def encode(refs, t, value):
-        return bytes(_encode_generic(refs, t, value))
+        out = bytearray()
+        _encode_generic(refs, t, value, out)
+        return bytes(out)
+
+    def decode(refs, t, data, zero_copy=False):
+        data = _get_data(data, zero_copy)
+        value, _ = _decode_generic(refs, t, data, 0, zero_copy)
+        return value
+
+    def compile_codec(refs, t):
+        while isinstance(t, common.Ref) and t in refs:
+            t = refs[t]
+
+        if isinstance(t, common.Ref):
+            raise ValueError(f'unresolved ref {t}')
+
+        return common.SerializerCodec(PySerializer, refs, t)
+
+    def encode_columns(refs, t, columns):
+        out = bytearray()
+        _encode_columns(refs, t, columns, out)
+        return bytes(out)
+
+    def decode_columns(refs, t, data, zero_copy=False):
+        data = _get_data(data, zero_copy)
+        columns, _ = _decode_columns(refs, t, data, 0, zero_copy)
+        return columns
+
+    def skip(refs, t, data, count=1):
+        data = _get_data(data, True)
+
+        pos = 0
+        for _ in range(count):
+            _, pos = _decode_generic(refs, t, data, pos, True)
+
+        return pos
+
+    def compile_projection(refs, t, fields):
+        return _compile_projection(refs, t, common.get_fields_tree(fields))
 
-    def decode(refs, t, data):
-        value, _ = _decode_generic(refs, t, memoryview(data))
+    def decode_projection(projection, data, zero_copy=False):
+        data = _get_data(data, zero_copy)
+        value, _ = _decode_projection(projection, data, 0, zero_copy)
         return value
 
 
-def _encode_generic(refs, t, value):
+class _CompiledRefs(dict):
+
+    def __init__(self, refs, record_classes, typed_arrays):
+        super().__init__(refs)
+        self.record_classes = record_classes or {}
+        self.typed_arrays = typed_arrays
+
+        # ids of choice types mapped to entry ids indexed by entry names
+        self.choice_ids = {}
+        for t in refs.values():
+            _compile_choice_ids(t, self.choice_ids)
+
+
+class _Projection(typing.NamedTuple):
+    refs: dict[common.Ref, common.Type]
+    t: common.Type
+    children: list[typing.Optional['_Projection']] | None
+
+
+def _encode_generic(refs, t, value, out):
     while isinstance(t, common.Ref) and t in refs:
         t = refs[t]
 
     if isinstance(t, common.NoneType):
-        yield from _encode_None(value)
+        _encode_None(value, out)
 
     elif isinstance(t, common.BooleanType):
-        yield from _encode_Boolean(value)
+        _encode_Boolean(value, out)
 
     elif isinstance(t, common.IntegerType):
-        yield from _encode_Integer(value)
+        encode_integer(value, out)
 
     elif isinstance(t, common.FloatType):
-        yield from _encode_Float(value)
+        _encode_Float(value, out)
 
     elif isinstance(t, common.StringType):
-        yield from _encode_String(value)
+        _encode_String(value, out)
 
     elif isinstance(t, common.BytesType):
-        yield from _encode_Bytes(value)
+        _encode_Bytes(value, out)
 
     elif isinstance(t, common.ArrayType):
-        yield from _encode_Array(refs, t, value)
+        _encode_Array(refs, t, value, out)
 
     elif isinstance(t, common.RecordType):
-        yield from _encode_Record(refs, t, value)
+        _encode_Record(refs, t, value, out)
 
     elif isinstance(t, common.ChoiceType):
-        yield from _encode_Choice(refs, t, value)
+        _encode_Choice(refs, t, value, out)
 
     else:
         raise ValueError()
 
 
-def _decode_generic(refs, t, data):
+def _decode_generic(refs, t, data, pos, zero_copy):
     while isinstance(t, common.Ref) and t in refs:
         t = refs[t]
 
     if isinstance(t, common.NoneType):
-        return _decode_None(data)
+        return _decode_None(data, pos)
 
     if isinstance(t, common.BooleanType):
-        return _decode_Boolean(data)
+        return _decode_Boolean(data, pos)
 
     if isinstance(t, common.IntegerType):
-        return _decode_Integer(data)
+        return decode_integer(data, pos)
 
     if isinstance(t, common.FloatType):
-        return _decode_Float(data)
+        return _decode_Float(data, pos)
 
     if isinstance(t, common.StringType):
-        return _decode_String(data)
+        return _decode_String(data, pos)
 
     if isinstance(t, common.BytesType):
-        return _decode_Bytes(data)
+        return _decode_Bytes(data, pos, zero_copy)
 
     if isinstance(t, common.ArrayType):
-        return _decode_Array(refs, t, data)
+        return _decode_Array(refs, t, data, pos, zero_copy)
 
     if isinstance(t, common.RecordType):
-        return _decode_Record(refs, t, data)
+        return _decode_Record(refs, t, data, pos, zero_copy)
 
     if isinstance(t, common.ChoiceType):
-        return _decode_Choice(refs, t, data)
+        return _decode_Choice(refs, t, data, pos, zero_copy)
 
     raise ValueError()
 
 
-def _encode_None(value):
-    yield from b''
+def _encode_None(value, out):
+    pass
 
 
-def _decode_None(data):
-    return None, data
+def _decode_None(data, pos):
+    return None, pos
 
 
-def _encode_Boolean(value):
-    yield 1 if value else 0
+def _encode_Boolean(value, out):
+    out.append(1 if value else 0)
 
 
-def _decode_Boolean(data):
-    return bool(data[0]), data[1:]
+def _decode_Boolean(data, pos):
+    return bool(data[pos]), pos + 1
 
 
-def _encode_Integer(value):
-    ret = collections.deque()
-    while True:
-        temp = value & 0x7F
-        if not ret:
-            temp |= 0x80
-        ret.appendleft(temp)
-        value = value >> 7
-        if value == 0 and not (temp & 0x40):
-            break
-        if value == -1 and (temp & 0x40):
-            break
-    yield from ret
+def _encode_Float(value, out):
+    out += float_struct.pack(value)
 
 
-def _decode_Integer(data):
-    ret = -1 if data[0] & 0x40 else 0
-    while True:
-        ret = (ret << 7) | (data[0] & 0x7F)
-        if data[0] & 0x80:
-            return ret, data[1:]
-        data = data[1:]
+def _decode_Float(data, pos):
+    return float_struct.unpack_from(data, pos)[0], pos + 8
 
 
-def _encode_Float(value):
-    yield from struct.pack('>d', value)
+def _encode_String(value, out):
+    ret = value.encode('utf-8')
+    encode_integer(len(ret), out)
+    out += ret
 
 
-def _decode_Float(data):
-    return struct.unpack('>d', data[:8])[0], data[8:]
+def _decode_String(data, pos):
+    bytes_len, pos = decode_integer(data, pos)
+    end = pos + bytes_len
+    return str(data[pos:end], encoding='utf-8'), end
 
 
-def _encode_String(value):
-    ret = value.encode('utf-8')
-    yield from _encode_Integer(len(ret))
-    yield from ret
+def _encode_Bytes(value, out):
+    encode_integer(len(value), out)
+    out += value
 
 
-def _decode_String(data):
-    bytes_len, data = _decode_Integer(data)
-    return str(data[:bytes_len], encoding='utf-8'), data[bytes_len:]
+def _decode_Bytes(data, pos, zero_copy):
+    bytes_len, pos = decode_integer(data, pos)
+    end = pos + bytes_len
+    value = data[pos:end]
+    if not zero_copy:
+        value = bytes(value)
+    return value, end
 
 
-def _encode_Bytes(value):
-    yield from _encode_Integer(len(value))
-    yield from value
+def _encode_Array(refs, t, value, out):
+    if not isinstance(value, list):
+        item_t = t.t
+        while isinstance(item_t, common.Ref) and item_t in refs:
+            item_t = refs[item_t]
 
+        typed_array = encode_typed_array(item_t, value)
+        if typed_array is not None:
+            count, items = typed_array
+            encode_integer(count, out)
+            out += items
+            return
 
-def _decode_Bytes(data):
-    bytes_len, data = _decode_Integer(data)
-    return data[:bytes_len], data[bytes_len:]
+    encode_integer(len(value), out)
 
+    for i in value:
+        _encode_generic(refs, t.t, i, out)
 
-def _encode_Array(refs, t, value):
-    yield from _encode_Integer(len(value))
 
-    for i in value:
-        yield from _encode_generic(refs, t.t, i)
+def _decode_Array(refs, t, data, pos, zero_copy):
+    count, pos = decode_integer(data, pos)
 
+    if isinstance(refs, _CompiledRefs) and refs.typed_arrays:
+        item_t = t.t
+        while isinstance(item_t, common.Ref) and item_t in refs:
+            item_t = refs[item_t]
 
-def _decode_Array(refs, t, data):
-    count, data = _decode_Integer(data)
+        if isinstance(item_t, (common.BooleanType,
+                               common.IntegerType,
+                               common.FloatType)):
+            return decode_typed_array(item_t, data, pos, count)
 
-    ret = collections.deque()
+    ret = []
     for _ in range(count):
-        i, data = _decode_generic(refs, t.t, data)
+        i, pos = _decode_generic(refs, t.t, data, pos, zero_copy)
         ret.append(i)
 
-    return list(ret), data
+    return ret, pos
 
 
-def _encode_Record(refs, t, value):
+def _encode_Record(refs, t, value, out):
     if not t.entries:
         raise ValueError('empty entries')
 
+    if isinstance(value, tuple):
+        if len(value) != len(t.entries):
+            raise ValueError('invalid record size')
+
+        for (_, entry_type), entry_value in zip(t.entries, value):
+            _encode_generic(refs, entry_type, entry_value, out)
+
+        return
+
     for entry_name, entry_type in t.entries:
-        yield from _encode_generic(refs, entry_type, value[entry_name])
+        _encode_generic(refs, entry_type, value[entry_name], out)
 
 
-def _decode_Record(refs, t, data):
+def _decode_Record(refs, t, data, pos, zero_copy):
     if not t.entries:
         raise ValueError('empty entries')
 
+    record_class = (refs.record_classes.get(id(t))
+                    if isinstance(refs, _CompiledRefs) else None)
+
+    if record_class is not None:
+        entry_values = []
+        for _, entry_type in t.entries:
+            entry_value, pos = _decode_generic(refs, entry_type, data, pos,
+                                               zero_copy)
+            entry_values.append(entry_value)
+        return tuple.__new__(record_class, entry_values), pos
+
     ret = {}
     for entry_name, entry_type in t.entries:
-        ret[entry_name], data = _decode_generic(refs, entry_type, data)
-    return ret, data
+        ret[entry_name], pos = _decode_generic(refs, entry_type, data, pos,
+                                               zero_copy)
+    return ret, pos
 
 
-def _encode_Choice(refs, t, value):
+def _encode_Choice(refs, t, value, out):
     if not t.entries:
         raise ValueError('empty entries')
 
-    for i, (entry_name, entry_type) in enumerate(t.entries):
-        if entry_name == value[0]:
-            break
+    entry_ids = (refs.choice_ids.get(id(t))
+                 if isinstance(refs, _CompiledRefs) else None)
+
+    if entry_ids is not None:
+        i = entry_ids.get(value[0])
+        if i is None:
+            raise Exception('invalid entry name')
+
+        entry_type = t.entries[i][1]
+
     else:
-        raise Exception('invalid entry name')
+        for i, (entry_name, entry_type) in enumerate(t.entries):
+            if entry_name == value[0]:
+                break
+        else:
+            raise Exception('invalid entry name')
 
-    yield from _encode_Integer(i)
-    yield from _encode_generic(refs, entry_type, value[1])
+    encode_integer(i, out)
+    _encode_generic(refs, entry_type, value[1], out)
 
 
-def _decode_Choice(refs, t, data):
+def _decode_Choice(refs, t, data, pos, zero_copy):
     if not t.entries:
         raise ValueError('empty entries')
 
-    i, data = _decode_Integer(data)
+    i, pos = decode_integer(data, pos)
+    entry_name, entry_type = t.entries[i]
+    value, pos = _decode_generic(refs, entry_type, data, pos, zero_copy)
+    return (entry_name, value), pos
+
+
+def _encode_columns(refs, t, columns, out):
+    entries = _get_columns_entries(refs, t)
+    columns = [columns[entry_name] for entry_name, _ in entries]
+
+    count = len(columns[0])
+    if any(len(column) != count for column in columns):
+        raise ValueError('invalid column size')
+
+    encode_integer(count, out)
+
+    for row in zip(*columns):
+        for value, (_, entry_type) in zip(row, entries):
+            _encode_generic(refs, entry_type, value, out)
+
+
+def _decode_columns(refs, t, data, pos, zero_copy):
+    entries = _get_columns_entries(refs, t)
+    count, pos = decode_integer(data, pos)
+
+    # count is validated before decoding of entries
+    min_size = sum(get_min_size(entry_type)
+                   for _, entry_type in entries)
+    if min_size * count > len(data) - pos:
+        raise ValueError('invalid data')
+
+    columns = []
+    for _, entry_type in entries:
+        if isinstance(entry_type, common.BooleanType):
+            columns.append(array.array('B'))
+
+        elif isinstance(entry_type, common.IntegerType):
+            columns.append(array.array('q'))
+
+        elif isinstance(entry_type, common.FloatType):
+            columns.append(array.array('d'))
+
+        else:
+            columns.append([])
+
+    for _ in range(count):
+        for column, (_, entry_type) in zip(columns, entries):
+            value, pos = _decode_generic(refs, entry_type, data, pos,
+                                         zero_copy)
+            column.append(value)
+
+    return {entry_name: column
+            for column, (entry_name, _) in zip(columns, entries)}, pos
+
+
+def _get_columns_entries(refs, t):
+    while isinstance(t, common.Ref) and t in refs:
+        t = refs[t]
+
+    if not isinstance(t, common.ArrayType):
+        raise ValueError('unsupported type')
+
+    t = t.t
+    while isinstance(t, common.Ref) and t in refs:
+        t = refs[t]
+
+    if not isinstance(t, common.RecordType) or not t.entries:
+        raise ValueError('unsupported type')
+
+    # entry types are resolved once for all rows
+    entries = []
+    for entry_name, entry_type in t.entries:
+        while isinstance(entry_type, common.Ref) and entry_type in refs:
+            entry_type = refs[entry_type]
+
+        entries.append((entry_name, entry_type))
+
+    return entries
+
+
+def _compile_choice_ids(t, choice_ids):
+    if isinstance(t, common.ArrayType):
+        _compile_choice_ids(t.t, choice_ids)
+
+    elif isinstance(t, common.RecordType):
+        for _, entry_type in t.entries:
+            _compile_choice_ids(entry_type, choice_ids)
+
+    elif isinstance(t, common.ChoiceType) and id(t) not in choice_ids:
+        entry_ids = {}
+        for i, (entry_name, entry_type) in enumerate(t.entries):
+            entry_ids.setdefault(entry_name, i)
+            _compile_choice_ids(entry_type, choice_ids)
+
+        choice_ids[id(t)] = entry_ids
+
+
+def _compile_projection(refs, t, fields):
+    while isinstance(t, common.Ref) and t in refs:
+        t = refs[t]
+
+    if fields is None:
+        return _Projection(refs, t, None)
+
+    if isinstance(t, common.ArrayType):
+        return _Projection(refs, t, [_compile_projection(refs, t.t, fields)])
+
+    if (not isinstance(t, (common.RecordType, common.ChoiceType)) or
+            not t.entries):
+        if not fields:
+            raise ValueError('invalid fields')
+
+        raise ValueError(f'invalid field {next(iter(fields))!r}')
+
+    children = [None] * len(t.entries)
+    for field, subfields in fields.items():
+        for i, (entry_name, entry_type) in enumerate(t.entries):
+            if entry_name == field:
+                break
+        else:
+            raise ValueError(f'invalid field {field!r}')
+
+        children[i] = _compile_projection(refs, entry_type, subfields)
+
+    return _Projection(refs, t, children)
+
+
+def _decode_projection(projection, data, pos, zero_copy):
+    refs, t, children = projection
+
+    if children is None:
+        return _decode_generic(refs, t, data, pos, zero_copy)
+
+    if isinstance(t, common.ArrayType):
+        count, pos = decode_integer(data, pos)
+
+        ret = []
+        for _ in range(count):
+            i, pos = _decode_projection(children[0], data, pos, zero_copy)
+            ret.append(i)
+
+        return ret, pos
+
+    if isinstance(t, common.RecordType):
+        ret = {}
+        for (entry_name, entry_type), child in zip(t.entries, children):
+            if child is None:
+                _, pos = _decode_generic(refs, entry_type, data, pos, True)
+
+            else:
+                ret[entry_name], pos = _decode_projection(child, data, pos,
+                                                          zero_copy)
+
+        return ret, pos
+
+    i, pos = decode_integer(data, pos)
     entry_name, entry_type = t.entries[i]
-    value, data = _decode_generic(refs, entry_type, data)
-    return (entry_name, value), data
+    if children[i] is None:
+        _, pos = _decode_generic(refs, entry_type, data, pos, True)
+        return (entry_name, None), pos
+
+    value, pos = _decode_projection(children[i], data, pos, zero_copy)
+    return (entry_name, value), pos
+
+
+def _get_data(data, zero_copy):
+    # bytes are indexed faster than memoryview
+    if isinstance(data, bytes) and not zero_copy:
+        return data
+
+    data = memoryview(data).cast('B')
+    return data.toreadonly() if zero_copy else data
@@ -0,0 +1,167 @@
+"""Framed message streams
+
+Each frame contains single encoded message prefixed with its length encoded
+as SBS Integer (frame is equivalent to message encoded as SBS Bytes).
+
+"""
+
+from hat import util
+
+from hat.sbs import common
+from hat.sbs.repository import Repository
+from hat.sbs.serializer import Serializer, DefaultSerializer
+
+try:
+    from hat.sbs.serializer import _cserializer
+
+except ImportError:
+    _cserializer = None
+
+
+def frame_encode(data: util.Bytes) -> util.Bytes:
+    """Create frame containing encoded message"""
+    return frame_encode_header(len(data)) + data
+
+
+def frame_encode_header(size: int) -> util.Bytes:
+    """Create frame header for encoded message of size `size`
+
+    Frame header followed by encoded message is equivalent to
+    `frame_encode` result. Raises `ValueError` if `size` is negative.
+
+    """
+    return bytes(_encode_frame_header(size))
+
+
+class StreamDecodeError(Exception):
+    """Message decoding error
+
+    Messages successfully decoded before invalid message are available as
+    `messages`. Original decoding error is available as ``__cause__``.
+
+    """
+
+    def __init__(self, messages: list[common.Data]):
+        super().__init__('message decoding error')
+        self.messages = messages
+
+
+class StreamDecoder:
+    """Incremental decoder of framed messages
+
+    Received data is fed to decoder in arbitrary sized chunks. Incomplete
+    frames are kept in internal buffer until remaining data is received.
+
+    If `max_size` is set, frames with larger messages are considered invalid.
+
+    """
+
+    def __init__(self,
+                 repo: Repository,
+                 name: str | common.Ref, *,
+                 serializer: type[Serializer] = DefaultSerializer,
+                 max_size: int | None = None):
+        self._repo = repo
+        self._name = name
+        self._serializer = serializer
+        self._max_size = -1 if max_size is None else max_size
+        self._buff = bytearray()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes not yet decoded"""
+        return len(self._buff)
+
+    def feed(self, chunk: util.Bytes) -> list[common.Data]:
+        """Feed received data and get all completely received messages
+
+        If message can not be decoded, `StreamDecodeError` containing
+        messages decoded before invalid message is raised. Only invalid
+        frame is discarded - frames following invalid frame remain buffered
+        and are decoded by subsequent calls. Invalid frame header (or size
+        exceeding `max_size`) is unrecoverable error - decoder should not be
+        used afterwards.
+
+        """
+        self._buff.extend(chunk)
+
+        frames = _scan_frames(self._buff, self._max_size)
+        if not frames:
+            return []
+
+        messages = []
+        end = 0
+
+        try:
+            with memoryview(self._buff) as buff:
+                for start, end in frames:
+                    message = self._repo.decode(self._name, buff[start:end],
+                                                serializer=self._serializer)
+                    messages.append(message)
+
+        except Exception as e:
+            # traceback can reference slices of buffer which prevent resizing
+            self._buff = self._buff[end:]
+            raise StreamDecodeError(messages) from e
+
+        # deleting from start of bytearray doesn't move remaining data
+        del self._buff[:end]
+
+        return messages
+
+
+def _encode_frame_header(size):
+    if size < 0:
+        raise ValueError('invalid frame size')
+
+    header = bytearray([0x80 | (size & 0x7F)])
+    size >>= 7
+    while size or header[0] & 0x40:
+        header.insert(0, size & 0x7F)
+        size >>= 7
+
+    return header
+
+
+def _scan_frames(data, max_size):
+    if _cserializer:
+        return _cserializer.scan_frames(data, max_size)
+
+    return _scan_frames_py(data, max_size)
+
+
+def _scan_frames_py(data, max_size):
+    frames = []
+    pos = 0
+
+    while pos < len(data):
+        header_size = 0
+        while (pos + header_size < len(data) and
+                header_size < _frame_header_max_size and
+                not (data[pos + header_size] & 0x80)):
+            header_size += 1
+
+        if header_size >= _frame_header_max_size:
+            raise ValueError('invalid frame header')
+
+        if pos + header_size >= len(data):
+            break
+
+        size = -1 if data[pos] & 0x40 else 0
+        for i in data[pos:pos + header_size + 1]:
+            size = (size << 7) | (i & 0x7F)
+
+        if size < 0 or (max_size >= 0 and size > max_size):
+            raise ValueError(f'invalid frame size {size}')
+
+        start = pos + header_size + 1
+        if len(data) - start < size:
+            break
+
+        frames.append((start, start + size))
+        pos = start + size
+
+    return frames
+
+
+_frame_header_max_size = 9
@@ -0,0 +1,118 @@
+import asyncio
+import socket
+
+import pytest
+
+from hat import sbs
+import hat.sbs.aio
+
+
+serializers = [sbs.CSerializer,
+               sbs.PySerializer,
+               sbs.CodegenSerializer]
+
+
+@pytest.fixture
+def repo():
+    return sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Bytes
+        }
+    """)
+
+
+@pytest.fixture
+async def streams():
+    a, b = socket.socketpair()
+    reader, reader_writer = await asyncio.open_connection(sock=a)
+    _, writer = await asyncio.open_connection(sock=b)
+
+    yield reader, writer
+
+    for i in [reader_writer, writer]:
+        i.close()
+        await i.wait_closed()
+
+
+@pytest.mark.parametrize("serializer", serializers)
+async def test_read_write(streams, repo, serializer):
+    reader, writer = streams
+    msg_reader = hat.sbs.aio.MessageReader(reader, repo, 'M.T',
+                                           serializer=serializer,
+                                           chunk_size=100)
+    msg_writer = hat.sbs.aio.MessageWriter(writer, repo, 'M.T',
+                                           serializer=serializer)
+
+    values = [{'a': i, 'b': b'x' * i * 10} for i in range(100)]
+
+    msg_writer.write(values[0])
+    await msg_writer.drain()
+    assert await msg_reader.read() == values[0]
+
+    msg_writer.write_many(values[1:50])
+    for value in values[50:]:
+        msg_writer.write(value)
+    await msg_writer.drain()
+    writer.close()
+
+    result = [value async for value in msg_reader]
+    assert result == values[1:]
+
+    with pytest.raises(ConnectionError):
+        await msg_reader.read()
+
+
+async def test_max_size(streams, repo):
+    reader, writer = streams
+    msg_reader = hat.sbs.aio.MessageReader(reader, repo, 'M.T', max_size=100)
+    msg_writer = hat.sbs.aio.MessageWriter(writer, repo, 'M.T', max_size=200)
+
+    value = {'a': 1, 'b': b'x' * 150}
+
+    with pytest.raises(ValueError):
+        msg_writer.write({'a': 1, 'b': b'x' * 250})
+
+    with pytest.raises(ValueError):
+        msg_writer.write_many([value, {'a': 1, 'b': b'x' * 250}])
+
+    msg_writer.write(value)
+    await msg_writer.drain()
+
+    with pytest.raises(ValueError):
+        await msg_reader.read()
+
+
+async def test_incomplete_frame(streams, repo):
+    reader, writer = streams
+    msg_reader = hat.sbs.aio.MessageReader(reader, repo, 'M.T')
+
+    data = sbs.frame_encode(repo.encode('M.T', {'a': 1, 'b': b'abc'}))
+    writer.write(data[:-1])
+    await writer.drain()
+    writer.close()
+
+    with pytest.raises(ConnectionError):
+        await msg_reader.read()
+
+
+async def test_invalid_message(streams, repo):
+    reader, writer = streams
+    msg_reader = hat.sbs.aio.MessageReader(reader, repo, 'M.T')
+
+    values = [{'a': i, 'b': b'x'} for i in range(3)]
+    frames = [sbs.frame_encode(repo.encode('M.T', value)) for value in values]
+    invalid_frame = sbs.frame_encode(b'\x81')
+
+    writer.write(frames[0] + frames[1] + invalid_frame + frames[2])
+    await writer.drain()
+
+    assert await msg_reader.read() == values[0]
+    assert await msg_reader.read() == values[1]
+
+    with pytest.raises(sbs.StreamDecodeError):
+        await msg_reader.read()
+
+    assert await msg_reader.read() == values[2]
@@ -0,0 +1,151 @@
+import random
+
+import pytest
+
+from hat.sbs import parser
+
+
+def generate_type(rng, depth=0):
+    kind = rng.choice(['simple', 'simple', 'ref', 'ref', 'array', 'record',
+                       'choice', 'args'] if depth < 3 else ['simple', 'ref'])
+
+    if kind == 'simple':
+        return rng.choice(['None', 'Boolean', 'Integer', 'Float', 'String',
+                           'Bytes'])
+
+    if kind == 'ref':
+        return rng.choice(['T1', 'M.T2', 'a', 'Optional', 'Record', 'Choice',
+                           'Array', 'ArrayX', 'Nonex', 'N.Integer'])
+
+    if kind == 'array':
+        return f'Array{generate_ws(rng)}({generate_type(rng, depth + 1)})'
+
+    if kind == 'args':
+        args = [generate_type(rng, depth + 1)
+                for _ in range(rng.randint(0, 3))]
+        return f"Optional{generate_ws(rng)}({' '.join(args)})"
+
+    entries = [f'e{i}{generate_ws(rng)}:{generate_ws(rng)}'
+               f'{generate_type(rng, depth + 1)}'
+               for i in range(rng.randint(1, 3))]
+    separator = rng.choice([' ', ', ', '\n', ' # comment\n'])
+    return (f"{kind.capitalize()}{generate_ws(rng)}{{"
+            f"{generate_ws(rng)}{separator.join(entries)}{generate_ws(rng)}}}")
+
+
+def generate_ws(rng):
+    return rng.choice(['', '', ' ', '\n', '\r\n', '\t', ',', ' # x\r'])
+
+
+def generate_schema(rng):
+    type_defs = []
+    for i in range(rng.randint(0, 4)):
+        args = (f"({' '.join(rng.sample(['a', 'b', 'c'], rng.randint(0, 2)))})"
+                if rng.random() < 0.3 else '')
+        type_defs.append(f'T{i}{generate_ws(rng)}{args}{generate_ws(rng)}='
+                         f'{generate_ws(rng)}{generate_type(rng)}')
+
+    separator = rng.choice([' ', '\n\n', '\n# comment\n'])
+    return f"{generate_ws(rng)}module M\n{separator.join(type_defs)}" \
+           f"{generate_ws(rng)}"
+
+
+def mutate_schema(rng, schema):
+    pos = rng.randrange(len(schema) + 1)
+    action = rng.choice(['insert', 'delete', 'replace'])
+    char = rng.choice(' \n#,.:=(){}aZ_1')
+
+    if action == 'insert':
+        return schema[:pos] + char + schema[pos:]
+
+    if action == 'delete':
+        return schema[:pos] + schema[pos + 1:]
+
+    return schema[:pos] + char + schema[pos + 1:]
+
+
+def parse_both(schema):
+    try:
+        expected = parser.parse_peg(schema)
+
+    except Exception:
+        expected = None
+
+    try:
+        result = parser.parse(schema)
+
+    except Exception:
+        result = None
+
+    return result, expected
+
+
+@pytest.mark.parametrize("schema", [
+    "module M",
+    "  module M  ",
+    "module M T = Integer",
+    "module M T = Integer T = String",
+    "module M\nT = Integer\n# comment\n",
+    "module M # comment",
+    "module M\nT = Integer # comment",
+    "moduleM T = Integer",
+    "module M T=Integer",
+    "module M T = Integerx",
+    "module M T = Integer.X",
+    "module M T = Integer(String)",
+    "module M T = N.Integer",
+    "module M T = M .X",
+    "module M T = M. X",
+    "module M T = Array",
+    "module M T = Array.X",
+    "module M T = Array ( Integer )",
+    "module M T = Array(Integer String)",
+    "module M T = Array()",
+    "module M T = Record",
+    "module M T = Record {}",
+    "module M T = Record(Integer)",
+    "module M T = Record { a: Integer }",
+    "module M T = Record{a:Integer,b:String}",
+    "module M T = Record{a:X(A)b:Y}",
+    "module M T = Record{a:Record{b:Y}c:Y}",
+    "module M T = Choice {\r\n a: None\r b: M.T }",
+    "module M T(a b) = a",
+    "module M T ( a, b ) = Optional(a)",
+    "module M T() = Integer",
+    "module M T(a)(b) = Integer",
+    "module M T = X(A)U = Y",
+    "module M T = X(,A,B,)",
+    "module M T = X(A)(B)",
+    "module M T = X.Y.Z",
+    "module M T = Integer\fU = String",
+    "module M T = Integer\n\n"
+])
+def test_parse_cases(schema):
+    result, expected = parse_both(schema)
+    assert result == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_parse_random(seed):
+    rng = random.Random(seed)
+
+    for _ in range(50):
+        schema = generate_schema(rng)
+        result, expected = parse_both(schema)
+        assert result == expected, schema
+
+        for _ in range(3):
+            schema = mutate_schema(rng, schema)
+            result, expected = parse_both(schema)
+            assert result == expected, schema
+
+
+@pytest.mark.parametrize("schema, line, column", [
+    ("module", 1, 7),
+    ("module M\n  T = Integer(", 2, 14),
+    ("module M\r\nT = Record {\r\n  a: ?\r\n}", 3, 6),
+    ("module M\n# comment", 2, 1)
+])
+def test_parse_error_position(schema, line, column):
+    with pytest.raises(Exception, match=f'line {line}, column {column}'):
+        parser.parse(schema)
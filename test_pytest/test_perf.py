@@ -1,15 +1,23 @@
+import array
+import asyncio
 import collections
+import concurrent.futures
+import socket
+import time
+import tracemalloc
 
 import pytest
 
 from hat import sbs
+import hat.sbs.aio
 
 
 pytestmark = pytest.mark.perf
 
 
 serializers = [sbs.CSerializer,
-               sbs.PySerializer]
+               sbs.PySerializer,
+               sbs.CodegenSerializer]
 
 
 @pytest.mark.parametrize("serializer", serializers)
@@ -57,3 +65,611 @@ def test_event_encoding_duration(duration, serializer, event_count,
         for i in results:
             sbs_repo.decode('HatEventer.MsgRegisterReq', i,
                             serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("depth", [1, 4])
+@pytest.mark.parametrize("width", [10, 1000])
+def test_nested_encoding_duration(duration, serializer, depth, width):
+    repo = sbs.Repository("""
+        module M
+
+        Node = Record {
+            name: String
+            data: Bytes
+            values: Array(Float)
+            children: Array(Node)
+        }
+    """)
+
+    value = {'name': 'leaf',
+             'data': b'x' * 100,
+             'values': [1.5] * 10,
+             'children': []}
+    for i in range(depth):
+        value = {'name': f'node{i}',
+                 'data': b'',
+                 'values': [],
+                 'children': [value] * (width if i == 0 else 2)}
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'depth: {depth}; width: {width}'):
+        for _ in range(10):
+            data = repo.encode('M.Node', value, serializer=serializer)
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'depth: {depth}; width: {width}'):
+        for _ in range(10):
+            repo.decode('M.Node', data, serializer=serializer)
+
+
+@pytest.mark.parametrize("iov", [False, True])
+@pytest.mark.parametrize("payload_size", [1000, 0x1000000])
+def test_encode_iov_duration(duration, iov, payload_size):
+    repo = sbs.Repository("""
+        module M
+
+        Msg = Record {
+            id: Integer
+            name: String
+            payload: Bytes
+        }
+    """)
+    value = {'id': 1, 'name': 'abc', 'payload': b'x' * payload_size}
+    count = 10 if payload_size > 0x10000 else 10000
+
+    with duration(f'payload_size: {payload_size}; iov: {iov}'):
+        for _ in range(count):
+            if iov:
+                repo.encode_iov('M.Msg', value, serializer=sbs.CSerializer,
+                                min_ref_size=0x10000)
+
+            else:
+                repo.encode('M.Msg', value, serializer=sbs.CSerializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("value_type", ['points', 'payload', 'mixed'])
+def test_encoded_size_duration(duration, serializer, value_type):
+    repo = sbs.Repository("""
+        module M
+
+        Point = Record {
+            x: Float
+            y: Float
+            valid: Boolean
+        }
+
+        Msg = Record {
+            id: Integer
+            name: String
+            payload: Bytes
+            points: Array(Point)
+        }
+    """)
+    point = {'x': 1.5, 'y': 2.5, 'valid': True}
+
+    if value_type == 'points':
+        value = {'id': 1, 'name': '', 'payload': b'',
+                 'points': [point] * 10000}
+
+    elif value_type == 'payload':
+        value = {'id': 1, 'name': '', 'payload': b'x' * 0x100000,
+                 'points': []}
+
+    else:
+        value = {'id': 1, 'name': 'abc', 'payload': b'x' * 100,
+                 'points': [point] * 10}
+
+    values = [value] * 100
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'value_type: {value_type}'):
+        sizes = [len(i) for i in repo.encode_many('M.Msg', values,
+                                                  serializer=serializer)]
+
+    with duration(f'{serializer.__name__} encoded_sizes - '
+                  f'value_type: {value_type}'):
+        result = repo.encoded_sizes('M.Msg', values, serializer=serializer)
+
+    assert result == sizes
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("codec", [False, True])
+def test_codec_duration(duration, serializer, codec):
+    repo = sbs.Repository("""
+        module M
+
+        Msg = Record {
+            id: Integer
+            name: String
+        }
+    """)
+    value = {'id': 1, 'name': 'abc'}
+    data = repo.encode('M.Msg', value)
+    count = 100000
+
+    if codec:
+        msg_codec = repo.codec('M.Msg', serializer=serializer)
+        encode = msg_codec.encode
+        decode = msg_codec.decode
+
+    else:
+        def encode(value):
+            return repo.encode('M.Msg', value, serializer=serializer)
+
+        def decode(data):
+            return repo.decode('M.Msg', data, serializer=serializer)
+
+    with duration(f'{serializer.__name__} encode - codec: {codec}'):
+        for _ in range(count):
+            encode(value)
+
+    with duration(f'{serializer.__name__} decode - codec: {codec}'):
+        for _ in range(count):
+            decode(data)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("payload_size", [10, 1000, 100000])
+def test_payload_encoding_duration(duration, serializer, payload_size):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            id: Integer
+            name: String
+            data: Bytes
+        }
+    """)
+
+    value = {'id': payload_size,
+             'name': 'x' * payload_size,
+             'data': b'x' * payload_size}
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'payload_size: {payload_size}'):
+        for _ in range(100):
+            data = repo.encode('M.T', value, serializer=serializer)
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'payload_size: {payload_size}'):
+        for _ in range(100):
+            repo.decode('M.T', data, serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("choice_size", [2, 10, 100, 1000])
+def test_choice_encoding_duration(duration, serializer, choice_size):
+    entries = '\n'.join(f'e{i}: None' for i in range(choice_size))
+    repo = sbs.Repository(f"""
+        module M
+
+        T = Array(Choice {{
+            {entries}
+        }})
+    """)
+
+    value = [(f'e{i % choice_size}', None) for i in range(10000)]
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'choice_size: {choice_size}'):
+        data = repo.encode('M.T', value, serializer=serializer)
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'choice_size: {choice_size}'):
+        repo.decode('M.T', data, serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("record_tuples", [False, True])
+@pytest.mark.parametrize("value_count", [100000])
+def test_record_decoding_duration(duration, serializer, record_tuples,
+                                  value_count):
+    repo = sbs.Repository("""
+        module M
+
+        T = Array(Record {
+            id: Integer
+            timestamp: Float
+            name: String
+            flag: Boolean
+        })
+    """)
+
+    value = [{'id': i, 'timestamp': 1.5, 'name': 'abc', 'flag': True}
+             for i in range(value_count)]
+    data = repo.encode('M.T', value, serializer=serializer)
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'value_count: {value_count}; '
+                  f'record_tuples: {record_tuples}'):
+        repo.decode('M.T', data, serializer=serializer,
+                    record_tuples=record_tuples)
+
+
+def test_record_tuples_decoding_comparison():
+    repo = sbs.Repository("""
+        module M
+
+        T = Array(Record {
+            id: Integer
+            timestamp: Float
+            name: String
+            flag: Boolean
+        })
+    """)
+
+    value = [{'id': i, 'timestamp': 1.5, 'name': 'abc', 'flag': True}
+             for i in range(100000)]
+    data = repo.encode('M.T', value, serializer=sbs.CSerializer)
+
+    def measure(record_tuples):
+        dts = []
+        for _ in range(5):
+            start = time.perf_counter()
+            repo.decode('M.T', data, serializer=sbs.CSerializer,
+                        record_tuples=record_tuples)
+            dts.append(time.perf_counter() - start)
+        return min(dts)
+
+    dict_dt = measure(False)
+    tuple_dt = measure(True)
+    print(f'CSerializer decode - dict: {dict_dt:.6f}s; '
+          f'record_tuples: {tuple_dt:.6f}s')
+
+    assert tuple_dt <= dict_dt
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("typed_arrays", [False, True])
+@pytest.mark.parametrize("item_type", ['Boolean', 'Integer', 'Float'])
+@pytest.mark.parametrize("value_count", [100000])
+def test_typed_array_encoding_duration(duration, serializer, typed_arrays,
+                                       item_type, value_count):
+    repo = sbs.Repository(f"""
+        module M
+
+        T = Array({item_type})
+    """)
+
+    if item_type == 'Boolean':
+        value = [bool(i % 2) for i in range(value_count)]
+        typecode = 'B'
+
+    elif item_type == 'Integer':
+        value = list(range(value_count))
+        typecode = 'q'
+
+    else:
+        value = [i / 2 for i in range(value_count)]
+        typecode = 'd'
+
+    if typed_arrays:
+        value = array.array(typecode, value)
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'item_type: {item_type}; '
+                  f'typed_arrays: {typed_arrays}'):
+        data = repo.encode('M.T', value, serializer=serializer)
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'item_type: {item_type}; '
+                  f'typed_arrays: {typed_arrays}'):
+        repo.decode('M.T', data, serializer=serializer,
+                    typed_arrays=typed_arrays)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("columns", [False, True])
+@pytest.mark.parametrize("value_count", [100000])
+def test_columns_encoding_duration(duration, serializer, columns,
+                                   value_count):
+    repo = sbs.Repository("""
+        module M
+
+        T = Array(Record {
+            timestamp: Float
+            value: Float
+            quality: Integer
+            valid: Boolean
+        })
+    """)
+
+    value = [{'timestamp': i / 2, 'value': 1.5, 'quality': i % 4,
+              'valid': True}
+             for i in range(value_count)]
+    value_columns = {
+        'timestamp': array.array('d', (i['timestamp'] for i in value)),
+        'value': array.array('d', (i['value'] for i in value)),
+        'quality': array.array('q', (i['quality'] for i in value)),
+        'valid': array.array('B', (i['valid'] for i in value))}
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'value_count: {value_count}; columns: {columns}'):
+        if columns:
+            data = repo.encode_columns('M.T', value_columns,
+                                       serializer=serializer)
+
+        else:
+            data = repo.encode('M.T', value, serializer=serializer)
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'value_count: {value_count}; columns: {columns}'):
+        if columns:
+            repo.decode_columns('M.T', data, serializer=serializer)
+
+        else:
+            repo.decode('M.T', data, serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("many", [True, False])
+@pytest.mark.parametrize("value_count", [10000])
+def test_many_encoding_duration(duration, serializer, many, value_count):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: String
+            c: Float
+        }
+    """)
+
+    values = [{'a': i, 'b': 'abc', 'c': 1.5} for i in range(value_count)]
+
+    with duration(f'{serializer.__name__} encode - '
+                  f'value_count: {value_count}; many: {many}'):
+        if many:
+            data = repo.encode_many('M.T', values, serializer=serializer)
+
+        else:
+            data = [repo.encode('M.T', value, serializer=serializer)
+                    for value in values]
+
+    with duration(f'{serializer.__name__} decode - '
+                  f'value_count: {value_count}; many: {many}'):
+        if many:
+            repo.decode_many('M.T', data, serializer=serializer)
+
+        else:
+            for i in data:
+                repo.decode('M.T', i, serializer=serializer)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("module_count", [10, 100])
+def test_lazy_repository_duration(duration, tmp_path, lazy, module_count):
+    for i in range(module_count):
+        type_defs = '\n'.join(
+            f"""
+                T{j} = Record {{
+                    id: Integer
+                    name: Optional(String)
+                    next: M{i}.T{j - 1 if j else 'Base'}
+                }}
+            """
+            for j in range(50))
+        (tmp_path / f'm{i}.sbs').write_text(f"""
+            module M{i}
+
+            TBase = Record {{ data: Bytes }}
+            {type_defs}
+        """)
+
+    value = {'id': 1, 'name': ('none', None), 'next': {'data': b''}}
+
+    tracemalloc.start()
+    try:
+        with duration(f'module_count: {module_count}; lazy: {lazy}'):
+            repo = sbs.Repository(tmp_path, lazy=lazy)
+            repo.encode('M0.T0', value)
+
+        size, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    print(f'\nmodule_count: {module_count}; lazy: {lazy}; '
+          f'memory: {size / 0x100000:.1f} MB; '
+          f'peak memory: {peak / 0x100000:.1f} MB')
+
+
+@pytest.mark.parametrize("peg", [True, False])
+@pytest.mark.parametrize("type_count", [10, 1000])
+def test_parse_duration(duration, peg, type_count):
+    type_defs = '\n'.join(
+        f"""
+            T{i}(a) = Record {{
+                id: Integer
+                name: Optional(String)  # comment
+                values: Array(Choice {{
+                    a: Float
+                    b: M.T{i - 1 if i else 'Base'}
+                    c: a
+                }})
+            }}
+        """
+        for i in range(type_count))
+    schema = f"""
+        module M
+
+        TBase = Record {{ data: Bytes }}
+        {type_defs}
+    """
+    parse = hat.sbs.parser.parse_peg if peg else hat.sbs.parser.parse
+
+    with duration(f'type_count: {type_count}; peg: {peg}'):
+        parse(schema)
+
+
+@pytest.mark.parametrize("type_count", [10, 1000])
+def test_evaluation_duration(duration, type_count):
+    type_defs = '\n'.join(
+        f"""
+            T{i} = Record {{
+                id: Integer
+                name: Optional(String)
+                entries: Array(Entry(String, Optional(Integer)))
+                values: Array(Optional(Entry(Integer, Value)))
+                next: Optional(T{i - 1 if i else 'Base'})
+            }}
+        """
+        for i in range(type_count))
+    module = hat.sbs.parser.parse(f"""
+        module M
+
+        Entry(K, V) = Record {{
+            key: K
+            value: V
+        }}
+
+        Value = Choice {{
+            a: Float
+            b: Optional(Bytes)
+            c: Array(String)
+        }}
+
+        TBase = Record {{ data: Bytes }}
+        {type_defs}
+    """)
+
+    tracemalloc.start()
+    try:
+        with duration(f'type_count: {type_count}'):
+            refs = hat.sbs.evaluator.evaluate_modules([module])
+
+        size, _ = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    print(f'\ntype_count: {type_count}; '
+          f'memory: {size / 0x100000:.2f} MB')
+
+    assert len(refs) > type_count
+
+
+@pytest.mark.parametrize("cached", [False, True])
+@pytest.mark.parametrize("module_count", [1, 20])
+def test_repository_initialization_duration(duration, tmp_path, cached,
+                                            module_count):
+    schema_path = tmp_path / 'schemas'
+    schema_path.mkdir()
+
+    for i in range(module_count):
+        type_defs = '\n'.join(
+            f"""
+                T{j} = Record {{
+                    id: Integer
+                    name: Optional(String)
+                    values: Array(Choice {{
+                        a: Float
+                        b: T{j - 1 if j else 'Base'}
+                    }})
+                }}
+            """
+            for j in range(50))
+        (schema_path / f'm{i}.sbs').write_text(f"""
+            module M{i}
+
+            TBase = Record {{ data: Bytes }}
+            {type_defs}
+        """)
+
+    cache_dir = tmp_path / 'cache'
+    if cached:
+        sbs.Repository(schema_path, cache_dir=cache_dir)
+
+    with duration(f'module_count: {module_count}; cached: {cached}'):
+        sbs.Repository(schema_path, cache_dir=cache_dir if cached else None)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("batch_size", [1, 100])
+@pytest.mark.parametrize("message_count", [10000])
+async def test_aio_throughput(duration, serializer, batch_size,
+                              message_count):
+    repo = sbs.Repository("""
+        module M
+
+        Msg = Record {
+            id: Integer
+            timestamp: Float
+            data: Bytes
+        }
+    """)
+
+    a, b = socket.socketpair()
+    reader, reader_writer = await asyncio.open_connection(sock=a)
+    _, writer = await asyncio.open_connection(sock=b)
+
+    msg_reader = hat.sbs.aio.MessageReader(reader, repo, 'M.Msg',
+                                           serializer=serializer)
+    msg_writer = hat.sbs.aio.MessageWriter(writer, repo, 'M.Msg',
+                                           serializer=serializer)
+
+    async def write():
+        for i in range(0, message_count, batch_size):
+            msg_writer.write_many({'id': j,
+                                   'timestamp': time.perf_counter(),
+                                   'data': b'x' * 100}
+                                  for j in range(i, i + batch_size))
+            await msg_writer.drain()
+
+        writer.close()
+
+    latencies = collections.deque()
+
+    async def read():
+        async for msg in msg_reader:
+            latencies.append(time.perf_counter() - msg['timestamp'])
+
+    with duration(f'{serializer.__name__} aio - '
+                  f'message_count: {message_count}; '
+                  f'batch_size: {batch_size}'):
+        start = time.perf_counter()
+        await asyncio.gather(write(), read())
+        dt = time.perf_counter() - start
+
+    assert len(latencies) == message_count
+
+    p99 = sorted(latencies)[int(len(latencies) * 0.99)]
+    print(f'\n{serializer.__name__} aio - batch_size: {batch_size}; '
+          f'{message_count / dt:.0f} messages/s; '
+          f'p99 latency: {p99 * 1e6:.0f} us')
+
+    reader_writer.close()
+
+
+@pytest.mark.parametrize("thread_count", [1, 2, 4, 8])
+@pytest.mark.parametrize("payload_size", [100, 0x100000])
+def test_thread_scaling_duration(duration, thread_count, payload_size):
+    serializer = sbs.CSerializer
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            id: Integer
+            data: Bytes
+        }
+    """)
+
+    value = {'id': 1, 'data': b'x' * payload_size}
+    task_count = 64
+    iterations = 0x1000000 // (payload_size * task_count) + 1
+
+    def task():
+        for _ in range(iterations):
+            data = repo.encode('M.T', value, serializer=serializer)
+            repo.decode('M.T', data, serializer=serializer)
+
+    with concurrent.futures.ThreadPoolExecutor(thread_count) as executor:
+        with duration(f'{serializer.__name__} threads - '
+                      f'thread_count: {thread_count}; '
+                      f'payload_size: {payload_size}'):
+            futures = [executor.submit(task) for _ in range(task_count)]
+            for future in futures:
+                future.result()
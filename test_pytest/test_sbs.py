@@ -1,10 +1,19 @@
+import array
+import concurrent.futures
+import ctypes
+import gc
+import mmap
+import sys
+import threading
+
 import pytest
 
 from hat import sbs
 
 
 serializers = [sbs.CSerializer,
-               sbs.PySerializer]
+               sbs.PySerializer,
+               sbs.CodegenSerializer]
 
 
 def test_example():
@@ -223,25 +232,1194 @@ def test_repository_initialization_with_repository(serializer):
     assert encoded1 == encoded2
 
 
+def test_repository_cache(tmp_path, monkeypatch):
+    schema_path = tmp_path / 'schemas'
+    cache_dir = tmp_path / 'cache'
+    schema_path.mkdir()
+    (schema_path / 'm.sbs').write_text("""
+        module M
+
+        T = Array(Record {
+            a: Integer
+            b: Optional(String)
+        })
+    """)
+    value = [{'a': 1, 'b': ('value', 'x')}, {'a': 2, 'b': ('none', None)}]
+
+    repo1 = sbs.Repository(schema_path, cache_dir=cache_dir)
+    assert len(list(cache_dir.iterdir())) == 1
+
+    with monkeypatch.context() as m:
+        m.setattr(sbs.parser, 'parse', None)
+        m.setattr(sbs.evaluator, 'evaluate_modules', None)
+        repo2 = sbs.Repository(schema_path, cache_dir=cache_dir)
+
+    assert repo2.to_json() == repo1.to_json()
+    encoded_value = repo1.encode('M.T', value)
+    assert repo2.decode('M.T', encoded_value) == value
+
+    (schema_path / 'm.sbs').write_text("module M T = Integer")
+    repo3 = sbs.Repository(schema_path, cache_dir=cache_dir)
+    assert repo3.decode('M.T', repo3.encode('M.T', 1)) == 1
+    assert len(list(cache_dir.iterdir())) == 2
+
+    for path in cache_dir.iterdir():
+        path.write_bytes(b'invalid')
+
+    repo4 = sbs.Repository(schema_path, cache_dir=cache_dir)
+    assert repo4.to_json() == repo3.to_json()
+
+    repo5 = sbs.Repository(repo1, cache_dir=cache_dir)
+    assert repo5.to_json() == repo1.to_json()
+    assert len(list(cache_dir.iterdir())) == 3
+
+
+def test_repository_unwritable_cache(tmp_path, monkeypatch):
+    schema = "module M T = Integer"
+
+    cache_dir = tmp_path / 'file'
+    cache_dir.write_bytes(b'')
+    repo = sbs.Repository(schema, cache_dir=cache_dir)
+    assert repo.decode('M.T', repo.encode('M.T', 1)) == 1
+
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+
+    def replace(src, dst):
+        raise PermissionError()
+
+    with monkeypatch.context() as m:
+        m.setattr(sbs.repository.os, 'replace', replace)
+        repo = sbs.Repository(schema, cache_dir=cache_dir)
+
+    assert repo.decode('M.T', repo.encode('M.T', 1)) == 1
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_lazy_repository(tmp_path, monkeypatch):
+    (tmp_path / 'a.sbs').write_text("""
+        # comment
+        module A
+
+        T = Record {
+            b: B.T
+            c: Optional(U)
+        }
+
+        U = Array(Choice {
+            x: Integer
+            y: U
+        })
+
+        Unused = Integer
+    """)
+    (tmp_path / 'b.sbs').write_text("""
+        module B
+
+        T = Record { x: String }
+    """)
+    (tmp_path / 'c.sbs').write_text("""
+        module C
+
+        T = Invalid(
+    """)
+    value = {'b': {'x': 'abc'},
+             'c': ('value', [('x', 1), ('y', [('x', 2)])])}
+
+    parsed = []
+    parse = sbs.parser.parse
+    monkeypatch.setattr(sbs.parser, 'parse',
+                        lambda schema: parsed.append(schema) or parse(schema))
+
+    repo = sbs.Repository(tmp_path, lazy=True)
+    assert parsed == []
+
+    encoded_value = repo.encode('A.T', value)
+    assert len(parsed) == 2
+    assert repo.decode('A.T', encoded_value) == value
+
+    A_T = repo.record_class('A.T')
+    assert repo.record_class('B.T') is not None
+    assert repo.decode('A.T', encoded_value, record_tuples=True).b.x == 'abc'
+    assert type(repo.decode('A.T', encoded_value, record_tuples=True)) is A_T
+
+    assert repo.decode('A.Unused', repo.encode('A.Unused', 1)) == 1
+    assert len(parsed) == 2
+
+    with pytest.raises(Exception):
+        repo.encode('C.T', 1)
+
+    with pytest.raises(Exception):
+        repo.encode('A.Missing', 1)
+
+    with pytest.raises(Exception):
+        sbs.Repository(tmp_path)
+
+    (tmp_path / 'c.sbs').unlink()
+    eager_repo = sbs.Repository(tmp_path)
+    lazy_repo = sbs.Repository(tmp_path, lazy=True)
+    assert eager_repo.encode('A.T', value) == encoded_value
+    assert sorted(lazy_repo.to_json(), key=lambda i: i['name']) == \
+        sorted(eager_repo.to_json(), key=lambda i: i['name'])
+
+    with pytest.raises(ValueError):
+        sbs.Repository(tmp_path, lazy=True, cache_dir=tmp_path / 'cache')
+
+
+def test_codegen_uncompiled_refs(monkeypatch):
+    modules = [sbs.parser.parse("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: String
+        }
+    """)]
+    refs = sbs.evaluator.evaluate_modules(modules)
+    t = sbs.Ref('M', 'T')
+    value = {'a': 1, 'b': 'x'}
+
+    programs = []
+
+    class Program(sbs.serializer.codegenserializer._Program):
+
+        def __init__(self, refs):
+            programs.append(refs)
+            super().__init__(refs)
+
+    monkeypatch.setattr(sbs.serializer.codegenserializer, '_Program',
+                        Program)
+
+    for _ in range(3):
+        data = sbs.CodegenSerializer.encode(refs, t, value)
+        assert sbs.CodegenSerializer.decode(refs, t, data) == value
+
+    assert programs == [refs]
+
+    refs = dict(refs)
+    assert sbs.CodegenSerializer.decode(refs, t, data) == value
+    assert len(programs) == 2
+
+
+def test_codegen_unresolved_ref():
+    refs = sbs.evaluator.evaluate_modules([sbs.parser.parse("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Choice {
+                t: T
+                missing: Missing
+            }
+        }
+
+        U = Record {
+            a: V
+            b: T
+        }
+
+        V = Array(Integer)
+    """)])
+    program = sbs.CodegenSerializer.compile(refs)
+
+    for _ in range(2):
+        for ref in [sbs.Ref('M', 'T'), sbs.Ref('M', 'U')]:
+            with pytest.raises(ValueError):
+                sbs.CodegenSerializer.encode(program, ref, {})
+
+            with pytest.raises(ValueError):
+                sbs.CodegenSerializer.decode(program, ref, b'')
+
+    data = sbs.CodegenSerializer.encode(program, sbs.Ref('M', 'V'), [1, 2])
+    assert sbs.CodegenSerializer.decode(program, sbs.Ref('M', 'V'),
+                                        data) == [1, 2]
+
+
+def test_codegen_concurrent_generation():
+    type_count = 50
+    thread_count = 8
+    refs = sbs.evaluator.evaluate_modules([sbs.parser.parse(
+        'module M\n' +
+        ''.join(f'T{i} = Record {{ a: Integer b: Choice {{ '
+                f'x: T{i} y: Array(String) }} }}\n'
+                for i in range(type_count)))])
+    value = {'a': 1, 'b': ('y', ['x'])}
+
+    def encode(program, barrier):
+        barrier.wait()
+        for i in range(type_count):
+            ref = sbs.Ref('M', f'T{i}')
+            data = sbs.CodegenSerializer.encode(program, ref, value)
+            assert sbs.CodegenSerializer.decode(program, ref, data) == value
+
+    # frequent thread switching increases probability of races
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(thread_count) as executor:
+            for _ in range(5):
+                program = sbs.CodegenSerializer.compile(refs)
+                barrier = threading.Barrier(thread_count)
+                futures = [executor.submit(encode, program, barrier)
+                           for _ in range(thread_count)]
+                for future in futures:
+                    future.result()
+
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_shared_types():
+    schema = """
+        module M
+
+        Entry(K, V) = Record {
+            key: K
+            value: V
+        }
+
+        T1 = Record {
+            a: Optional(Integer)
+            b: Entry(String, Optional(Integer))
+        }
+
+        T2 = Record {
+            a: Optional(Integer)
+            b: Entry(String, Optional(Integer))
+        }
+
+        T3 = Array(Entry(String, Optional(Integer)))
+        T4 = Entry(String, Optional(String))
+        T5 = Choice { none: None, value: Integer }
+        T6 = Record { x: Record { y: Integer } }
+        T7 = Array(Record { y: Integer })
+    """
+    modules = [sbs.parser.parse(schema)]
+    refs = sbs.evaluator.evaluate_modules(modules)
+
+    t1 = refs[sbs.Ref('M', 'T1')]
+    t2 = refs[sbs.Ref('M', 'T2')]
+    t3 = refs[sbs.Ref('M', 'T3')]
+    t4 = refs[sbs.Ref('M', 'T4')]
+    t5 = refs[sbs.Ref('M', 'T5')]
+
+    assert t1 is not t2
+    assert t1 == t2
+    assert t1.entries[1][1] is t2.entries[1][1]
+    assert t1.entries[0][1] is t1.entries[1][1].entries[1][1]
+    assert t1.entries[0][1] is t5
+    assert t1.entries[1][1] is t3.t
+    assert t4 is not t3.t
+    assert t4.entries[0][1] == t3.t.entries[0][1]
+    assert refs[sbs.Ref('M', 'T6')].entries[0][1] is \
+        refs[sbs.Ref('M', 'T7')].t
+
+    cache = {}
+    refs1 = sbs.evaluator.evaluate_refs({'M': modules[0]},
+                                        [sbs.Ref('M', 'T1')], cache=cache)
+    refs2 = sbs.evaluator.evaluate_refs({'M': modules[0]},
+                                        [sbs.Ref('M', 'T3')], cache=cache)
+    assert refs1[sbs.Ref('M', 'T1')].entries[1][1] is \
+        refs2[sbs.Ref('M', 'T3')].t
+
+    repo = sbs.Repository(schema)
+    assert repo.record_class('M.T1') is not repo.record_class('M.T2')
+    assert repo.record_class('M.T1').__name__ == 'T1'
+    assert repo.record_class('M.T2').__name__ == 'T2'
+    assert type(repo.decode('M.T6', repo.encode('M.T6', {'x': {'y': 1}}),
+                            record_tuples=True).x) is \
+        type(repo.decode('M.T7', repo.encode('M.T7', [{'y': 1}]),
+                         record_tuples=True)[0])
+    assert repo.decode('M.T2', repo.encode('M.T1', {
+        'a': ('value', 1),
+        'b': {'key': 'x', 'value': ('none', None)}})) == {
+        'a': ('value', 1),
+        'b': {'key': 'x', 'value': ('none', None)}}
+
+
+def test_serializer_abstract_methods():
+    assert sbs.Serializer.__abstractmethods__ == {'encode',
+                                                  'decode',
+                                                  'encode_columns',
+                                                  'decode_columns',
+                                                  'skip',
+                                                  'compile_projection',
+                                                  'decode_projection'}
+
+
 def test_invalid_repository_initialization_argument_type():
     with pytest.raises(Exception):
         sbs.Repository(None)
 
 
 @pytest.mark.parametrize("value", [
-    0, 0xFFFF_FFFF, 0x7FFF_FFFF_FFFF_FFFF, 0xFFFF_FFFF_FFFF_FFFF_FFFF
+    0, 0xFFFF_FFFF, 0x7FFF_FFFF_FFFF_FFFF, 0xFFFF_FFFF_FFFF_FFFF_FFFF,
+    (1 << 62) - 1, 1 << 62, -(1 << 62), -(1 << 62) - 1,
+    1 << 63, -(1 << 63), -(1 << 63) - 1, 1 << 64, -(1 << 64),
+    (1 << 127) - 1, -(1 << 127), 0x1234_5678_9ABC_DEF0_1234_5678_9ABC_DEF0,
+    -(3 ** 500), 1 << 1000
+])
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+def test_large_integer(value, encode_serializer, decode_serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Array(Integer)
+        }
+    """)
+    value = {'a': value, 'b': [value, 1, value]}
+
+    encoded_value = repo.encode('M.T', value, serializer=encode_serializer)
+    decoded_value = repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer)
+    assert value == decoded_value
+
+    other_serializer = (sbs.PySerializer
+                        if encode_serializer is sbs.CSerializer
+                        else sbs.CSerializer)
+    assert encoded_value == repo.encode('M.T', value,
+                                        serializer=other_serializer)
+
+
+@pytest.mark.parametrize("value", [
+    0, 1, -1, (1 << 62) - 1, 1 << 62, -(1 << 62), -(1 << 62) - 1,
+    (1 << 63) - 1, -(1 << 63)
+])
+def test_c_integer(value):
+    c_lib = _get_c_lib()
+
+    data = (ctypes.c_uint8 * 16)()
+    buff = _CBuff(data, len(data), 0)
+    assert c_lib.hat_sbs_encode_integer(ctypes.byref(buff), value) == 0
+    assert bytes(data[:buff.pos]) == sbs.Repository().encode(
+        'Integer', value, serializer=sbs.PySerializer)
+
+    size = buff.pos
+    buff.pos = 0
+    result = ctypes.c_int64()
+    assert c_lib.hat_sbs_decode_integer(ctypes.byref(buff),
+                                        ctypes.byref(result)) == 0
+    assert result.value == value
+    assert buff.pos == size
+
+
+@pytest.mark.parametrize("value", [
+    1 << 63, -(1 << 63) - 1, 1 << 64, -(1 << 69), (1 << 69) - 1, 1 << 100
 ])
+def test_c_integer_overflow(value):
+    c_lib = _get_c_lib()
+
+    data = sbs.Repository().encode('Integer', value,
+                                   serializer=sbs.PySerializer)
+    buff = _CBuff((ctypes.c_uint8 * len(data)).from_buffer_copy(data),
+                  len(data), 0)
+    result = ctypes.c_int64()
+    assert c_lib.hat_sbs_decode_integer(ctypes.byref(buff),
+                                        ctypes.byref(result)) != 0
+    assert buff.pos == 0
+
+
+class _CBuff(ctypes.Structure):
+    _fields_ = [('data', ctypes.POINTER(ctypes.c_uint8)),
+                ('size', ctypes.c_size_t),
+                ('pos', ctypes.c_size_t)]
+
+
+def _get_c_lib():
+    from hat.sbs.serializer import cserializer
+
+    if not cserializer._cserializer:
+        pytest.skip('C implementation not available')
+
+    # hat_sbs library is linked into C serializer module
+    c_lib = ctypes.CDLL(cserializer._cserializer.__file__)
+    c_lib.hat_sbs_encode_integer.argtypes = [ctypes.POINTER(_CBuff),
+                                             ctypes.c_int64]
+    c_lib.hat_sbs_encode_integer.restype = ctypes.c_size_t
+    c_lib.hat_sbs_decode_integer.argtypes = [ctypes.POINTER(_CBuff),
+                                             ctypes.POINTER(ctypes.c_int64)]
+    c_lib.hat_sbs_decode_integer.restype = ctypes.c_int
+    return c_lib
+
+
 @pytest.mark.parametrize("serializer", serializers)
-def test_large_integer(value, serializer):
-    repo = sbs.Repository()
+def test_recursive_type(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        Tree = Record {
+            value: Integer
+            children: Array(Tree)
+        }
+
+        T = Tree
+    """)
+    value = {'value': 1,
+             'children': [{'value': 2,
+                           'children': []},
+                          {'value': 3,
+                           'children': [{'value': 4,
+                                         'children': []}]}]}
+
+    encoded_value = repo.encode('M.T', value, serializer=serializer)
+    decoded_value = repo.decode('M.T', encoded_value, serializer=serializer)
+    assert value == decoded_value
+
+
+@pytest.mark.parametrize("size", [1, 7, 8, 100, 1000])
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+def test_large_choice(encode_serializer, decode_serializer, size):
+    entries = '\n'.join(f'e{i}: Integer' for i in range(size))
+    repo = sbs.Repository(f"""
+        module M
+
+        T = Array(Choice {{
+            {entries}
+        }})
+    """)
+    value = [(f'e{i}', i) for i in range(size)]
+
+    encoded_value = repo.encode('M.T', value, serializer=encode_serializer)
+    decoded_value = repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer)
+    assert value == decoded_value
+
+    with pytest.raises(Exception):
+        repo.encode('M.T', [(f'e{size}', 0)], serializer=encode_serializer)
+
+    if encode_serializer is sbs.CSerializer:
+        for invalid_value in [[(f'e{size}', 0)], [(1, 0)], [(None, 0)]]:
+            with pytest.raises(ValueError, match='invalid entry name'):
+                repo.encode('M.T', invalid_value,
+                            serializer=encode_serializer)
+
+            with pytest.raises(ValueError, match='invalid entry name'):
+                repo.encoded_size('M.T', invalid_value,
+                                  serializer=encode_serializer)
+
+
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+def test_record_tuples(encode_serializer, decode_serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Array(Record {
+                c: String
+                d: Boolean
+            })
+            e: Choice {
+                f: R
+                g: None
+            }
+        }
+
+        R = Record {
+            h: Float
+        }
+    """)
+    value = {'a': 1,
+             'b': [{'c': 'x', 'd': True}],
+             'e': ('f', {'h': 1.5})}
+
+    encoded_value = repo.encode('M.T', value, serializer=encode_serializer)
+    decoded_value = repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer,
+                                record_tuples=True)
+
+    T = repo.record_class('M.T')
+    R = repo.record_class('M.R')
+    assert type(decoded_value) is T
+    assert decoded_value.a == 1
+    assert type(decoded_value.b[0]).__name__ == 'Record'
+    assert decoded_value.b[0].c == 'x'
+    assert decoded_value.b[0].d is True
+    assert decoded_value.e == ('f', R(h=1.5))
+    assert type(decoded_value.e[1]) is R
+
+    assert encoded_value == repo.encode('M.T', decoded_value,
+                                        serializer=encode_serializer)
+    assert value == repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer)
+    assert [decoded_value] == repo.decode_many('M.T', [encoded_value],
+                                               serializer=decode_serializer,
+                                               record_tuples=True)
+
+    with pytest.raises(ValueError):
+        repo.encode('M.R', (1.5, 2), serializer=encode_serializer)
+
+    with pytest.raises(ValueError):
+        repo.record_class('M.T.a')
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_record_tuples_gc(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Array(Integer)
+            c: Record {
+                d: String
+                e: Bytes
+            }
+        }
+    """)
+    encoded_value = repo.encode('M.T', {'a': 1,
+                                        'b': [],
+                                        'c': {'d': 'x', 'e': b'y'}})
+    decoded_value = repo.decode('M.T', encoded_value, serializer=serializer,
+                                record_tuples=True)
+
+    if serializer is sbs.CSerializer:
+        assert not gc.is_tracked(decoded_value.c)
+
+    value = [decoded_value]
+    decoded_value.b.append(value)
+    assert gc.is_tracked(decoded_value)
+    del value, decoded_value
+    assert gc.collect() > 0
+
+
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+def test_typed_arrays(encode_serializer, decode_serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Array(Boolean)
+            b: Array(Integer)
+            c: Array(Float)
+            d: Array(String)
+        }
+    """)
+    value = {'a': [True, False, True],
+             'b': [0, -1, 0x3F, -0x41, 2**62, 2**63 - 1, -2**63],
+             'c': [1.5, -0.25, 1e300],
+             'd': ['x']}
+
+    encoded_value = repo.encode('M.T', value, serializer=encode_serializer)
+    assert encoded_value == repo.encode(
+        'M.T', {'a': array.array('B', [1, 0, 1]),
+                'b': array.array('q', value['b']),
+                'c': array.array('d', value['c']),
+                'd': ['x']},
+        serializer=encode_serializer)
+    assert encoded_value == repo.encode(
+        'M.T', {'a': memoryview(bytes([2, 0, 0xFF])).cast('?'),
+                'b': memoryview(array.array('q', value['b'])),
+                'c': array.array('d', value['c']),
+                'd': ['x']},
+        serializer=encode_serializer)
+
+    decoded_value = repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer,
+                                typed_arrays=True)
+    assert decoded_value['a'] == array.array('B', [1, 0, 1])
+    assert decoded_value['b'] == array.array('q', value['b'])
+    assert decoded_value['c'] == array.array('d', value['c'])
+    assert decoded_value['d'] == ['x']
+
+    assert value == repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer)
+    assert [decoded_value] == repo.decode_many('M.T', [encoded_value],
+                                               serializer=decode_serializer,
+                                               typed_arrays=True)
+
+    float_value = array.array('f', [1.5, -0.25])
+    assert repo.encode('M.T', {**value, 'c': float_value},
+                       serializer=encode_serializer) == repo.encode(
+        'M.T', {**value, 'c': list(float_value)},
+        serializer=encode_serializer)
 
-    if serializer is sbs.CSerializer and value > 0x7FFF_FFFF_FFFF_FFFF:
-        with pytest.raises(OverflowError):
-            repo.encode('Integer', value, serializer=serializer)
+    with pytest.raises(ValueError):
+        repo.decode('M.T', encoded_value[:-4],
+                    serializer=decode_serializer, typed_arrays=True)
 
-    else:
-        encoded_value = repo.encode('Integer', value,
-                                    serializer=serializer)
-        decoded_value = repo.decode('Integer', encoded_value,
-                                    serializer=serializer)
+    with pytest.raises(OverflowError):
+        encoded_value = repo.encode('M.T', {**value, 'b': [2**64]},
+                                    serializer=encode_serializer)
+        repo.decode('M.T', encoded_value, serializer=decode_serializer,
+                    typed_arrays=True)
+
+    with pytest.raises(ValueError):
+        repo.decode('M.T', encoded_value, serializer=decode_serializer,
+                    fields=['a'], typed_arrays=True)
+
+
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+def test_columns(encode_serializer, decode_serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Array(R)
+
+        R = Record {
+            timestamp: Float
+            value: Integer
+            valid: Boolean
+            name: String
+            data: Optional(Bytes)
+        }
+    """)
+    value = [{'timestamp': 1.5 * i,
+              'value': (-1) ** i * 2 ** (i * 8),
+              'valid': bool(i % 2),
+              'name': f'x{i}',
+              'data': ('value', b'y' * i) if i % 2 else ('none', None)}
+             for i in range(8)]
+    columns = {'timestamp': [i['timestamp'] for i in value],
+               'value': [i['value'] for i in value],
+               'valid': [i['valid'] for i in value],
+               'name': [i['name'] for i in value],
+               'data': [i['data'] for i in value]}
+
+    encoded_value = repo.encode('M.T', value, serializer=encode_serializer)
+    assert encoded_value == repo.encode_columns(
+        'M.T', columns, serializer=encode_serializer)
+    assert encoded_value == repo.encode_columns(
+        'M.T', {**columns,
+                'timestamp': array.array('d', columns['timestamp']),
+                'value': array.array('q', columns['value']),
+                'valid': array.array('B', columns['valid'])},
+        serializer=encode_serializer)
+
+    decoded_columns = repo.decode_columns('M.T', encoded_value,
+                                          serializer=decode_serializer)
+    assert list(decoded_columns) == list(columns)
+    assert decoded_columns['timestamp'] == array.array(
+        'd', columns['timestamp'])
+    assert decoded_columns['value'] == array.array('q', columns['value'])
+    assert decoded_columns['valid'] == array.array('B', columns['valid'])
+    assert decoded_columns['name'] == columns['name']
+    assert decoded_columns['data'] == columns['data']
+
+    encoded_value = repo.encode_columns(
+        'M.T', {key: [] for key in columns}, serializer=encode_serializer)
+    assert repo.decode('M.T', encoded_value,
+                       serializer=decode_serializer) == []
+    assert all(len(column) == 0
+               for column in repo.decode_columns(
+                   'M.T', encoded_value,
+                   serializer=decode_serializer).values())
+
+    with pytest.raises(ValueError):
+        repo.encode_columns('M.T', {**columns, 'name': ['x']},
+                            serializer=encode_serializer)
+
+    with pytest.raises(ValueError):
+        repo.encode_columns('M.R', columns, serializer=encode_serializer)
+
+    with pytest.raises(ValueError):
+        repo.decode_columns('M.R', encoded_value,
+                            serializer=decode_serializer)
+
+    with pytest.raises(ValueError):
+        repo.decode_columns('M.T', b'\x8a', serializer=decode_serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_serializer_with_type(serializer):
+    t = sbs.common.ArrayType(
+        sbs.common.RecordType([('a', sbs.common.IntegerType()),
+                               ('b', sbs.common.Ref('M', 'T'))]))
+    refs = {sbs.common.Ref('M', 'T'): sbs.common.StringType()}
+    value = [{'a': 1, 'b': 'x'}, {'a': 2, 'b': 'y'}]
+
+    for compiled_refs in [refs, serializer.compile(refs)]:
+        encoded_value = serializer.encode(compiled_refs, t, value)
+        decoded_value = serializer.decode(compiled_refs, t, encoded_value)
         assert value == decoded_value
+
+
+@pytest.mark.parametrize("size", [0, 1, 255, 256, 257, 0x10000])
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+def test_large_value(encode_serializer, decode_serializer, size):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Bytes
+            b: String
+            c: Array(Integer)
+        }
+    """)
+    value = {'a': b'x' * size,
+             'b': 'y' * size,
+             'c': list(range(size // 16))}
+
+    encoded_value = repo.encode('M.T', value, serializer=encode_serializer)
+    decoded_value = repo.decode('M.T', encoded_value,
+                                serializer=decode_serializer)
+    assert value == decoded_value
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("offset", [0, 1, 10])
+@pytest.mark.parametrize("buffer_type", ['bytearray', 'memoryview', 'mmap'])
+def test_encode_into(serializer, offset, buffer_type):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: String
+            c: Array(Bytes)
+        }
+    """)
+    value = {'a': 123, 'b': 'abc', 'c': [b'x', b'yz']}
+    encoded_value = repo.encode('M.T', value, serializer=serializer)
+
+    if buffer_type == 'bytearray':
+        buffer = bytearray(100)
+
+    elif buffer_type == 'memoryview':
+        buffer = memoryview(bytearray(100))
+
+    elif buffer_type == 'mmap':
+        buffer = mmap.mmap(-1, 100)
+
+    result = repo.encode_into('M.T', value, buffer, offset,
+                              serializer=serializer)
+    assert result == len(encoded_value)
+    assert bytes(buffer[offset:offset+result]) == encoded_value
+    assert bytes(buffer[:offset]) == bytes(offset)
+
+    decoded_value = repo.decode('M.T', buffer[offset:offset+result],
+                                serializer=serializer)
+    assert decoded_value == value
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_encode_into_insufficient_buffer(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Array(String)
+    """)
+    value = ['abc'] * 10
+    encoded_value = repo.encode('M.T', value, serializer=serializer)
+
+    buffer = bytearray(len(encoded_value) + 5)
+
+    with pytest.raises(ValueError, match=f'required {len(encoded_value)}'):
+        repo.encode_into('M.T', value, buffer, 6, serializer=serializer)
+
+    result = repo.encode_into('M.T', value, buffer, 5, serializer=serializer)
+    assert result == len(encoded_value)
+
+    with pytest.raises(ValueError):
+        repo.encode_into('M.T', value, buffer, len(buffer) + 1,
+                         serializer=serializer)
+
+    with pytest.raises(Exception):
+        repo.encode_into('M.T', value, bytes(100), serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_zero_copy_decode(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Bytes
+            b: Array(Bytes)
+            c: String
+        }
+    """)
+    value = {'a': b'abc', 'b': [b'', b'x' * 1000], 'c': 'abc'}
+    data = bytearray(repo.encode('M.T', value, serializer=serializer))
+
+    decoded_value = repo.decode('M.T', data, serializer=serializer)
+    assert decoded_value == value
+    assert isinstance(decoded_value['a'], bytes)
+    assert all(isinstance(i, bytes) for i in decoded_value['b'])
+
+    decoded_value = repo.decode('M.T', data, serializer=serializer,
+                                zero_copy=True)
+    assert decoded_value == value
+    assert isinstance(decoded_value['a'], memoryview)
+    assert decoded_value['a'].readonly
+    assert all(isinstance(i, memoryview) for i in decoded_value['b'])
+    assert isinstance(decoded_value['c'], str)
+
+    data[data.index(b'abc')] = ord('z')
+    assert decoded_value['a'] == b'zbc'
+
+    with pytest.raises(BufferError):
+        data.clear()
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_lazy_decode(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        Item = Record {
+            id: Integer
+            flag: Boolean
+            value: Optional(Float)
+            data: Bytes
+        }
+
+        T = Record {
+            a: Integer
+            b: Array(Item)
+            c: Array(Integer)
+            d: Choice {
+                x: None
+                y: Record {
+                    z: String
+                }
+            }
+            e: None
+        }
+    """)
+    value = {'a': 123,
+             'b': [{'id': i,
+                    'flag': bool(i % 2),
+                    'value': ('value', i / 2) if i % 3 else ('none', None),
+                    'data': b'x' * i}
+                   for i in range(100)],
+             'c': [1, 2, 3, 1 << 40],
+             'd': ('y', {'z': 'abc'}),
+             'e': None}
+    data = repo.encode('M.T', value, serializer=serializer)
+
+    lazy_value = repo.decode_lazy('M.T', data, serializer=serializer)
+    assert isinstance(lazy_value, sbs.LazyRecord)
+    assert isinstance(lazy_value['b'], sbs.LazyArray)
+    assert isinstance(lazy_value['b'][0], sbs.LazyRecord)
+    assert isinstance(lazy_value['d'][1], sbs.LazyRecord)
+
+    assert lazy_value['b'][50] == value['b'][50]
+    assert lazy_value['b'][10] == value['b'][10]
+    assert lazy_value['b'][-1] == value['b'][-1]
+    assert lazy_value['b'][20:30] == value['b'][20:30]
+    assert lazy_value['b'][::-7] == value['b'][::-7]
+    assert lazy_value['c'] == value['c']
+    assert len(lazy_value['b']) == len(value['b'])
+    assert list(lazy_value) == list(value)
+    assert lazy_value == value
+
+    with pytest.raises(IndexError):
+        lazy_value['b'][100]
+
+    with pytest.raises(KeyError):
+        lazy_value['f']
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_skip(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Choice {
+            a: Integer
+            b: Array(String)
+        }
+    """)
+    values = [('a', 1), ('b', ['abc', '']), ('a', -1000), ('b', [])]
+    data = b''.join(repo.encode('M.T', i, serializer=serializer)
+                    for i in values)
+    refs = repo._get_compiled_refs(serializer)
+    t = sbs.Ref('M', 'T')
+
+    offset = 0
+    for value in values:
+        size = serializer.skip(refs, t, data[offset:])
+        assert size == len(repo.encode('M.T', value, serializer=serializer))
+        offset += size
+
+    assert offset == len(data)
+    assert serializer.skip(refs, t, data, len(values)) == len(data)
+    assert serializer.skip(refs, t, data, 0) == 0
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_projection(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        Id = Record {
+            server: Integer
+            instance: Integer
+        }
+
+        Payload = Choice {
+            binary: Record {
+                type: String
+                data: Bytes
+            }
+            json: String
+        }
+
+        T = Record {
+            id: Id
+            tags: Array(Record {
+                key: String
+                value: Float
+            })
+            payload: Payload
+        }
+    """)
+    value = {'id': {'server': 1, 'instance': 2},
+             'tags': [{'key': 'a', 'value': 1.5},
+                      {'key': 'b', 'value': 2.5}],
+             'payload': ('binary', {'type': 'x', 'data': b'abc'})}
+    data = repo.encode('M.T', value, serializer=serializer)
+
+    result = repo.decode('M.T', data, serializer=serializer,
+                         fields=['id.instance', 'payload.binary.data'])
+    assert result == {'id': {'instance': 2},
+                      'payload': ('binary', {'data': b'abc'})}
+
+    result = repo.decode('M.T', data, serializer=serializer,
+                         fields=['tags.key', 'id', 'id.server'])
+    assert result == {'id': {'server': 1, 'instance': 2},
+                      'tags': [{'key': 'a'}, {'key': 'b'}]}
+
+    result = repo.decode('M.T', data, serializer=serializer,
+                         fields=['payload.json'])
+    assert result == {'payload': ('binary', None)}
+
+    projection = repo.projection('M.T', ['payload'], serializer=serializer)
+    assert isinstance(projection, sbs.Projection)
+    result = projection.decode(data, zero_copy=True)
+    assert result == {'payload': value['payload']}
+    assert isinstance(result['payload'][1]['data'], memoryview)
+
+    for fields in [['abc'], ['id.abc'], ['id.server.abc'], ['id..server']]:
+        with pytest.raises(ValueError):
+            repo.projection('M.T', fields, serializer=serializer)
+
+
+@pytest.mark.parametrize("encode_serializer", serializers)
+@pytest.mark.parametrize("decode_serializer", serializers)
+@pytest.mark.parametrize("count", [0, 1, 10])
+def test_encode_decode_many(encode_serializer, decode_serializer, count):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Bytes
+        }
+    """)
+    values = [{'a': i, 'b': b'x' * i} for i in range(count)]
+    encoded = [repo.encode('M.T', value) for value in values]
+
+    result = repo.encode_many('M.T', values, serializer=encode_serializer)
+    assert result == encoded
+
+    data, offsets = repo.encode_many('M.T', iter(values),
+                                     serializer=encode_serializer,
+                                     contiguous=True)
+    assert data == b''.join(encoded)
+    assert len(offsets) == count + 1
+    assert offsets[0] == 0
+    assert offsets[-1] == len(data)
+    assert all(data[start:stop] == i
+               for start, stop, i in zip(offsets, offsets[1:], encoded))
+
+    result = repo.decode_many('M.T', encoded, serializer=decode_serializer)
+    assert result == values
+
+    result = repo.decode_many('M.T', data, offsets,
+                              serializer=decode_serializer)
+    assert result == values
+
+    result = repo.decode_many('M.T', bytearray(data), offsets,
+                              serializer=decode_serializer, zero_copy=True)
+    assert result == values
+    assert all(isinstance(i['b'], memoryview) for i in result)
+
+    result = repo.decode_many('M.T', encoded, serializer=decode_serializer,
+                              zero_copy=True)
+    assert result == values
+    assert all(isinstance(i['b'], memoryview) for i in result)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("offsets", [[-1, 2], [0, 100], [2, 1], [0, 2, 1]])
+def test_decode_many_invalid_offsets(serializer, offsets):
+    repo = sbs.Repository()
+    data = repo.encode('Integer', 1) + repo.encode('Integer', 2)
+
+    with pytest.raises(ValueError):
+        repo.decode_many('Integer', data, offsets, serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_codec(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Bytes
+            c: Array(Float)
+        }
+
+        U = T
+    """)
+    values = [{'a': i, 'b': b'x' * i, 'c': [0.5] * i} for i in range(5)]
+    encoded = [repo.encode('M.T', value) for value in values]
+
+    codec = repo.codec('M.U', serializer=serializer)
+    assert isinstance(codec, sbs.Codec)
+
+    assert [codec.encode(value) for value in values] == encoded
+    assert [codec.decode(i) for i in encoded] == values
+    assert codec.encode_many(values) == encoded
+    assert codec.decode_many(encoded) == values
+
+    data, offsets = codec.encode_many(values, contiguous=True)
+    assert data == b''.join(encoded)
+    assert codec.decode_many(data, offsets) == values
+
+    result = codec.decode(bytearray(encoded[1]), zero_copy=True)
+    assert result == values[1]
+    assert isinstance(result['b'], memoryview)
+
+    result = codec.decode_many(encoded, zero_copy=True)
+    assert result == values
+    assert all(isinstance(i['b'], memoryview) for i in result)
+
+    result = codec.decode_many(bytearray(data), offsets, zero_copy=True)
+    assert result == values
+    assert all(isinstance(i['b'], memoryview) for i in result)
+
+    buffer = bytearray(len(encoded[2]) + 1)
+    assert codec.encode_into(values[2], buffer, 1) == len(encoded[2])
+    assert buffer[1:] == encoded[2]
+
+    with pytest.raises(ValueError):
+        codec.encode_into(values[2], buffer, 2)
+
+    with pytest.raises(Exception):
+        codec.encode({'a': 1})
+
+    with pytest.raises(Exception):
+        codec.decode(encoded[2][:-1])
+
+    codec = repo.codec('M.T', serializer=serializer, record_tuples=True,
+                       typed_arrays=True)
+    result = codec.decode(encoded[2])
+    assert type(result) is repo.record_class('M.T')
+    assert isinstance(result.c, array.array)
+    assert codec.encode(result) == encoded[2]
+
+    with pytest.raises(Exception):
+        repo.codec('M.Missing', serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_encoded_size(serializer):
+    repo = sbs.Repository("""
+        module M
+
+        Point = Record {
+            x: Float
+            y: Float
+            valid: Boolean
+        }
+
+        T = Record {
+            a: Integer
+            b: String
+            c: Bytes
+            d: Array(Point)
+            e: Array(Integer)
+            f: Choice {
+                x: None
+                y: Optional(Integer)
+            }
+            g: Array(Float)
+            h: Point
+        }
+    """)
+    point = {'x': 1.5, 'y': -2.0, 'valid': True}
+    values = [{'a': a,
+               'b': 'xš' * i,
+               'c': b'x' * 200 * i,
+               'd': [point] * i,
+               'e': e,
+               'f': f,
+               'g': g,
+               'h': point}
+              for i, a, e, f, g in [
+                  (0, 0, [], ('x', None), []),
+                  (1, -1, [1, 1 << 70, -(1 << 70)], ('y', ('none', None)),
+                   array.array('d', [1.0, 2.0])),
+                  (3, 1 << 100, array.array('q', [-1, 1 << 40, 0]),
+                   ('y', ('value', 1 << 63)), [0.5] * 100),
+                  (200, -(1 << 63), array.array('Q', [(1 << 64) - 1, 1]),
+                   ('y', ('value', 123)), array.array('f', [1.0]))]]
+
+    for value in values:
+        size = repo.encoded_size('M.T', value, serializer=serializer)
+        assert size == len(repo.encode('M.T', value, serializer=serializer))
+
+    sizes = repo.encoded_sizes('M.T', iter(values), serializer=serializer)
+    assert sizes == [len(i) for i in repo.encode_many('M.T', values)]
+
+    assert repo.encoded_size('M.Point', point, serializer=serializer) == 17
+    assert repo.encoded_sizes('M.Point', [point] * 3,
+                              serializer=serializer) == [17] * 3
+    assert repo.encoded_sizes('M.T', [], serializer=serializer) == []
+
+    with pytest.raises(Exception):
+        repo.encoded_size('M.T', {**values[0], 'a': 'x'},
+                          serializer=serializer)
+
+    with pytest.raises(Exception):
+        repo.encoded_size('M.T', {**values[0], 'f': ('z', None)},
+                          serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("min_ref_size", [0, 1, 10, 1000])
+def test_encode_iov(serializer, min_ref_size):
+    repo = sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Bytes
+            b: Array(Bytes)
+            c: String
+            d: Optional(Bytes)
+            e: Bytes
+        }
+    """)
+    payload = b'x' * 100
+    value = {'a': payload,
+             'b': [b'', b'y' * 10, payload],
+             'c': 'z' * 100,
+             'd': ('value', b'abc'),
+             'e': payload}
+    encoded = repo.encode('M.T', value)
+
+    segments = repo.encode_iov('M.T', value, serializer=serializer,
+                               min_ref_size=min_ref_size)
+    assert b''.join(segments) == encoded
+    assert all(segments)
+
+    if serializer is sbs.CSerializer:
+        refs = [i for i in segments if i is payload]
+        assert len(refs) == (3 if min_ref_size <= 100 else 0)
+
+    assert b''.join(repo.encode_iov('Bytes', b'', serializer=serializer,
+                                    min_ref_size=min_ref_size)) == \
+        repo.encode('Bytes', b'')
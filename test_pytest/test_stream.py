@@ -0,0 +1,118 @@
+import pytest
+
+from hat import sbs
+import hat.sbs.stream
+
+
+serializers = [sbs.CSerializer,
+               sbs.PySerializer]
+
+
+@pytest.fixture(params=['c', 'py'])
+def scan_impl(request, monkeypatch):
+    if request.param == 'py':
+        monkeypatch.setattr(hat.sbs.stream, '_cserializer', None)
+
+    elif not hat.sbs.stream._cserializer:
+        pytest.skip('implementation not available')
+
+
+@pytest.fixture
+def repo():
+    return sbs.Repository("""
+        module M
+
+        T = Record {
+            a: Integer
+            b: Bytes
+        }
+    """)
+
+
+@pytest.mark.parametrize("size", [0, 1, 63, 64, 127, 128, 0x2000, 0x10000])
+def test_frame_encode(size):
+    data = b'x' * size
+    frame = sbs.frame_encode(data)
+
+    repo = sbs.Repository()
+    decoded = repo.decode(sbs.Ref(None, 'Bytes'), frame)
+    assert decoded == data
+    assert frame == repo.encode(sbs.Ref(None, 'Bytes'), data)
+    assert frame == sbs.frame_encode_header(size) + data
+
+
+@pytest.mark.parametrize("size", [-1, -64, -0x10000])
+def test_frame_encode_header_invalid_size(size):
+    with pytest.raises(ValueError):
+        sbs.frame_encode_header(size)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+@pytest.mark.parametrize("chunk_size", [1, 3, 100, 100000])
+def test_stream_decoder(scan_impl, repo, serializer, chunk_size):
+    values = [{'a': i, 'b': b'x' * i * 10} for i in range(50)]
+    data = b''.join(sbs.frame_encode(repo.encode('M.T', value))
+                    for value in values)
+
+    decoder = sbs.StreamDecoder(repo, 'M.T', serializer=serializer)
+    result = []
+    for i in range(0, len(data), chunk_size):
+        result.extend(decoder.feed(data[i:i+chunk_size]))
+
+    assert result == values
+    assert decoder.pending == 0
+
+    assert decoder.feed(data[:-1]) == values[:-1]
+    assert decoder.pending > 0
+    assert decoder.feed(data[-1:]) == values[-1:]
+    assert decoder.pending == 0
+
+
+def test_stream_decoder_max_size(scan_impl, repo):
+    data = sbs.frame_encode(repo.encode('M.T', {'a': 1, 'b': b'x' * 100}))
+
+    decoder = sbs.StreamDecoder(repo, 'M.T', max_size=100)
+    with pytest.raises(ValueError):
+        decoder.feed(data[:3])
+
+
+@pytest.mark.parametrize("data", [b'\x00' * 9, b'\xff'])
+def test_stream_decoder_invalid_header(scan_impl, repo, data):
+    decoder = sbs.StreamDecoder(repo, 'M.T')
+    with pytest.raises(ValueError):
+        decoder.feed(data)
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_stream_decoder_invalid_message(scan_impl, repo, serializer):
+    valid_frame = sbs.frame_encode(repo.encode('M.T', {'a': 1, 'b': b''}))
+    invalid_frame = sbs.frame_encode(b'\x81')
+
+    decoder = sbs.StreamDecoder(repo, 'M.T', serializer=serializer)
+    with pytest.raises(Exception):
+        decoder.feed(valid_frame + invalid_frame + valid_frame[:1])
+
+    assert decoder.pending == 1
+    assert decoder.feed(valid_frame[1:]) == [{'a': 1, 'b': b''}]
+
+
+@pytest.mark.parametrize("serializer", serializers)
+def test_stream_decoder_messages_before_invalid(scan_impl, repo, serializer):
+    values = [{'a': 1, 'b': b'x'}, {'a': 2, 'b': b'y'}, {'a': 3, 'b': b'z'}]
+    frames = [sbs.frame_encode(repo.encode('M.T', value)) for value in values]
+    invalid_frame = sbs.frame_encode(b'\x81')
+
+    decoder = sbs.StreamDecoder(repo, 'M.T', serializer=serializer)
+    with pytest.raises(sbs.StreamDecodeError) as e:
+        decoder.feed(frames[0] + frames[1] + invalid_frame)
+
+    assert e.value.messages == values[:2]
+    assert e.value.__cause__ is not None
+    assert decoder.pending == 0
+
+    with pytest.raises(sbs.StreamDecodeError) as e:
+        decoder.feed(frames[0] + invalid_frame + frames[2])
+
+    assert e.value.messages == values[:1]
+    assert decoder.feed(b'') == values[2:]
+    assert decoder.pending == 0